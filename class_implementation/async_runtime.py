@@ -0,0 +1,216 @@
+import asyncio
+import math
+import random
+from server_implementation.reply_cache import NEW
+
+
+class ConstantLatency:
+    def __init__(self, delay):
+        """ Every link takes ``delay`` seconds. """
+        self.delay = delay
+
+    def sample(self, sender, receiver, rng):
+        return self.delay
+
+
+class LognormalLatency:
+    def __init__(self, median, sigma=0.5):
+        """
+        Heavy-tailed link delay, as measured on real WANs.
+
+        :param median: Median delay in seconds.
+        :param sigma: Standard deviation of the underlying normal; larger means a longer tail.
+        """
+        self.mu = math.log(median)
+        self.sigma = sigma
+
+    def sample(self, sender, receiver, rng):
+        return rng.lognormvariate(self.mu, self.sigma)
+
+
+class ShardMatrixLatency:
+    def __init__(self, intra_shard, inter_shard):
+        """
+        Different delay models for links inside a shard and links between shards.
+
+        :param intra_shard: Latency model used when both ends are in the same shard.
+        :param inter_shard: Latency model used otherwise (e.g. clients talking to another shard's primary).
+        """
+        self.intra_shard = intra_shard
+        self.inter_shard = inter_shard
+
+    def sample(self, sender, receiver, rng):
+        same_shard = sender is not None and sender.shard is receiver.shard
+        model = self.intra_shard if same_shard else self.inter_shard
+        return model.sample(sender, receiver, rng)
+
+
+class AsyncNetworkRuntime:
+    def __init__(self, network, latency, bandwidth=None, loss=0.0, seed=42, tick=0.01):
+        """
+        Runs every validator of a network as an asyncio coroutine with its own inbox.
+
+        While attached, ``Shard.broadcast`` hands messages here instead of calling the
+        handlers directly; each copy reaches its receiver's inbox after a delay drawn
+        from the latency model plus its transmission time, or is dropped.
+
+        :param network: Network whose shards to drive.
+        :param latency: Model with ``sample(sender, receiver, rng)`` returning seconds.
+        :param bandwidth: Link bandwidth in bytes per second (None for unlimited).
+        :param loss: Probability each message copy is dropped.
+        :param tick: How often, in seconds, the shards' simulated clocks are advanced so
+                     view-change timers fire in real time.
+        """
+        self.network = network
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.tick = tick
+
+        self.inboxes = {}
+        self.tasks = []
+        self.submitted = {}  # digest -> loop time the client sent it
+        self.latencies = []  # End-to-end seconds for every finalized request
+        self.tentative = {}  # digest -> seconds until the client accepted 2f+1 tentative replies
+        self.saved = []  # Seconds between tentative acceptance and finalization, per request
+        self.dropped = 0
+        self.loop = None
+
+    def node_by_id(self, shard, node_id):
+        for node in shard.validator_nodes:
+            if node.node_id == node_id:
+                return node
+        return None
+
+    def link_delay(self, sender, receiver, size):
+        delay = self.latency.sample(sender, receiver, self.rng)
+        if self.bandwidth:
+            delay += size / self.bandwidth
+        return delay
+
+    def transmit(self, shard, message, receivers, size):
+        """ Schedule delivery of one message to each receiver after its link delay. """
+        sender = self.node_by_id(shard, message.get("validator_id", message.get("primary_id")))
+
+        for receiver in receivers:
+            if self.loss and self.rng.random() < self.loss:
+                self.dropped += 1
+                continue
+            self.loop.call_later(self.link_delay(sender, receiver, size), self.inboxes[receiver].put_nowait, message)
+
+    def submit(self, client, data, receiver_id):
+        """
+        Send a client request: it is logged with the receiver's shard and reaches
+        that shard's primary after the client-to-primary link delay. A retransmission
+        is answered by the shard's reply cache and not sent again.
+
+        :return: The request's digest, or None for a stale retransmission.
+        """
+        shard = self.network.find_shard_of_node(receiver_id)
+
+        request = client.build_request(data, receiver_id)
+        client.pending_requests[client.timestamp] = request
+        log_entry = shard.make_log_entry(client.node_id, receiver_id, request)
+        status, digest = shard.add_log_request(log_entry)
+        if status != NEW:
+            return digest
+        self.submitted[digest] = self.loop.time()
+
+        primary = shard.current_primary_node
+        self.loop.call_later(self.link_delay(client, primary, 0), self.inboxes[primary].put_nowait, {"type": "REQUEST", "client_request": log_entry})
+        return digest
+
+    def on_tentative_accepted(self, digest):
+        submitted = self.submitted.get(digest)
+        if submitted is not None:
+            self.tentative[digest] = self.loop.time() - submitted
+
+    def on_finalized(self, shard, digest):
+        submitted = self.submitted.pop(digest, None)
+        if submitted is not None:
+            self.latencies.append(self.loop.time() - submitted)
+            if digest in self.tentative:
+                self.saved.append(self.latencies[-1] - self.tentative.pop(digest))
+
+    async def validator_loop(self, node):
+        inbox = self.inboxes[node]
+        authenticator = self.network.authenticator
+        while True:
+            # Take everything that has arrived together, so authenticators are checked as one batch
+            burst = [await inbox.get()]
+            while not inbox.empty() and burst[-1] is not None:
+                burst.append(inbox.get_nowait())
+            if burst[-1] is None:
+                return
+
+            protocol = [message for message in burst if message["type"] != "REQUEST"]
+            valid = {}
+            if authenticator is not None and protocol:
+                results = authenticator.verify_batch(node.node_id, protocol, [node.shard.message_sender(message) for message in protocol])
+                valid = {id(message): ok for message, ok in zip(protocol, results)}
+
+            for message in burst:
+                if message["type"] == "REQUEST":
+                    if node.isPrimary:
+                        node.handle_request(message["client_request"])
+                elif valid.get(id(message), authenticator is None):
+                    node.shard.deliver(node, message, verified=True)
+                else:
+                    node.shard.deliver(node, message)  # Counts the failure and drops it
+
+            # Replicas prepare as soon as a PRE-PREPARE arrives rather than in lock-step rounds
+            if node.pending_prepares and not node.is_faulty:
+                node.process_prepare()
+
+    async def clock_loop(self):
+        last = self.loop.time()
+        while True:
+            await asyncio.sleep(self.tick)
+            now = self.loop.time()
+            for shard in self.network.shards.values():
+                shard.advance_time(now - last)
+            last = now
+
+    async def start(self):
+        if self.network.cross_shard is not None:
+            raise ValueError("Two-phase commit orders its operations synchronously and cannot run under the async runtime")
+        self.loop = asyncio.get_running_loop()
+        for shard in self.network.shards.values():
+            shard.runtime = self
+            for node in shard.validator_nodes:
+                self.inboxes[node] = asyncio.Queue()
+                self.tasks.append(asyncio.create_task(self.validator_loop(node)))
+        self.tasks.append(asyncio.create_task(self.clock_loop()))
+
+    async def stop(self):
+        for inbox in self.inboxes.values():
+            inbox.put_nowait(None)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for shard in self.network.shards.values():
+            shard.runtime = None
+
+    async def wait_idle(self, timeout=30.0):
+        """ Wait until every submitted request has finalized, or ``timeout`` seconds pass. """
+        deadline = self.loop.time() + timeout
+        while self.submitted and self.loop.time() < deadline:
+            await asyncio.sleep(self.tick)
+
+    def latency_summary(self):
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return {"finalized": 0}
+        summary = {
+            "finalized": len(ordered),
+            "mean_s": sum(ordered) / len(ordered),
+            "p50_s": ordered[len(ordered) // 2],
+            "p99_s": ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))],
+            "dropped_messages": self.dropped,
+        }
+        if self.saved:
+            # Requests the client accepted on 2f+1 tentative replies, and how much sooner than finalization
+            summary["tentative_accepted"] = len(self.saved)
+            summary["saved_mean_s"] = sum(self.saved) / len(self.saved)
+        return summary
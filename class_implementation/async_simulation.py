@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import io
+import random
+import sys
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+from async_runtime import AsyncNetworkRuntime, ConstantLatency, LognormalLatency, ShardMatrixLatency
+
+
+def build_network(n_shards, shard_size, clients_per_shard=2):
+    network = Network()
+    node_id = 0
+
+    for shard_id in range(n_shards):
+        shard = Shard(shard_id=shard_id, network=network)
+        network.add_shard(shard)
+        for _ in range(shard_size):
+            shard.add_validator_node(ValidatorNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+        for _ in range(clients_per_shard):
+            shard.add_client_node(ClientNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+
+    return network
+
+
+async def measure(network, latency, n_requests=50, rate=100.0, cross_shard_ratio=0.0, bandwidth=None, loss=0.0, seed=42):
+    """ Submit requests as a Poisson stream and return the end-to-end latency summary. """
+    rng = random.Random(seed)
+    runtime = AsyncNetworkRuntime(network, latency, bandwidth=bandwidth, loss=loss, seed=seed)
+    await runtime.start()
+
+    shards = list(network.shards.values())
+    for i in range(n_requests):
+        shard = rng.choice(shards)
+        target = rng.choice([other for other in shards if other is not shard]) if rng.random() < cross_shard_ratio else shard
+        sender = rng.choice(list(shard.client_nodes.values()))
+        receiver = rng.choice(list(target.client_nodes.values()))
+        runtime.submit(sender, f"transfer {i}", receiver.get_node_id())
+        await asyncio.sleep(rng.expovariate(rate))
+
+    await runtime.wait_idle()
+    await runtime.stop()
+    return runtime.latency_summary()
+
+
+async def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    lan = LognormalLatency(median=0.002, sigma=0.5)
+    wan = LognormalLatency(median=0.040, sigma=0.5)
+
+    print("End-to-end latency vs. shard size (lognormal links, 2 ms median, 10 MB/s):")
+    for shard_size in (4, 7, 16, 31, 64):
+        with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+            result = await measure(build_network(1, shard_size), lan, n_requests=n_requests, bandwidth=10_000_000)
+        print(f"  shard size {shard_size}: {result}")
+
+    print("Cross-shard requests with 2 ms intra-shard and 40 ms inter-shard links:")
+    for ratio in (0.0, 0.5, 1.0):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await measure(build_network(4, 7), ShardMatrixLatency(lan, wan), n_requests=n_requests, cross_shard_ratio=ratio)
+        print(f"  cross-shard ratio {ratio}: {result}")
+
+    print("Constant 5 ms links with 1% message loss:")
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = await measure(build_network(1, 7), ConstantLatency(0.005), n_requests=n_requests, loss=0.01)
+    print(f"  {result}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -3,6 +3,8 @@ from network import Network
 from shard import Shard
 
 class Node(ABC):
+    __slots__ = ("node_id", "role", "name", "network", "shard", "message_log")
+
     def __init__(self, node_id, name, role, network, shard=None):
         """
         Initialize a node in the PBFT network.
@@ -0,0 +1,211 @@
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+SEED = 42
+REPEATS = 7  # Every timing is the minimum over this many identical runs
+TOLERANCE = 0.25  # A timing more than 25% above the baseline counts as a regression...
+ABSOLUTE_TOLERANCE_S = 0.015  # ... if it is also this much slower; tens of milliseconds jitter by more than 25% between runs
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+RESHARDING_SWEEP = [{"validators": validators, "shards": shards} for validators in (250, 500, 1000) for shards in (4, 16)]
+
+# Consensus cases vary one parameter at a time around a default point so the suite stays quick
+CONSENSUS_DEFAULTS = {"shards": 4, "f": 1, "batch_size": 16, "cross_shard_ratio": 0.1, "requests": 1000}
+CONSENSUS_SWEEP = (
+    [dict(CONSENSUS_DEFAULTS, shards=shards) for shards in (2, 4, 8)]
+    + [dict(CONSENSUS_DEFAULTS, f=f) for f in (2, 4)]
+    + [dict(CONSENSUS_DEFAULTS, batch_size=batch_size) for batch_size in (1, 64)]
+    + [dict(CONSENSUS_DEFAULTS, cross_shard_ratio=ratio) for ratio in (0.0, 0.5)]
+    + [dict(CONSENSUS_DEFAULTS, authenticated=True)]
+)
+
+
+def random_validators(network, count, rng, first_id=0):
+    return [
+        ValidatorNode(node_id=first_id + i, network=network, cpu_rating=rng.uniform(1, 10), reputation_score=rng.uniform(0, 1), ram_usage=rng.uniform(1, 16))
+        for i in range(count)
+    ]
+
+
+def case_name(kind, config):
+    return kind + "/" + ",".join(f"{key}={value}" for key, value in sorted(config.items()))
+
+
+def bench_resharding(validators, shards, seed=SEED):
+    """ Time one ``recompute_shards`` call, the clustering step every validator join triggers. """
+    rng = random.Random(seed)
+    network = Network(s_min=shards, s_max=shards)
+    network.validator_nodes.update(random_validators(network, validators, rng))
+
+    start = time.perf_counter()
+    network.recompute_shards()
+    return {"resharding_s": time.perf_counter() - start, "shards": len(network.shards)}
+
+
+def bench_consensus(shards, f, batch_size, cross_shard_ratio, requests, seed=SEED, clients_per_shard=10, authenticated=False):
+    """
+    Send a transfer workload through shards of 3f+1 validators.
+
+    Routing is the time clients spend logging requests with the right shard;
+    consensus is the time spent in ``process_requests`` running PBFT every
+    ``batch_size`` requests.
+
+    :param authenticated: Sign and verify every protocol message with MAC authenticators.
+    """
+    rng = random.Random(seed)
+    network = Network()
+    if authenticated:
+        network.enable_authentication()
+    shard_size = 3 * f + 1
+    node_id = 0
+
+    for shard_id in range(shards):
+        shard = Shard(shard_id=shard_id, network=network)
+        network.add_shard(shard)
+        for validator in random_validators(network, shard_size, rng, first_id=node_id):
+            shard.add_validator_node(validator)
+        node_id += shard_size
+        for _ in range(clients_per_shard):
+            shard.add_client_node(ClientNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+
+    shard_list = list(network.shards.values())
+    routing = 0.0
+    consensus = 0.0
+
+    for i in range(requests):
+        shard = rng.choice(shard_list)
+        target = shard
+        if len(shard_list) > 1 and rng.random() < cross_shard_ratio:
+            target = rng.choice([other for other in shard_list if other is not shard])
+        sender = rng.choice(list(shard.client_nodes.values()))
+        receiver = rng.choice(list(target.client_nodes.values()))
+
+        start = time.perf_counter()
+        sender.create_request({"operation": "transfer", "amount": rng.randint(1, 20), "seq": i}, receiver.get_node_id())
+        routing += time.perf_counter() - start
+
+        if (i + 1) % batch_size == 0 or i + 1 == requests:
+            start = time.perf_counter()
+            for shard in shard_list:
+                shard.process_requests()
+            consensus += time.perf_counter() - start
+
+    finalized = sum(len(shard.completed_requests) for shard in shard_list)
+    return {
+        "routing_s": routing,
+        "consensus_s": consensus,
+        "finalized": finalized,
+        "throughput_rps": finalized / (routing + consensus),
+    }
+
+
+def best_of(benchmark, config, repeats=REPEATS):
+    """ Run a benchmark ``repeats`` times and keep the fastest value of every timing. """
+    best = None
+    for _ in range(repeats):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # The protocol handlers print every message
+            result = benchmark(**config)
+        if best is None:
+            best = result
+            continue
+        for key, value in result.items():
+            if key.endswith("_s"):
+                best[key] = min(best[key], value)
+            elif key == "throughput_rps":
+                best[key] = max(best[key], value)
+    return best
+
+
+def run_suite(repeats=REPEATS):
+    cases = {}
+    for config in RESHARDING_SWEEP:
+        cases[case_name("resharding", config)] = dict(config=config, **best_of(bench_resharding, config, repeats))
+        print(f"{case_name('resharding', config)}: {cases[case_name('resharding', config)]['resharding_s']:.4f}s")
+    for config in CONSENSUS_SWEEP:
+        result = best_of(bench_consensus, config, repeats)
+        cases[case_name("consensus", config)] = dict(config=config, **result)
+        print(f"{case_name('consensus', config)}: routing {result['routing_s']:.4f}s, consensus {result['consensus_s']:.4f}s, {result['finalized']} finalized")
+
+    return {
+        "seed": SEED,
+        "repeats": repeats,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cases": cases,
+    }
+
+
+def compare(results, baseline, tolerance=TOLERANCE, absolute_tolerance=ABSOLUTE_TOLERANCE_S):
+    """
+    Compare every timing and finalized count with the baseline. A timing regresses when it is
+    both ``tolerance`` times and ``absolute_tolerance`` seconds above the baseline.
+
+    :return: Per-case ratios of current to baseline timings, and the list of regressions.
+    """
+    comparison = {}
+    regressions = []
+
+    for name, case in results["cases"].items():
+        reference = baseline["cases"].get(name)
+        if reference is None:
+            continue
+
+        ratios = {}
+        for key, value in case.items():
+            if key.endswith("_s") and reference.get(key):
+                ratios[key] = value / reference[key]
+                if ratios[key] > 1 + tolerance and value - reference[key] > absolute_tolerance:
+                    regressions.append(f"{name} {key}: {reference[key]:.4f}s -> {value:.4f}s ({ratios[key]:.2f}x)")
+        if "finalized" in case and case["finalized"] != reference.get("finalized"):
+            regressions.append(f"{name} finalized: {reference.get('finalized')} -> {case['finalized']}")
+        comparison[name] = ratios
+
+    return comparison, regressions
+
+
+def main():
+    """
+    Usage: python benchmark_suite.py [output.json] [--save-baseline]
+
+    Exits with status 1 if any timing regressed against benchmark_baseline.json.
+    """
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    output_path = args[0] if args else "benchmark_results.json"
+
+    results = run_suite()
+
+    if "--save-baseline" in sys.argv:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {BASELINE_PATH}")
+        return
+
+    regressions = []
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        results["comparison"], regressions = compare(results, baseline)
+        results["regressions"] = regressions
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Wrote {output_path}")
+
+    for regression in regressions:
+        print(f"⚠️ Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
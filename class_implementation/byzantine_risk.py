@@ -0,0 +1,161 @@
+import numpy as np
+
+MALICIOUS_MODELS = ("uniform", "reputation", "clustered")
+
+
+def fit_probabilities(weights, n_malicious):
+    """
+    Scale non-negative weights into per-node probabilities summing to ``n_malicious``,
+    capping each at 1 and handing the excess to the others.
+
+    :param weights: Array of shape (..., N); every row is scaled on its own.
+    """
+    weights = np.asarray(weights, dtype=float)
+    probabilities = np.zeros_like(weights)
+    capped = np.zeros(weights.shape, dtype=bool)
+    target = np.full(weights.shape[:-1] + (1,), float(n_malicious))
+
+    for _ in range(weights.shape[-1]):
+        free = np.where(capped, 0.0, weights)
+        remaining = target - capped.sum(axis=-1, keepdims=True)
+        totals = free.sum(axis=-1, keepdims=True)
+        scaled = np.divide(free * remaining, totals, out=np.zeros_like(free), where=totals > 0)
+        probabilities = np.where(capped, 1.0, scaled)
+        newly_capped = probabilities > 1.0
+        if not newly_capped.any():
+            break
+        capped |= newly_capped
+    return np.minimum(probabilities, 1.0)
+
+
+def poisson_binomial_cdf(probabilities, starts, sizes):
+    """
+    Exact distribution of the number of malicious validators in every shard, when each
+    validator is malicious independently.
+
+    :param probabilities: (rows, N) per-validator probabilities, validators sorted by shard.
+    :param starts: Column where each shard's validators begin.
+    :param sizes: Validators in each shard.
+    :return: (rows, shards, max size + 1) array; entry c is P(count <= c).
+    """
+    rows = len(probabilities)
+    cdf = np.ones((rows, len(sizes), sizes.max() + 1))
+    for shard, (start, size) in enumerate(zip(starts, sizes)):
+        pmf = np.zeros((rows, size + 1))
+        pmf[:, 0] = 1.0
+        for column in range(start, start + size):
+            p = probabilities[:, column:column + 1]
+            pmf[:, 1:] = pmf[:, 1:] * (1 - p) + pmf[:, :-1] * p
+            pmf[:, 0] *= 1 - p[:, 0]
+        cdf[:, shard, :size] = np.minimum(np.cumsum(pmf, axis=1)[:, :size], 1.0)
+    return cdf
+
+
+class ByzantineRiskEstimator:
+    def __init__(self, model="uniform", trials=1_000_000, reputation_bias=3.0, cluster_spread=0.5, n_centres=64, chunk_trials=1 << 18, seed=42):
+        """
+        Monte Carlo estimate of the probability that some shard of a given assignment
+        holds more than f = (n - 1) // 3 malicious validators.
+
+        Malicious-node models:
+
+        - "uniform": exactly ``n_malicious`` validators, drawn uniformly without
+          replacement; per-shard counts come from a multivariate hypergeometric draw.
+        - "reputation": every validator is malicious independently, with probability
+          proportional to ``exp(-reputation_bias * reputation_score)``.
+        - "clustered": an adversary whose validators sit close together in feature
+          space; each trial picks one of ``n_centres`` validators as the centre, and
+          a validator's probability falls off as a Gaussian of its distance to it,
+          with a spread of ``cluster_spread`` standard deviations per feature.
+
+        The last two are scaled to ``n_malicious`` malicious validators on average.
+        Validators are then independent within a trial, so each shard's count is drawn
+        by inverting its exact Poisson-binomial distribution: one uniform per shard and
+        trial, instead of one per validator and trial.
+
+        :param trials: Default number of trials per estimate.
+        :param chunk_trials: Trials sampled at once, to bound memory.
+        """
+        if model not in MALICIOUS_MODELS:
+            raise ValueError(f"Unknown malicious-node model {model!r}; expected one of {MALICIOUS_MODELS}.")
+
+        self.model = model
+        self.trials = trials
+        self.reputation_bias = reputation_bias
+        self.cluster_spread = cluster_spread
+        self.n_centres = n_centres
+        self.chunk_trials = chunk_trials
+        self.rng = np.random.default_rng(seed)
+
+    def probabilities(self, n_malicious, reputation=None, features=None):
+        """ Per-node malicious probabilities: one row for every possible trial setup. """
+        if self.model == "reputation":
+            return fit_probabilities(np.exp(-self.reputation_bias * np.asarray(reputation, dtype=float))[None, :], n_malicious)
+
+        features = np.asarray(features, dtype=float)
+        scale = features.std(axis=0)
+        scaled = features / np.where(scale > 0, scale, 1.0)
+        centres = scaled[self.rng.choice(len(scaled), size=min(self.n_centres, len(scaled)), replace=False)]
+        distances = ((centres[:, None, :] - scaled[None, :, :]) ** 2).sum(axis=-1)
+        return fit_probabilities(np.exp(-distances / (2 * self.cluster_spread ** 2)), n_malicious)
+
+    def estimate(self, labels, n_malicious, reputation=None, features=None, trials=None):
+        """
+        Estimate the risk of one shard assignment.
+
+        :param labels: Shard label of every validator.
+        :param n_malicious: Malicious validators in the whole network (on average, for non-uniform models).
+        :param reputation: reputation_score of every validator, for the "reputation" model.
+        :param features: Feature matrix of the validators, for the "clustered" model.
+        :return: Probability that any shard exceeds f, its standard error, and the rate for each shard.
+        """
+        trials = trials or self.trials
+        labels = np.asarray(labels)
+        shard_ids, inverse, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        max_faulty = (sizes - 1) // 3
+        n_malicious = min(int(n_malicious), len(labels))
+
+        if self.model == "uniform":
+            sample = self.sample_uniform(sizes, n_malicious)
+        else:
+            # Sort validators by shard, so every shard is a contiguous block of columns
+            order = np.argsort(inverse, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            probabilities = self.probabilities(n_malicious, reputation, features)[:, order]
+            sample = self.sample_independent(poisson_binomial_cdf(probabilities, starts, sizes))
+
+        compromised = 0
+        per_shard = np.zeros(len(sizes), dtype=np.int64)
+        done = 0
+        while done < trials:
+            chunk = min(trials - done, self.chunk_trials)
+            counts = sample(chunk)
+            exceeded = counts > max_faulty
+            compromised += np.count_nonzero(exceeded.any(axis=1))
+            per_shard += exceeded.sum(axis=0)
+            done += chunk
+
+        risk = compromised / trials
+        return {
+            "risk": risk,
+            "stderr": float(np.sqrt(risk * (1 - risk) / trials)),
+            "per_shard": {shard_id: count / trials for shard_id, count in zip(shard_ids.tolist(), per_shard)},
+            "trials": trials,
+        }
+
+    def sample_uniform(self, sizes, n_malicious):
+        def sample(chunk):
+            return self.rng.multivariate_hypergeometric(sizes, n_malicious, size=chunk, method="marginals")
+        return sample
+
+    def sample_independent(self, cdf):
+        rows, n_shards, width = cdf.shape
+        # Offset block k = (row, shard) by k: one sorted array serves every inverse-CDF lookup
+        blocks = np.arange(rows * n_shards).reshape(rows, n_shards)
+        flat = (cdf + blocks[:, :, None]).ravel()
+
+        def sample(chunk):
+            chosen = blocks[self.rng.integers(rows, size=chunk)] if rows > 1 else np.broadcast_to(blocks, (chunk, n_shards))
+            keys = self.rng.random((chunk, n_shards)) + chosen
+            return np.searchsorted(flat, keys, side="right") - chosen * width
+        return sample
@@ -0,0 +1,79 @@
+import contextlib
+import io
+import random
+import sys
+import time
+from math import comb
+import numpy as np
+from network import Network
+from validator_node import ValidatorNode
+from byzantine_risk import MALICIOUS_MODELS
+
+
+def build_network(n_validators, seed=42, **kwargs):
+    rng = random.Random(seed)
+    network = Network(s_min=3, s_max=20, **kwargs)
+    nodes = [
+        ValidatorNode(
+            node_id=i,
+            network=network,
+            cpu_rating=rng.uniform(1, 10),
+            reputation_score=rng.uniform(0, 1),
+            ram_usage=rng.uniform(1, 16),
+            name=f"Validator_{i}"
+        )
+        for i in range(n_validators)
+    ]
+    return network, nodes
+
+
+def random_shard_risk(sizes, n_validators, n_malicious):
+    """ Chance that some shard exceeds f if each shard were a uniformly random sample (union bound). """
+    total = 0.0
+    for size in sizes:
+        f = (size - 1) // 3
+        tail = sum(comb(n_malicious, k) * comb(n_validators - n_malicious, size - k) for k in range(f + 1, size + 1))
+        total += tail / comb(n_validators, size)
+    return min(total, 1.0)
+
+
+def main():
+    """ Usage: python byzantine_risk_simulation.py [validators] [trials] """
+    n_validators = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    trials = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+
+    network, nodes = build_network(n_validators)
+    with contextlib.redirect_stdout(io.StringIO()):  # recompute_shards prints its choice
+        network.add_validator_node(nodes)
+
+    shards = list(network.shards.values())
+    labels = np.array([shard.shard_id for shard in shards for _ in shard.validator_nodes])
+    reputation = np.array([node.reputation_score for shard in shards for node in shard.validator_nodes])
+    features = np.array([[node.cpu_rating, node.ram_usage] for shard in shards for node in shard.validator_nodes])
+    sizes = [len(shard.validator_nodes) for shard in shards]
+    n_malicious = int(n_validators * network.malicious_fraction)
+
+    print(f"{n_validators} validators, {n_malicious} malicious, KMeans shard sizes {sorted(sizes)}")
+    print(f"  analytic, shards as uniformly random samples: {random_shard_risk(sizes, n_validators, n_malicious):.6f} (union bound)")
+    for model in MALICIOUS_MODELS:
+        estimator = network.enable_monte_carlo_risk(model=model, trials=trials)
+        start = time.perf_counter()
+        result = estimator.estimate(labels, n_malicious, reputation, features)
+        elapsed = time.perf_counter() - start
+        worst = max(result["per_shard"], key=result["per_shard"].get)
+        print(f"  {model}: P(some shard > f) = {result['risk']:.6f} ± {result['stderr']:.6f}, "
+              f"worst shard {worst} at {result['per_shard'][worst]:.6f}, {trials} trials in {elapsed:.2f} s")
+
+    print("Shard count chosen by recompute_shards:")
+    for model in (None,) + MALICIOUS_MODELS:
+        network, nodes = build_network(n_validators)
+        if model:
+            network.enable_monte_carlo_risk(model=model, trials=100_000)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            network.add_validator_node(nodes)
+        print(f"  penalty from {model or 'hypergeometric tail'}: {len(network.shards)} shards, {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,9 +15,15 @@ class ClientNode(Node):
         :param ram_usage: Current RAM usage of the node (default: 0.0).
         """
 
+        __slots__ = ("reputation_score", "timestamp", "pending_requests", "last_reply", "tentative_replies")
+
         def __init__(self, node_id, network, shard=None, reputation_score=1.0, name=None):
             super().__init__(node_id, network=network, role="client", shard=shard, name=name)
             self.reputation_score = reputation_score
+            self.timestamp = 0  # Increases with every request so replicas can recognise retransmissions
+            self.pending_requests = {}  # timestamp -> request still waiting for its reply
+            self.last_reply = None
+            self.tentative_replies = {}  # timestamp -> {replica: results} of tentative replies so far
 
         def receive_message(self, message):
             """
@@ -26,11 +32,13 @@ class ClientNode(Node):
             self.message_queue.append(message)
             print(f"Client Node {self.node_id} received message: {message}")
 
-        def create_request(self, data, receiver_id):
+        def build_request(self, data, receiver_id):
+            self.timestamp += 1
             transaction = {
             "operation": data,
             "client_node_id": self.node_id,
-            "receiver": receiver_id
+            "receiver": receiver_id,
+            "timestamp": self.timestamp
             }
 
             digest = hashlib.sha256(json.dumps(transaction).encode()).hexdigest()
@@ -40,7 +48,83 @@ class ClientNode(Node):
                 "transaction": transaction
             }
 
+            return request
+
+        def create_request(self, data, receiver_id, read_only=False):
+            """
+            Send a request for ordering.
+
+            :param read_only: The operation only reads ("get" or "balance"). Every validator answers it
+                              from executed state and 2f+1 matching replies are accepted in one round
+                              trip; without them the request is ordered like any other.
+            """
+            request = self.build_request(data, receiver_id)
+            if read_only and self.read_fast_path(request, receiver_id):
+                return request
+
+            self.pending_requests[self.timestamp] = request
             self.shard.log_request(self.node_id, receiver_id, request)
+            return request
+
+        def read_fast_path(self, request, receiver_id):
+            """
+            Try to answer a read-only request without ordering it; returns True if 2f+1 replies matched.
+
+            Replies match only if they carry the same results at the same executed sequence number, so a
+            replica that lags behind or answers from other state cannot make up a quorum with the rest.
+            """
+            shard = self.network.find_shard_of_node(receiver_id) or self.shard
+            quorum = 2 * shard.max_faulty_nodes() + 1
+            matching = {}
+
+            for reply in shard.read_only_request(request):
+                key = json.dumps([reply["seq"], reply["results"]], sort_keys=True, default=str)
+                matching[key] = matching.get(key, 0) + 1
+                if matching[key] >= quorum:
+                    self.network.metrics.counter("read_only_requests_total", "Read-only requests by how they were answered", outcome="fast").inc()
+                    self.receive_reply(reply)
+                    return True
+
+            self.network.metrics.counter("read_only_requests_total", "Read-only requests by how they were answered", outcome="ordered").inc()
+            return False
+
+        def retransmit(self, timestamp):
+            """ Send a request again, e.g. after a timeout; the replicas answer it from their reply cache if it already ran. """
+            request = self.pending_requests.get(timestamp)
+            if request is not None:
+                self.shard.log_request(self.node_id, request["transaction"]["receiver"], request)
+
+        def receive_reply(self, reply):
+            """
+            A reply finalizes its request, so drop the request from the pending store.
+
+            Tentative replies come from single replicas; the request is only accepted
+            once 2f+1 of them carry the same results.
+
+            :return: True if this reply made the client accept the request's result.
+            """
+            if reply.get("tentative"):
+                return self.receive_tentative_reply(reply)
+
+            self.tentative_replies.pop(reply["timestamp"], None)
+            accepted = self.pending_requests.pop(reply["timestamp"], None) is not None
+            self.last_reply = reply
+            return accepted
+
+        def receive_tentative_reply(self, reply):
+            if reply["timestamp"] not in self.pending_requests:
+                return False  # Already accepted, or the committed reply came first
+
+            votes = self.tentative_replies.setdefault(reply["timestamp"], {})
+            votes[reply["replica"]] = json.dumps(reply["results"], sort_keys=True, default=str)
+            matching = sum(1 for results in votes.values() if results == votes[reply["replica"]])
+            if matching < 2 * self.network.shards[reply["shard"]].max_faulty_nodes() + 1:
+                return False
+
+            del self.tentative_replies[reply["timestamp"]]
+            del self.pending_requests[reply["timestamp"]]
+            self.last_reply = reply
+            return True
         
         def decide_shard(self, shard_loads):
             """
@@ -0,0 +1,123 @@
+import math
+import random
+
+
+class ClientPlacementEngine:
+    def __init__(self, network, repartition_interval=1000, balance_slack=0.1, max_iterations=10, seed=42):
+        """
+        Keeps a weighted client-to-client transaction graph and periodically moves clients
+        so that clients who transact with each other share a shard.
+
+        Repartitioning is balanced label propagation: each client in turn moves to the
+        shard holding most of its transaction weight, as long as that shard stays under
+        its capacity, until a pass moves nobody.
+
+        :param network: Network whose clients are placed.
+        :param repartition_interval: Repartition after this many recorded requests (0 disables it).
+        :param balance_slack: A shard may hold up to (1 + slack) times its fair share of clients.
+        :param max_iterations: Upper bound on label-propagation passes per repartition.
+        """
+        self.network = network
+        self.repartition_interval = repartition_interval
+        self.balance_slack = balance_slack
+        self.max_iterations = max_iterations
+        self.rng = random.Random(seed)
+
+        self.graph = {}  # client id -> {other client id: number of requests between them}
+        self.recorded = 0
+
+    def record(self, sender_id, receiver_id):
+        """ Add one request to the transaction graph. """
+        if sender_id == receiver_id:
+            return
+
+        self.graph.setdefault(sender_id, {})
+        self.graph.setdefault(receiver_id, {})
+        self.graph[sender_id][receiver_id] = self.graph[sender_id].get(receiver_id, 0) + 1
+        self.graph[receiver_id][sender_id] = self.graph[receiver_id].get(sender_id, 0) + 1
+        self.recorded += 1
+
+        if self.repartition_interval and self.recorded % self.repartition_interval == 0:
+            self.repartition()
+
+    def current_assignment(self):
+        """ Client id -> shard id, read from the shards themselves. """
+        return {client_id: shard_id for shard_id, shard in self.network.shards.items() for client_id in shard.client_nodes}
+
+    def cross_shard_ratio(self, assignment=None):
+        """ Fraction of recorded transaction weight whose two clients sit in different shards. """
+        assignment = assignment or self.current_assignment()
+        total = 0
+        cut = 0
+
+        for client_id, neighbours in self.graph.items():
+            for other_id, weight in neighbours.items():
+                if client_id < other_id and client_id in assignment and other_id in assignment:
+                    total += weight
+                    if assignment[client_id] != assignment[other_id]:
+                        cut += weight
+
+        return cut / total if total else 0.0
+
+    def best_shard(self, client_id, assignment, sizes, capacity):
+        """ Shard holding most of a client's transaction weight that still has room for it. """
+        current = assignment.get(client_id)
+        weights = {}
+        for other_id, weight in self.graph.get(client_id, {}).items():
+            if other_id in assignment:
+                weights[assignment[other_id]] = weights.get(assignment[other_id], 0) + weight
+
+        best, best_weight = current, weights.get(current, 0)
+        for shard_id, weight in weights.items():
+            if shard_id != current and sizes[shard_id] < capacity and weight > best_weight:
+                best, best_weight = shard_id, weight
+        return best
+
+    def repartition(self):
+        """
+        Move clients to cut cross-shard transaction weight, keeping shards balanced.
+
+        :return: Number of clients moved, moves deferred for transfers in flight, and the cross-shard ratio before and after.
+        """
+        assignment = self.current_assignment()
+        if not assignment or len(self.network.shards) < 2:
+            return {"moved": 0, "deferred": 0, "cross_shard_ratio_before": 0.0, "cross_shard_ratio_after": 0.0}
+
+        before = self.cross_shard_ratio(assignment)
+        original = dict(assignment)
+        capacity = math.ceil(len(assignment) / len(self.network.shards) * (1 + self.balance_slack))
+        sizes = {shard_id: 0 for shard_id in self.network.shards}
+        for shard_id in assignment.values():
+            sizes[shard_id] += 1
+
+        clients = [client_id for client_id in assignment if client_id in self.graph]
+        for _ in range(self.max_iterations):
+            self.rng.shuffle(clients)
+            moved = 0
+            for client_id in clients:
+                target = self.best_shard(client_id, assignment, sizes, capacity)
+                if target != assignment[client_id]:
+                    sizes[assignment[client_id]] -= 1
+                    sizes[target] += 1
+                    assignment[client_id] = target
+                    moved += 1
+            if moved == 0:
+                break
+
+        moves = [(client_id, shard_id) for client_id, shard_id in assignment.items() if original[client_id] != shard_id]
+        moved = sum(1 for client_id, shard_id in moves if self.network.move_client_node(client_id, shard_id))
+
+        # Clients with transfers in flight keep their shard until the next repartition
+        after = self.cross_shard_ratio(self.current_assignment())
+        print(f"Repartitioned clients: moved {moved}, deferred {len(moves) - moved}, cross-shard ratio {before:.2%} -> {after:.2%}.")
+        return {"moved": moved, "deferred": len(moves) - moved, "cross_shard_ratio_before": before, "cross_shard_ratio_after": after}
+
+    def place(self, client_id):
+        """ Shard for a joining client: where its known counterparties are, if it has any history. """
+        assignment = self.current_assignment()
+        if client_id not in self.graph or not self.network.shards:
+            return None
+
+        sizes = {shard_id: len(shard.client_nodes) for shard_id, shard in self.network.shards.items()}
+        capacity = math.ceil((len(assignment) + 1) / len(self.network.shards) * (1 + self.balance_slack))
+        return self.best_shard(client_id, assignment, sizes, capacity)
@@ -0,0 +1,81 @@
+import contextlib
+import io
+import random
+import sys
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def build_network(n_shards, shard_size, n_clients, repartition_interval, seed):
+    network = Network()
+    if repartition_interval is not None:
+        network.enable_client_placement(repartition_interval=repartition_interval, seed=seed)
+
+    node_id = 0
+    for shard_id in range(n_shards):
+        shard = Shard(shard_id=shard_id, network=network)
+        network.add_shard(shard)
+        for _ in range(shard_size):
+            shard.add_validator_node(ValidatorNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+
+    # Clients join one after another and land in the least populated shard, which scatters every community
+    clients = []
+    for _ in range(n_clients):
+        client = ClientNode(node_id=node_id, network=network)
+        network.add_client_node(client)
+        clients.append(client)
+        node_id += 1
+
+    return network, clients
+
+
+def run(repartition_interval, n_requests=4000, n_shards=4, shard_size=4, n_clients=80, community_size=10, locality=0.9, window=500, seed=42):
+    """
+    Send a workload where clients mostly pay others in their own community and
+    report the share of requests that crossed shards in each window.
+
+    :param repartition_interval: Requests between repartitions, or None to keep the join-time placement.
+    :param locality: Probability a request stays inside the sender's community.
+    """
+    rng = random.Random(seed)
+    network, clients = build_network(n_shards, shard_size, n_clients, repartition_interval, seed)
+    communities = [clients[i:i + community_size] for i in range(0, n_clients, community_size)]
+
+    windows = []
+    crossed = 0
+    for i in range(n_requests):
+        community = rng.choice(communities)
+        sender = rng.choice(community)
+        pool = community if rng.random() < locality else clients
+        receiver = rng.choice([client for client in pool if client is not sender])
+
+        if network.find_shard_of_node(sender.node_id) is not network.find_shard_of_node(receiver.node_id):
+            crossed += 1
+        sender.create_request({"operation": "transfer", "amount": rng.randint(1, 20)}, receiver.get_node_id())
+
+        # Order each request before the next one, so a repartition finds few transfers in flight and defers little
+        for shard in network.shards.values():
+            shard.process_requests()
+
+        if (i + 1) % window == 0:
+            windows.append(crossed / window)
+            crossed = 0
+
+    sizes = sorted(len(shard.client_nodes) for shard in network.shards.values())
+    return {"repartition_interval": repartition_interval, "cross_shard_ratio_by_window": [round(ratio, 3) for ratio in windows], "clients_per_shard": sizes}
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+
+    for interval in (None, 1000):
+        with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+            result = run(interval, n_requests=n_requests)
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
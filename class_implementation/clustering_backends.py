@@ -0,0 +1,52 @@
+import numpy as np
+
+# Backend name -> callable(X, n_clusters) returning one label per row of X. Backends import
+# their libraries when first called, so importing the simulator never pays for sklearn.
+CLUSTERING_BACKENDS = {}
+
+
+def register_clustering_backend(name, backend):
+    """
+    Make a clustering backend available to ``Network(clustering_backend=name)``.
+
+    :param backend: Callable ``(X, n_clusters) -> labels``; keep heavy imports inside it.
+    """
+    CLUSTERING_BACKENDS[name] = backend
+
+
+def get_clustering_backend(name):
+    if name not in CLUSTERING_BACKENDS:
+        raise ValueError(f"Unknown clustering backend {name!r}; expected one of {tuple(CLUSTERING_BACKENDS)}.")
+    return CLUSTERING_BACKENDS[name]
+
+
+def kmeans_labels(X, n_clusters):
+    from sklearn.cluster import KMeans
+    return KMeans(n_clusters=n_clusters, random_state=42, n_init=10).fit_predict(X)
+
+
+def ward_labels(X, n_clusters):
+    from sklearn.cluster import AgglomerativeClustering
+    return AgglomerativeClustering(n_clusters=n_clusters, metric="euclidean", linkage="ward").fit_predict(X)
+
+
+register_clustering_backend("kmeans", kmeans_labels)
+register_clustering_backend("ward", ward_labels)
+
+
+def calinski_harabasz(X, labels):
+    """ Calinski-Harabasz index, as sklearn.metrics.calinski_harabasz_score computes it, without importing sklearn. """
+    X = np.asarray(X, dtype=float)
+    clusters, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    n_samples, n_clusters = len(X), len(clusters)
+    if not 1 < n_clusters < n_samples:
+        raise ValueError(f"Number of labels is {n_clusters}. Valid values are 2 to n_samples - 1 (inclusive)")
+
+    centroids = np.zeros((n_clusters, X.shape[1]))
+    np.add.at(centroids, inverse, X)
+    centroids /= counts[:, None]
+    extra_dispersion = (counts * ((centroids - X.mean(axis=0)) ** 2).sum(axis=1)).sum()
+    intra_dispersion = ((X - centroids[inverse]) ** 2).sum()
+    if intra_dispersion == 0:
+        return 1.0
+    return extra_dispersion * (n_samples - n_clusters) / (intra_dispersion * (n_clusters - 1))
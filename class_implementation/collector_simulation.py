@@ -0,0 +1,70 @@
+import contextlib
+import io
+import sys
+import time
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def run(shard_size, collector, n_requests=3, batch_size=1):
+    """
+    Order ``n_requests`` transfers in one shard of ``shard_size`` validators.
+
+    :param collector: None for all-to-all PREPARE/COMMIT, or "primary" / "rotating".
+    :return: Messages, bytes and wall-clock seconds per finalized request.
+    """
+    network = Network()
+    shard = Shard(shard_id=0, network=network)
+    network.add_shard(shard)
+    shard.set_collector_mode(collector)
+
+    for node_id in range(shard_size):
+        shard.add_validator_node(ValidatorNode(node_id=node_id, network=network, shard=shard))
+    sender = ClientNode(node_id=shard_size, network=network, shard=shard)
+    receiver = ClientNode(node_id=shard_size + 1, network=network, shard=shard)
+    shard.add_client_node(sender)
+    shard.add_client_node(receiver)
+
+    start = time.perf_counter()
+    for i in range(n_requests):
+        sender.create_request({"operation": "transfer", "amount": 1}, receiver.get_node_id())
+        if (i + 1) % batch_size == 0 or i + 1 == n_requests:
+            shard.process_requests()
+    elapsed = time.perf_counter() - start
+
+    finalized = len(shard.completed_requests)
+    messages = network.metrics.families["messages_sent_total"][3]
+    bytes_sent = network.metrics.families["bytes_sent_total"][3]
+    return {
+        "shard_size": shard_size,
+        "collector": collector,
+        "finalized": finalized,
+        "messages_per_request": sum(counter.value for counter in messages.values()) // max(finalized, 1),
+        "bytes_per_request": sum(counter.value for counter in bytes_sent.values()) // max(finalized, 1),
+        "seconds_per_request": round(elapsed / max(finalized, 1), 4),
+    }
+
+
+def main():
+    """
+    Usage: python collector_simulation.py [requests per run] [largest all-to-all shard]
+
+    All-to-all runs above the second argument (default 1000) are skipped, since they
+    send about 2n^2 messages per request.
+    """
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    max_all_to_all = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    for shard_size in (100, 250, 500, 1000):
+        for collector in (None, "primary", "rotating"):
+            if collector is None and shard_size > max_all_to_all:
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+                result = run(shard_size, collector, n_requests=n_requests)
+            print(result)
+
+
+if __name__ == '__main__':
+    main()
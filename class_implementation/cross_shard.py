@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from server_implementation.reply_cache import CACHED, IN_PROGRESS
+
+
+class CrossShardCoordinator:
+    def __init__(self, network, batch_size=32, max_outcomes=10000):
+        """
+        Two-phase commit for transfers whose sender and receiver live in different shards.
+
+        Transfers are queued per (sender shard, receiver shard) pair. Flushing a pair runs
+        one coordination round for the whole batch: each shard orders the batch through
+        PBFT and escrows each transfer (prepare), the two shards exchange one receipt carrying
+        every vote, and each shard orders the batched decisions and commits or aborts.
+        A batch of k transfers thus costs 4 PBFT instances instead of 4k.
+
+        A decision that a shard fails to order is retried on every later flush; clients
+        hear the outcome only once both shards have applied it.
+
+        The coordinator drives the shards synchronously, so it cannot run under an
+        AsyncNetworkRuntime.
+
+        :param network: The Network whose shards take part.
+        :param batch_size: Flush a shard pair as soon as this many transfers are queued.
+        :param max_outcomes: Decided transfers remembered for retransmissions, oldest dropped first.
+        """
+        self.network = network
+        self.batch_size = batch_size
+        self.buckets = {}  # (sender shard id, receiver shard id) -> queued transfers
+        self.max_outcomes = max_outcomes
+        self.outcomes = OrderedDict()  # request digest -> "COMMITTED" or "ABORTED", oldest first
+        self.undecided = []  # Rounds whose decision some shard has not applied yet
+        self.queued = set()  # Request digests waiting in a bucket, so retransmissions are not queued twice
+        self.committed = 0
+        self.aborted = 0
+        self.rounds = 0
+        self.receipts = 0
+
+    def submit(self, sender_shard, receiver_shard, log_entry):
+        request = log_entry["request"]
+        outcome = self.outcomes.get(request["digest"])
+        if outcome is not None or request["digest"] in self.queued:
+            # A retransmission: answer it again if the transfer is decided, drop it while it is still queued
+            sender_shard.network.metrics.counter("duplicate_requests_total", "Retransmitted requests answered without consensus", shard=sender_shard.shard_id, outcome=CACHED if outcome is not None else IN_PROGRESS).inc()
+            if outcome is not None:
+                sender_shard.send_reply(log_entry["sender"], {"type": "REPLY", "digest": request["digest"], "timestamp": request["transaction"].get("timestamp"), "results": [outcome]})
+            return
+        self.queued.add(request["digest"])
+        operation = request["transaction"]["operation"]
+        transfer = {
+            "digest": request["digest"],
+            "sender": log_entry["sender"],
+            "receiver": log_entry["receiver"],
+            "amount": operation.get("amount", 0) if isinstance(operation, dict) else 0,
+            "timestamp": request["transaction"].get("timestamp"),
+        }
+
+        key = (sender_shard.shard_id, receiver_shard.shard_id)
+        self.buckets.setdefault(key, []).append(transfer)
+        if len(self.buckets[key]) >= self.batch_size:
+            self.flush_pair(key)
+
+    def flush(self):
+        """ Retry undecided rounds, then run a coordination round for every shard pair with queued transfers. """
+        for batch in list(self.undecided):
+            self.finish(batch)
+        for key in list(self.buckets):
+            self.flush_pair(key)
+
+    def prepare(self, shard, transfers, role):
+        """
+        Order the batch in ``shard``; executing it escrows each transfer against its key
+        (the debit in the sender's shard, the credit in the receiver's).
+
+        :return: One vote per transfer.
+        """
+        escrows = [{"digest": transfer["digest"], "key": transfer[role], "amount": -transfer["amount"] if role == "sender" else transfer["amount"]} for transfer in transfers]
+        votes = shard.order_operation({"type": "2PC-PREPARE", "role": role, "transfers": escrows})
+        if votes is None:
+            return [False] * len(transfers)  # The shard could not agree, so it votes abort on everything
+        return votes
+
+    def decide(self, shard, transfers, decisions, role):
+        """
+        Order the batched decisions in ``shard``; executing them applies or discards each escrow.
+        Releasing an escrow twice does nothing, so a decision can safely be ordered again.
+
+        :return: True once the shard has executed the decisions.
+        """
+        return shard.order_operation({"type": "2PC-DECIDE", "role": role, "decisions": [[transfer["digest"], transfer[role], commit] for transfer, commit in zip(transfers, decisions)]}) is not None
+
+    def flush_pair(self, key):
+        transfers = self.buckets.pop(key, [])
+        if not transfers:
+            return
+
+        sender_shard = self.network.shards[key[0]]
+        receiver_shard = self.network.shards[key[1]]
+        self.rounds += 1
+
+        # Phase 1: both shards prepare the whole batch, then swap one receipt of votes each way
+        sender_votes = self.prepare(sender_shard, transfers, "sender")
+        receiver_votes = self.prepare(receiver_shard, transfers, "receiver")
+        self.receipts += 2
+
+        # Phase 2: a transfer commits only if both sides voted to commit
+        decisions = [sender_vote and receiver_vote for sender_vote, receiver_vote in zip(sender_votes, receiver_votes)]
+        self.finish({"key": key, "transfers": transfers, "decisions": decisions, "pending": ["sender", "receiver"]})
+
+    def finish(self, batch):
+        """ Have every shard that has not applied the batch's decision order it, and report the outcomes once both have. """
+        key, transfers, decisions = batch["key"], batch["transfers"], batch["decisions"]
+        shards = {"sender": self.network.shards[key[0]], "receiver": self.network.shards[key[1]]}
+        batch["pending"] = [role for role in batch["pending"] if not self.decide(shards[role], transfers, decisions, role)]
+        if batch["pending"]:
+            if batch not in self.undecided:
+                self.undecided.append(batch)
+            print(f"⚠️ Cross-shard batch {key[0]} -> {key[1]}: {', '.join(batch['pending'])} shard has not applied the decision yet; retrying on the next flush.")
+            return
+        if batch in self.undecided:
+            self.undecided.remove(batch)
+
+        for transfer, commit in zip(transfers, decisions):
+            self.queued.discard(transfer["digest"])
+            self.outcomes[transfer["digest"]] = "COMMITTED" if commit else "ABORTED"
+            if len(self.outcomes) > self.max_outcomes:
+                self.outcomes.popitem(last=False)
+            shards["sender"].send_reply(transfer["sender"], {"type": "REPLY", "digest": transfer["digest"], "timestamp": transfer["timestamp"], "results": [self.outcomes[transfer["digest"]]]})
+            if commit:
+                self.committed += 1
+            else:
+                self.aborted += 1
+
+        print(f"🔐 Cross-shard batch {key[0]} -> {key[1]}: {sum(decisions)} committed, {len(decisions) - sum(decisions)} aborted.")
@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ("shard", "network", "validator_node", "client_node")
+HEAVY_MODULES = ("sklearn", "scipy", "matplotlib")  # Should load only once a reshard clusters validators
+REPEATS = 5  # Every timing is the minimum over this many fresh interpreters
+BUDGET_S = 0.5  # Import time above this counts as a regression
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"import_s": time.perf_counter() - start, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def time_import(module, repeats=REPEATS):
+    """ Import ``module`` in fresh interpreters, as a parallel sweep worker would, and keep the fastest run. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=here, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        if best is None or result["import_s"] < best["import_s"]:
+            best = result
+    return best
+
+
+def main():
+    """
+    Usage: python import_benchmark.py [module ...]
+
+    Exits with status 1 if a module takes longer than BUDGET_S to import or loads a heavy dependency.
+    """
+    modules = sys.argv[1:] or MODULES
+    regressions = []
+    for module in modules:
+        result = time_import(module)
+        print(f"{module}: {result['import_s']:.3f}s, heavy modules loaded: {result['heavy'] or 'none'}")
+        if result["import_s"] > BUDGET_S or result["heavy"]:
+            regressions.append(module)
+
+    for module in regressions:
+        print(f"⚠️ Regression: importing {module} is slow or loads {', '.join(HEAVY_MODULES)}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -87,6 +87,8 @@ def main():
 
     print(shard_1.get_completed_requests()) # Will show that network has completed the request
 
+    print(net.metrics.render()) # Per-phase latency histograms and message counts
+
 
 
 
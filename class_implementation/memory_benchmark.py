@@ -0,0 +1,84 @@
+import contextlib
+import hashlib
+import io
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from network import Network
+from validator_node import ValidatorNode
+from shard import Shard
+from messages import PREPARE, Vote, encoded_size
+
+
+def traced(build):
+    """ Run ``build`` and return its result with the bytes it left allocated. """
+    tracemalloc.start()
+    result = build()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, allocated
+
+
+def build_network(n_validators, shard_size=1000, seed=42):
+    """ Fill shards of ``shard_size`` validators directly, skipping the clustering. """
+    rng = random.Random(seed)
+    network = Network()
+    shard = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for node_id in range(n_validators):
+            if node_id % shard_size == 0:
+                shard = Shard(shard_id=node_id // shard_size, network=network)
+                network.add_shard(shard)
+            shard.add_validator_node(ValidatorNode(
+                node_id=node_id,
+                network=network,
+                cpu_rating=rng.uniform(1, 10),
+                reputation_score=rng.uniform(0, 1),
+                ram_usage=rng.uniform(1, 16),
+                name=f"Validator_{node_id}"
+            ))
+    return network
+
+
+def build_votes(n_messages, record):
+    """ The PREPAREs of one request in a shard of ``n_messages`` validators, as records or as dicts. """
+    digest = hashlib.sha256(b"request").hexdigest()
+    if record:
+        return [Vote(PREPARE, digest, validator_id, 0, 1) for validator_id in range(n_messages)]
+    return [{"type": "PREPARE", "digest": digest, "validator_id": validator_id, "view": 0, "seq": 1} for validator_id in range(n_messages)]
+
+
+def main():
+    """ Usage: python memory_benchmark.py [validators] [messages] """
+    n_validators = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    n_messages = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000
+
+    start = time.perf_counter()
+    network, allocated = traced(lambda: build_network(n_validators))
+    elapsed = time.perf_counter() - start
+    print({
+        "validators": n_validators,
+        "shards": len(network.shards),
+        "bytes_per_validator": round(allocated / n_validators),
+        "total_mb": round(allocated / 2 ** 20),
+        "build_s": round(elapsed, 2),
+    })
+    del network
+
+    for record in (False, True):
+        votes, allocated = traced(lambda: build_votes(n_messages, record))
+        print({
+            "message": "record" if record else "dict",
+            "messages": n_messages,
+            "bytes_per_message": round(allocated / n_messages),
+            "encoded_bytes": encoded_size(votes[0]),
+        })
+        del votes
+
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB")
+
+
+if __name__ == '__main__':
+    main()
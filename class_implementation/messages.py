@@ -0,0 +1,141 @@
+import json
+import sys
+
+# Interned type codes: records carry a small int, and the name is looked up only for logging and metrics
+MESSAGE_TYPES = tuple(sys.intern(name) for name in (
+    "PRE-PREPARE", "PREPARE", "COMMIT", "PREPARE-CERTIFICATE", "COMMIT-CERTIFICATE", "VIEW-CHANGE", "NEW-VIEW",
+))
+PRE_PREPARE, PREPARE, COMMIT, PREPARE_CERTIFICATE, COMMIT_CERTIFICATE, VIEW_CHANGE, NEW_VIEW = range(len(MESSAGE_TYPES))
+TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+
+
+class Message:
+    """
+    A protocol message as a slotted record instead of a dict with string keys.
+
+    Handlers read fields as attributes. Code written against dict messages (the
+    authenticator, the asyncio runtime, size accounting) still works: records answer
+    ``message["field"]``, ``message.get(...)``, ``items()`` and ``"field" in message``,
+    and ``message["type"]`` gives the type name.
+    """
+
+    __slots__ = ("code", "auth")
+    fields = ()
+
+    def __init__(self, code):
+        self.code = code
+        self.auth = None  # Authenticator vector, set when the message is signed
+
+    @property
+    def type(self):
+        return MESSAGE_TYPES[self.code]
+
+    def keys(self):
+        keys = ("type",) + self.fields
+        return keys + ("auth",) if self.auth is not None else keys
+
+    def items(self):
+        return self.to_dict().items()
+
+    def to_dict(self):
+        message = {"type": MESSAGE_TYPES[self.code]}
+        for key in self.fields:
+            message[key] = getattr(self, key)
+        if self.auth is not None:
+            message["auth"] = self.auth
+        return message
+
+    def __getitem__(self, key):
+        if key != "type" and key not in self.fields and (key != "auth" or self.auth is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key != "auth" and key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class PrePrepare(Message):
+    __slots__ = ("digest", "primary_id", "client_request", "view", "seq")
+    fields = __slots__
+
+    def __init__(self, digest, primary_id, client_request, view, seq):
+        super().__init__(PRE_PREPARE)
+        self.digest = digest
+        self.primary_id = primary_id
+        self.client_request = client_request
+        self.view = view
+        self.seq = seq
+
+
+class Vote(Message):
+    """ A PREPARE or COMMIT. """
+
+    __slots__ = ("digest", "validator_id", "view", "seq")
+    fields = __slots__
+
+    def __init__(self, code, digest, validator_id, view, seq):
+        super().__init__(code)
+        self.digest = digest
+        self.validator_id = validator_id
+        self.view = view
+        self.seq = seq
+
+
+class Certificate(Message):
+    """ A collector's PREPARE-CERTIFICATE or COMMIT-CERTIFICATE: 2f+1 matching votes in one message. """
+
+    __slots__ = ("digest", "validator_id", "view", "seq", "signers")
+    fields = __slots__
+
+    def __init__(self, code, digest, validator_id, view, seq, signers):
+        super().__init__(code)
+        self.digest = digest
+        self.validator_id = validator_id
+        self.view = view
+        self.seq = seq
+        self.signers = signers
+
+
+class ViewChange(Message):
+    __slots__ = ("new_view", "validator_id", "prepared")
+    fields = __slots__
+
+    def __init__(self, new_view, validator_id, prepared):
+        super().__init__(VIEW_CHANGE)
+        self.new_view = new_view
+        self.validator_id = validator_id
+        self.prepared = prepared
+
+
+class NewView(Message):
+    __slots__ = ("view", "primary_id", "view_changes", "pre_prepares")
+    fields = __slots__
+
+    def __init__(self, view, primary_id, view_changes, pre_prepares):
+        super().__init__(NEW_VIEW)
+        self.view = view
+        self.primary_id = primary_id
+        self.view_changes = view_changes
+        self.pre_prepares = pre_prepares
+
+
+def encoded_size(message):
+    """ Bytes of a message as JSON, the same whether it is a record or a dict. """
+    return len(json.dumps(message, default=Message.to_dict))
@@ -2,18 +2,21 @@ from math import comb
 import sys
 import os
 
-from sklearn.cluster import KMeans
-from sklearn.metrics import calinski_harabasz_score
-
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from shard import Shard
-import matplotlib.pyplot as plt
+from cross_shard import CrossShardCoordinator
+from client_placement import ClientPlacementEngine
+from telemetry import TelemetryMonitor
+from byzantine_risk import ByzantineRiskEstimator
+from clustering_backends import get_clustering_backend, calinski_harabasz
+from server_implementation.metrics import MetricsRegistry, PhaseTracker
+from server_implementation.authenticator import HMACAuthenticator
 import numpy as np
 import random
 
 class Network:
-    def __init__(self, s_min=3, s_max=20, lambda_val=0.4, byzantine_threshold=0.3):
+    def __init__(self, s_min=3, s_max=20, lambda_val=0.4, byzantine_threshold=0.3, malicious_fraction=0.2, clustering_backend="kmeans"):
         self.shards = {}
         self.shard_centroids = {}
         self.validator_nodes = set()
@@ -25,16 +28,68 @@ class Network:
         self.completed_requests = set()
         self.prev_shard_assignments = None  # Track previous shard assignments
 
+        # Per-phase latency histograms and message counters shared by every shard
+        self.metrics = MetricsRegistry(prefix="pbft_sim")
+        self.phases = PhaseTracker(self.metrics)
+
+        self.cross_shard = None  # CrossShardCoordinator once two-phase commit is enabled
+        self.placement = None  # ClientPlacementEngine once graph-aware placement is enabled
+        self.authenticator = None  # HMACAuthenticator once protocol messages are authenticated
+        self.tentative_execution = False  # Replicas reply once prepared instead of once committed
+        self.telemetry = None  # TelemetryMonitor once resharding follows validator telemetry
+        self.risk_estimator = None  # ByzantineRiskEstimator once the shard-count penalty is simulated
+
         # Parameters for optimal sharding
         self.s_min = s_min
         self.s_max = s_max
         self.lambda_val = lambda_val
         self.byzantine_threshold = byzantine_threshold
+        self.malicious_fraction = malicious_fraction
+        self.clustering_backend = clustering_backend  # Name in clustering_backends.CLUSTERING_BACKENDS
+        get_clustering_backend(clustering_backend)  # Fail on an unknown name now, not at the first reshard
 
         self.N = len(self.validator_nodes)
-        self.K_malicious = int(self.N * 0.2)
+        self.K_malicious = int(self.N * self.malicious_fraction)
+
 
 
+    def enable_two_phase_commit(self, batch_size=32):
+        """ Run cross-shard requests through batched two-phase commit instead of forwarding them. """
+        if any(shard.runtime is not None for shard in self.shards.values()):
+            raise ValueError("Two-phase commit orders its operations synchronously and cannot run under the async runtime")
+        self.cross_shard = CrossShardCoordinator(self, batch_size=batch_size)
+        return self.cross_shard
+
+    def enable_client_placement(self, **kwargs):
+        """ Track who transacts with whom and periodically move clients to cut cross-shard traffic. """
+        self.placement = ClientPlacementEngine(self, **kwargs)
+        return self.placement
+
+    def enable_authentication(self, master_secret=b"pbft-simulation", **kwargs):
+        """ Sign every protocol message with a MAC authenticator vector and verify it on delivery. """
+        self.authenticator = HMACAuthenticator(master_secret, **kwargs)
+        return self.authenticator
+
+    def enable_tentative_execution(self):
+        """
+        Let replicas execute a request and reply as soon as it is prepared and every
+        earlier request has committed; clients accept 2f+1 matching tentative replies.
+        """
+        self.tentative_execution = True
+
+    def enable_monte_carlo_risk(self, **kwargs):
+        """
+        Penalize candidate shard counts with a Monte Carlo estimate of the chance that the
+        actual clustered assignment leaves some shard with more than f malicious validators,
+        instead of the hypergeometric tail for uniformly random shards.
+        """
+        self.risk_estimator = ByzantineRiskEstimator(**kwargs)
+        return self.risk_estimator
+
+    def enable_telemetry_resharding(self, **kwargs):
+        """ Stream validator telemetry in and reshard when shard quality or balance degrades. """
+        self.telemetry = TelemetryMonitor(self, **kwargs)
+        return self.telemetry
 
     def log_message(self, sender_id, receiver_id, message):
         """
@@ -114,8 +169,11 @@ class Network:
     def get_primary_node(self):
         return self.current_primary_node
 
-    def change_view(self):
-        pass
+    def change_view(self, shard_id=None):
+        """ Start a view change in one shard, or in every shard if no id is given. """
+        shards = self.shards.values() if shard_id is None else [self.shards[shard_id]]
+        for shard in shards:
+            shard.change_view()
 
     def track_commit_vote(self, digest, node_id):
         """ Track that a node has received 2f+1 commits and is ready to finalize. """
@@ -142,7 +200,7 @@ class Network:
 
     
     def add_shard(self, shard): # Old method of sharding within blockchain, no longer using this method.
-        self.shards.append(shard)
+        self.shards[shard.shard_id] = shard
     
     
     def find_shard_of_node(self, node_id):
@@ -161,32 +219,36 @@ class Network:
 
         # Extract feature matrix; here we use CPU rating and RAM usage (you can add more features if desired)
         X = np.array([[node.cpu_rating, node.ram_usage] for node in self.validator_nodes])
+        reputation = np.array([node.reputation_score for node in self.validator_nodes])
         
         s_values = np.arange(self.s_min, self.s_max + 1)
         ch_scores = []
         penalized_scores = []
 
-        best_kmeans = None
         best_labels = None
+        cluster = get_clustering_backend(self.clustering_backend)
 
         # Iterate over candidate shard counts
         for s in s_values:
-            # Apply K-Means clustering with s clusters
-            kmeans = KMeans(n_clusters=s, random_state=42, n_init=10)
-            labels = kmeans.fit_predict(X)
+            # Cluster into s shards with the configured backend (K-Means by default)
+            labels = cluster(X, s)
 
             # Compute the Calinski-Harabasz index (negated so lower is better)
-            ch_index = -calinski_harabasz_score(X, labels) if s > 1 else 0
+            ch_index = -calinski_harabasz(X, labels) if s > 1 else 0
             ch_scores.append(ch_index)
 
-            # Compute Byzantine risk probability for shard size = ceil(total_nodes / s)
-            n_shard_size = int(np.ceil(total_nodes / s))
-            threshold = int(np.ceil(n_shard_size * self.byzantine_threshold))
-            hypergeom_tail = 0
-            denom = comb(total_nodes, n_shard_size)
-            for k in range(threshold, n_shard_size + 1):
-                hypergeom_tail += comb(self.K_malicious, k) * comb(total_nodes - self.K_malicious, n_shard_size - k)
-            byzantine_risk = hypergeom_tail / denom
+            if self.risk_estimator:
+                # Probability that some shard of this very assignment has more than f malicious validators
+                byzantine_risk = self.risk_estimator.estimate(labels, int(total_nodes * self.malicious_fraction), reputation, X)["risk"]
+            else:
+                # Compute Byzantine risk probability for shard size = ceil(total_nodes / s)
+                n_shard_size = int(np.ceil(total_nodes / s))
+                threshold = int(np.ceil(n_shard_size * self.byzantine_threshold))
+                hypergeom_tail = 0
+                denom = comb(total_nodes, n_shard_size)
+                for k in range(threshold, n_shard_size + 1):
+                    hypergeom_tail += comb(self.K_malicious, k) * comb(total_nodes - self.K_malicious, n_shard_size - k)
+                byzantine_risk = hypergeom_tail / denom
 
             penalty = self.lambda_val * byzantine_risk * (s - self.s_min) ** 2
             penalized_score = ch_index + penalty
@@ -194,17 +256,31 @@ class Network:
 
             # Store best solution based on the combined objective
             if s == s_values[np.argmin(penalized_scores)]:
-                best_kmeans = kmeans
                 best_labels = labels
 
         opt_s = s_values[np.argmin(penalized_scores)]
         print(f"Optimal number of shards (with penalty): {opt_s}")
 
         # Assign nodes to `Shard` objects instead of just a dictionary
+        previous_shards = self.shards
+        self.merge_dropped_shards(previous_shards, opt_s)
         self.shards = {}  # Reset shard storage
         for shard_id in range(opt_s):
             self.shards[shard_id] = Shard(shard_id, self)
 
+            # Accounts, their state and the shard's place in its history stay with the shard id; only
+            # validators are regrouped, and those landing in a shard with history catch up through state transfer
+            previous_shard = previous_shards.get(shard_id)
+            if previous_shard is not None:
+                shard = self.shards[shard_id]
+                shard.state_machine = previous_shard.state_machine
+                shard.sequence_no = previous_shard.sequence_no
+                shard.view_no = previous_shard.view_no
+                shard.reply_cache = previous_shard.reply_cache
+                shard.collector = previous_shard.collector
+                for client_node in previous_shard.client_nodes.values():
+                    shard.add_client_node(client_node)
+
         for i, node in enumerate(self.validator_nodes):
             shard_id = best_labels[i]
             self.shards[shard_id].add_validator_node(node)
@@ -213,15 +289,36 @@ class Network:
         for shard in self.shards.values():
             shard.centroid = shard.compute_centroid()
 
+        if self.telemetry:
+            self.telemetry.on_reshard()
+
         print(f"Shards recomputed dynamically. Total shards: {len(self.shards)}")
 
 
     
+    def merge_dropped_shards(self, previous_shards, n_shards):
+        """
+        Before regrouping into ``n_shards`` shards, hand the clients of every shard whose id
+        goes away, with their balances and escrow, to the surviving shard ``id % n_shards``.
+        """
+        if self.cross_shard is not None:
+            self.cross_shard.flush()  # Settle queued cross-shard transfers while every shard they name still exists
+
+        for shard_id, shard in previous_shards.items():
+            target = previous_shards.get(shard_id % n_shards)
+            if shard_id < n_shards or target is None:
+                continue
+            for client_node in list(shard.client_nodes.values()):
+                if not self.migrate_client(client_node, shard, target):
+                    print(f"⚠️ Could not order the move of client {client_node.node_id} out of shard {shard_id}; its balance stays behind.")
+                    del shard.client_nodes[client_node.node_id]
+                    target.add_client_node(client_node)
+
     def add_validator_node(self, validator_node):
         self.validator_nodes.update(validator_node)
         self.recompute_shards()
         self.N = len(self.validator_nodes)
-        self.K_malicious = int(self.N * 0.2)
+        self.K_malicious = int(self.N * self.malicious_fraction)
     
         # Find the closest shard based on the centroid
         if self.shard_centroids:
@@ -242,6 +339,13 @@ class Network:
             print("No shards exist yet. Cannot assign client node.")
             return
 
+        # A returning client with transaction history goes where its counterparties are
+        preferred_shard_id = self.placement.place(client_node.node_id) if self.placement else None
+        if preferred_shard_id is not None:
+            self.shards[preferred_shard_id].add_client_node(client_node)
+            print(f"Client {client_node.node_id} assigned to shard {preferred_shard_id} (Transaction graph).")
+            return
+
         # Find the shard with the least number of client nodes
         least_populated_shard = min(self.shards.values(), key=lambda shard: len(shard.client_nodes))
         
@@ -249,3 +353,58 @@ class Network:
         least_populated_shard.add_client_node(client_node)
 
         print(f"Client {client_node.node_id} assigned to shard {least_populated_shard.shard_id} (Least populated).")
+
+    def move_client_node(self, client_id, shard_id):
+        """
+        Move a client, with its balance, to another shard.
+
+        A client with transfers in flight stays where it is: its requests and escrows
+        would otherwise complete against state it no longer lives next to.
+
+        :return: True if the client moved.
+        """
+        current_shard = self.find_shard_of_node(client_id)
+        if current_shard is None or current_shard.shard_id == shard_id:
+            return False
+
+        client_node = current_shard.client_nodes[client_id]
+        if self.has_transfers_in_flight(client_node, current_shard):
+            print(f"Client {client_id} has transfers in flight; not moving it to shard {shard_id} yet.")
+            return False
+        return self.migrate_client(client_node, current_shard, self.shards[shard_id])
+
+    def has_transfers_in_flight(self, client_node, shard):
+        """ Whether the client awaits a reply, holds an escrow, is the receiver of a transfer not yet executed, or takes part in an undecided cross-shard batch. """
+        client_id = client_node.node_id
+        if client_node.pending_requests or shard.state_machine.reservations(client_id):
+            return True
+        if any(log_entry["receiver"] == client_id for log_entry in shard.pending_requests.values()):
+            return True
+        if self.cross_shard is not None:
+            if any(client_id in (transfer["sender"], transfer["receiver"]) for batch in self.cross_shard.undecided for transfer in batch["transfers"]):
+                return True
+            return any(transfer["receiver"] == client_id for transfers in self.cross_shard.buckets.values() for transfer in transfers)
+        return False
+
+    def migrate_client(self, client_node, source, target):
+        """
+        Hand a client and its state (balance and escrow) from one shard to another.
+
+        The state leaves ``source`` and enters ``target`` through an ordered operation in
+        each, so every replica of both shards applies the move at the same point in its
+        history.
+
+        :return: True if the client moved; if ``target`` cannot order the import, the state goes back to ``source``.
+        """
+        client_id = client_node.node_id
+        exported = source.order_operation({"type": "MIGRATE-OUT", "client": client_id})
+        if exported is None:
+            return False  # The source shard could not agree, so nothing left it
+
+        if target.order_operation(dict(exported, type="MIGRATE-IN", client=client_id)) is None:
+            source.order_operation(dict(exported, type="MIGRATE-IN", client=client_id))
+            return False
+
+        del source.client_nodes[client_id]
+        target.add_client_node(client_node)
+        return True
@@ -0,0 +1,237 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def shard_specs_from_network(network):
+    """
+    Describe each shard by plain data, so it can be rebuilt inside another process.
+
+    :return: (specs, client_shards) where each spec lists the shard's validators and clients and
+             client_shards maps every client id to its shard id.
+    """
+    specs = []
+    client_shards = {}
+
+    for shard_id, shard in network.shards.items():
+        specs.append({
+            "shard_id": int(shard_id),
+            "validators": [(node.node_id, node.cpu_rating, node.ram_usage, node.reputation_score) for node in shard.validator_nodes],
+            "clients": list(shard.client_nodes),
+        })
+        for client_id in shard.client_nodes:
+            client_shards[client_id] = int(shard_id)
+
+    return specs, client_shards
+
+
+class ShardWorker:
+    def __init__(self, specs, client_shards):
+        """
+        Owns a subset of the shards in a private Network and runs their consensus.
+
+        :param specs: Shard descriptions from shard_specs_from_network for the shards this worker owns.
+        :param client_shards: Client id -> shard id for every client in the whole network, used to
+                              tell which requests cross into a shard owned by another worker.
+        """
+        self.network = Network()
+        self.client_shards = client_shards
+
+        for spec in specs:
+            shard = Shard(spec["shard_id"], self.network)
+            self.network.add_shard(shard)
+            for node_id, cpu_rating, ram_usage, reputation_score in spec["validators"]:
+                validator = ValidatorNode(node_id=node_id, network=self.network, cpu_rating=cpu_rating, ram_usage=ram_usage, reputation_score=reputation_score)
+                shard.add_validator_node(validator)
+            for client_id in spec["clients"]:
+                shard.add_client_node(ClientNode(node_id=client_id, network=self.network))
+
+    def step(self, client_requests, inbound):
+        """
+        Run one round of consensus on every owned shard.
+
+        :param client_requests: (sender id, receiver id, data) sent by clients of the owned shards.
+        :param inbound: (shard id, log entry) forwarded by other workers for the owned shards.
+        :return: Summary of the round, plus the cross-shard log entries other workers must order.
+        """
+        outbound = []
+
+        for shard_id, log_entry in inbound:
+            self.network.shards[shard_id].add_log_request(log_entry)
+
+        for sender_id, receiver_id, data in client_requests:
+            sender_shard = self.network.shards[self.client_shards[sender_id]]
+            request = sender_shard.client_nodes[sender_id].build_request(data, receiver_id)
+            log_entry = sender_shard.make_log_entry(sender_id, receiver_id, request)
+
+            # As in Shard.log_request, the receiver's shard orders the request
+            receiver_shard_id = self.client_shards[receiver_id]
+            if receiver_shard_id in self.network.shards:
+                self.network.shards[receiver_shard_id].add_log_request(log_entry)
+            else:
+                outbound.append((receiver_shard_id, log_entry))
+
+        completed_before = sum(len(shard.completed_requests) for shard in self.network.shards.values())
+        start = time.perf_counter()
+        for shard in self.network.shards.values():
+            shard.process_requests()
+        busy = time.perf_counter() - start
+        completed_after = sum(len(shard.completed_requests) for shard in self.network.shards.values())
+
+        return {"finalized": completed_after - completed_before, "busy_s": busy, "outbound": outbound}
+
+
+def worker_main(connection, specs, client_shards):
+    sys.stdout = open(os.devnull, "w")  # The protocol handlers print every message
+    worker = ShardWorker(specs, client_shards)
+    connection.send("ready")
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        connection.send(worker.step(*message))
+
+    connection.close()
+
+
+class ParallelShardRunner:
+    def __init__(self, specs, client_shards, processes=None):
+        """
+        Partition shards across worker processes and run their consensus rounds concurrently.
+
+        :param processes: Number of worker processes; 0 runs every shard in this process, one after
+                          another, as the sequential baseline.
+        """
+        self.client_shards = client_shards
+        self.processes = os.cpu_count() if processes is None else processes
+        self.pending_inbound = []
+
+        if self.processes == 0:
+            self.local = ShardWorker(specs, client_shards)
+            self.owner = {spec["shard_id"]: 0 for spec in specs}
+            return
+
+        # Greedy balance on the per-request cost, which grows with the square of shard size
+        loads = [0] * self.processes
+        partitions = [[] for _ in range(self.processes)]
+        self.owner = {}
+        for spec in sorted(specs, key=lambda spec: len(spec["validators"]), reverse=True):
+            worker = loads.index(min(loads))
+            partitions[worker].append(spec)
+            loads[worker] += len(spec["validators"]) ** 2
+            self.owner[spec["shard_id"]] = worker
+
+        self.connections = []
+        self.workers = []
+        for partition in partitions:
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=worker_main, args=(child_end, partition, client_shards), daemon=True)
+            process.start()
+            self.connections.append(parent_end)
+            self.workers.append(process)
+
+        for connection in self.connections:
+            connection.recv()  # Wait until every worker has built its shards
+
+    def run_round(self, client_requests):
+        """
+        :param client_requests: (sender id, receiver id, data) for this round.
+        :return: Number of requests finalized across all shards this round.
+        """
+        n_workers = max(self.processes, 1)
+        requests_by_worker = [[] for _ in range(n_workers)]
+        inbound_by_worker = [[] for _ in range(n_workers)]
+
+        for request in client_requests:
+            requests_by_worker[self.owner[self.client_shards[request[0]]]].append(request)
+        for shard_id, log_entry in self.pending_inbound:
+            inbound_by_worker[self.owner[shard_id]].append((shard_id, log_entry))
+
+        if self.processes == 0:
+            summaries = [self.local.step(requests_by_worker[0], inbound_by_worker[0])]
+        else:
+            for connection, requests, inbound in zip(self.connections, requests_by_worker, inbound_by_worker):
+                connection.send((requests, inbound))
+            summaries = [connection.recv() for connection in self.connections]
+
+        # Cross-shard requests are delivered to their owning worker in the next round
+        self.pending_inbound = [entry for summary in summaries for entry in summary["outbound"]]
+        return sum(summary["finalized"] for summary in summaries)
+
+    def drain(self):
+        """ Run empty rounds until every forwarded cross-shard request has been ordered. """
+        finalized = 0
+        while self.pending_inbound:
+            finalized += self.run_round([])
+        return finalized
+
+    def close(self):
+        if self.processes == 0:
+            return
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.workers:
+            process.join()
+
+
+def build_network(n_validators, n_shards, n_clients, seed):
+    """ Build a network clustered into exactly ``n_shards`` shards. """
+    random.seed(seed)
+    network = Network(s_min=n_shards, s_max=n_shards)
+    network.add_validator_node([
+        ValidatorNode(node_id=i, network=network, cpu_rating=random.uniform(1, 10), reputation_score=random.uniform(0, 1), ram_usage=random.uniform(1, 16))
+        for i in range(n_validators)
+    ])
+    for i in range(n_clients):
+        network.add_client_node(ClientNode(node_id=n_validators + i, network=network))
+    return network
+
+
+def run(specs, client_shards, processes, rounds, requests_per_round, seed):
+    rng = random.Random(seed)
+    clients = sorted(client_shards)
+    runner = ParallelShardRunner(specs, client_shards, processes=processes)
+
+    finalized = 0
+    start = time.perf_counter()
+    for round_no in range(rounds):
+        batch = [(rng.choice(clients), rng.choice(clients), f"transfer {round_no}.{i}") for i in range(requests_per_round)]
+        finalized += runner.run_round(batch)
+    finalized += runner.drain()
+    elapsed = time.perf_counter() - start
+    runner.close()
+
+    return {"processes": processes, "finalized": finalized, "elapsed_s": elapsed, "throughput_rps": finalized / elapsed}
+
+
+def main():
+    n_validators = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    n_shards = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rounds, requests_per_round, seed = 10, 40, 42
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    network = build_network(n_validators, n_shards, n_clients=200, seed=seed)
+    sys.stdout = stdout
+    specs, client_shards = shard_specs_from_network(network)
+
+    baseline = None
+    for processes in sorted({0, 2, 4, os.cpu_count()}):
+        sys.stdout = open(os.devnull, "w")
+        result = run(specs, client_shards, processes, rounds, requests_per_round, seed)
+        sys.stdout = stdout
+
+        baseline = baseline or result["throughput_rps"]
+        result["speedup"] = result["throughput_rps"] / baseline
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
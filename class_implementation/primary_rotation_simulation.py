@@ -0,0 +1,94 @@
+import contextlib
+import io
+import random
+import sys
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+from primary_scheduler import RoundRobinScheduler, ReputationScheduler
+
+
+def build_shard(n_validators, base_timeout, rng):
+    network = Network()
+    shard = Shard(shard_id=0, network=network, base_timeout=base_timeout)
+    network.add_shard(shard)
+
+    for i in range(n_validators):
+        shard.add_validator_node(ValidatorNode(node_id=i, network=network, shard=shard, reputation_score=rng.uniform(0, 1), cpu_rating=rng.uniform(1, 10)))
+
+    clients = [ClientNode(node_id=n_validators + i, network=network, shard=shard) for i in range(2)]
+    for client in clients:
+        shard.add_client_node(client)
+
+    return shard, clients
+
+
+def run(scheduler, n_validators=10, duration=600.0, tick=0.1, base_timeout=1.0, stall_rate=0.05, recovery_time=20.0, seed=42):
+    """
+    Send one request per tick while primaries stall at random and measure view changes, the time
+    the shard finalized nothing, and how long requests took to finalize. The offered load stays below
+    what the shard can order, so every request finalizes eventually and the schedulers differ only in
+    how long requests waited out stalled primaries.
+
+    A primary stalls with a rate (per simulated second) of ``stall_rate`` scaled by how unreliable
+    and slow it is, (1 - reputation_score) + (1 - cpu_rating / 10), and comes back after ``recovery_time``.
+
+    :param scheduler: "round-robin" or "reputation".
+    """
+    rng = random.Random(seed)
+    shard, clients = build_shard(n_validators, base_timeout, rng)
+    if scheduler == "reputation":
+        shard.set_scheduler(ReputationScheduler(shard))
+    else:
+        shard.set_scheduler(RoundRobinScheduler(shard))
+
+    stalls = 0
+    step = 0
+    submitted = {}  # digest -> clock when the request reached the shard
+    while shard.clock < duration:
+        primary = shard.current_primary_node
+        hazard = stall_rate * ((1 - primary.reputation_score) + (1 - primary.cpu_rating / 10))
+        if not primary.is_faulty and not primary.in_view_change and rng.random() < hazard * tick:
+            shard.fail_node(primary)
+            shard.schedule(recovery_time, lambda node=primary: shard.recover_node(node))
+            stalls += 1
+
+        clients[0].create_request(f"transfer {step}", clients[1].get_node_id())
+        submitted.update((digest, shard.clock) for digest in shard.pending_requests if digest not in submitted)
+        shard.process_requests()
+        shard.advance_time(tick)
+        step += 1
+
+    # Time the shard finalized nothing although requests were waiting
+    completions = [clock for clock, _ in shard.completion_log]
+    stalled = sum(later - earlier for earlier, later in zip(completions, completions[1:]) if later - earlier > 2 * tick)
+    latencies = sorted(clock - submitted[digest] for clock, digest in shard.completion_log if digest in submitted)
+
+    return {
+        "scheduler": scheduler,
+        "primary_stalls": stalls,
+        "view_changes": len(shard.view_change_log),
+        "view_changes_per_min": len(shard.view_change_log) / duration * 60,
+        "stalled_s": stalled,
+        "mean_latency_s": sum(latencies) / len(latencies),
+        "p99_latency_s": latencies[int(0.99 * (len(latencies) - 1))],
+        "finalized": len(shard.completed_requests),
+        "unfinished": len(submitted) - len(latencies),
+    }
+
+
+def main():
+    seeds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    for scheduler in ("round-robin", "reputation"):
+        results = []
+        for seed in range(seeds):
+            with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+                results.append(run(scheduler, seed=seed))
+        summary = {key: sum(result[key] for result in results) / seeds for key in ("primary_stalls", "view_changes_per_min", "stalled_s", "mean_latency_s", "p99_latency_s", "unfinished")}
+        print(f"{scheduler}: {summary}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+class RoundRobinScheduler:
+    def __init__(self, shard):
+        """ The PBFT default: the primary of view v is validator v mod n, in the order validators joined. """
+        self.shard = shard
+
+    def primary_for_view(self, view_no):
+        return self.shard.validator_nodes[view_no % len(self.shard.validator_nodes)]
+
+    def on_membership_change(self):
+        pass
+
+    def on_view_change(self, old_primary, old_view, new_view, new_primary):
+        pass
+
+
+class ReputationScheduler:
+    def __init__(self, shard, reputation_weight=0.7, cpu_weight=0.3, demotion_penalty=0.1, demotion_period=60.0, slots_per_node=4):
+        """
+        Rotate primaries through a precomputed order in which reliable, fast validators
+        hold more slots.
+
+        A validator's weight is ``reputation_weight * reputation_score + cpu_weight *
+        cpu_rating / max cpu_rating``, multiplied by ``demotion_penalty`` for every view
+        change it caused within the last ``demotion_period`` simulated seconds. The order
+        is a smooth weighted round-robin over those weights, so heavy validators are
+        spread out rather than bunched, and no validator holds two views in a row. It is
+        counted from the view after the installed one and never starts with the installed
+        primary, so a view change never hands the next view straight back to the primary
+        that just stalled.
+
+        Every replica derives the same order from the same inputs: the shard's
+        membership, the scores and the view-change history. The order is only
+        rebuilt once a new view is installed, and the installed view keeps the
+        primary that announced it, so replicas validating a NEW-VIEW agree on
+        who had to send it.
+
+        :param slots_per_node: Length of the precomputed order, per validator.
+        """
+        self.shard = shard
+        self.reputation_weight = reputation_weight
+        self.cpu_weight = cpu_weight
+        self.demotion_penalty = demotion_penalty
+        self.demotion_period = demotion_period
+        self.slots_per_node = slots_per_node
+
+        self.demotions = {}  # node id -> clock times at which it caused a view change
+        self.order = []
+        self.installed = (None, None)  # (view, primary) most recently installed
+
+    def weight(self, node, max_cpu):
+        score = self.reputation_weight * node.reputation_score + self.cpu_weight * node.cpu_rating / max_cpu
+        strikes = len(self.demotions.get(node.node_id, ()))
+        return max(score, 1e-6) * self.demotion_penalty ** strikes
+
+    def rebuild(self):
+        """ Drop lapsed demotions and precompute the order. """
+        now = self.shard.clock
+        for node_id in list(self.demotions):
+            self.demotions[node_id] = [at for at in self.demotions[node_id] if now - at < self.demotion_period]
+            if not self.demotions[node_id]:
+                del self.demotions[node_id]
+
+        nodes = self.shard.validator_nodes
+        if not nodes:
+            self.order = []
+            return
+        max_cpu = max(node.cpu_rating for node in nodes) or 1.0
+        weights = [self.weight(node, max_cpu) for node in nodes]
+        total = sum(weights)
+
+        # Smooth weighted round-robin: each slot goes to the highest running credit, which then pays the total
+        credit = [0.0] * len(nodes)
+        order = []
+        for _ in range(self.slots_per_node * len(nodes)):
+            for i, weight in enumerate(weights):
+                credit[i] += weight
+            best = max(range(len(nodes)), key=lambda i: (credit[i], -i))
+            previous = order[-1] if order else self.installed[1]
+            if nodes[best] is previous and len(nodes) > 1:
+                best = max((i for i in range(len(nodes)) if nodes[i] is not previous), key=lambda i: (credit[i], -i))
+            credit[best] -= total
+            order.append(nodes[best])
+        self.order = order
+
+    def primary_for_view(self, view_no):
+        installed_view, installed_primary = self.installed
+        if view_no == installed_view:
+            return installed_primary
+        offset = view_no if installed_view is None else view_no - installed_view - 1
+        return self.order[offset % len(self.order)]
+
+    def on_membership_change(self):
+        self.rebuild()
+
+    def on_view_change(self, old_primary, old_view, new_view, new_primary):
+        """ Demote the primary that stalled and every scheduled primary that failed to announce a view in between. """
+        stalled = [old_primary] + [self.primary_for_view(view_no) for view_no in range(old_view + 1, new_view)]
+        for node in stalled:
+            if node is not None and node is not new_primary:
+                self.demotions.setdefault(node.node_id, []).append(self.shard.clock)
+
+        self.installed = (new_view, new_primary)
+        self.rebuild()
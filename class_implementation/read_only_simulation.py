@@ -0,0 +1,84 @@
+import contextlib
+import io
+import random
+import sys
+import time
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def messages_sent(network):
+    """ Protocol messages sent so far, by type. """
+    family = network.metrics.families.get("messages_sent_total")
+    if family is None:
+        return {}
+    return {dict(labels)["type"]: counter.value for labels, counter in family[3].items()}
+
+
+def run(read_only, n_requests=2000, read_ratio=0.9, f=1, n_clients=20, batch_size=16, crashed=0, seed=42):
+    """
+    Send a read-heavy workload through one shard of 3f+1 validators.
+
+    :param read_only: Mark reads as read-only so they skip ordering, or order everything.
+    :param read_ratio: Share of requests that are balance reads; the rest are transfers.
+    :param crashed: Backups to crash before the workload starts.
+    """
+    rng = random.Random(seed)
+    network = Network()
+    shard = Shard(shard_id=0, network=network)
+    network.add_shard(shard)
+
+    validators = [ValidatorNode(node_id=i, network=network, shard=shard) for i in range(3 * f + 1)]
+    for validator in validators:
+        shard.add_validator_node(validator)
+    for validator in validators[1:crashed + 1]:
+        shard.fail_node(validator)
+
+    clients = [ClientNode(node_id=len(validators) + i, network=network, shard=shard) for i in range(n_clients)]
+    for client in clients:
+        shard.add_client_node(client)
+
+    reads = 0
+    answered = 0
+    start = time.perf_counter()
+    for i in range(n_requests):
+        sender, receiver = rng.sample(clients, 2)
+        if rng.random() < read_ratio:
+            reads += 1
+            request = sender.create_request({"operation": "balance"}, receiver.get_node_id(), read_only=read_only)
+            answered += request["transaction"]["timestamp"] not in sender.pending_requests
+        else:
+            sender.create_request({"operation": "transfer", "amount": rng.randint(1, 20)}, receiver.get_node_id())
+
+        if (i + 1) % batch_size == 0 or i + 1 == n_requests:
+            shard.process_requests()
+    elapsed = time.perf_counter() - start
+
+    sent = messages_sent(network)
+    return {
+        "read_only": read_only,
+        "f": f,
+        "crashed": crashed,
+        "reads": reads,
+        "reads_answered_in_one_round_trip": answered if read_only else 0,
+        "finalized": len(shard.completed_requests),
+        "pbft_messages": sum(count for message_type, count in sent.items() if message_type != "READ"),
+        "read_messages": sent.get("READ", 0),
+        "elapsed_s": round(elapsed, 3),
+    }
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    for f, crashed in ((1, 0), (2, 0), (2, 2)):
+        for read_only in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+                result = run(read_only, n_requests=n_requests, f=f, crashed=crashed)
+            print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,50 @@
 import numpy as np
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from state_machine import KeyValueStateMachine
+from state_transfer import StateTransfer
+from primary_scheduler import RoundRobinScheduler
+from messages import encoded_size
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from server_implementation.reply_cache import ReplyCache, NEW, CACHED, IN_PROGRESS, STALE
+
+# Validator handler for each message type code, in the order of messages.MESSAGE_TYPES
+HANDLERS = (
+    "receive_preprepare", "receive_prepare", "receive_commit", "receive_prepare_certificate",
+    "receive_commit_certificate", "receive_view_change", "receive_new_view",
+)
+
+
+class Timer:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline, callback):
+        """ A callback scheduled on a shard's simulated clock; cancel() stops it firing. """
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
 
 class Shard:
-    def __init__(self, shard_id, network):
+    __slots__ = (
+        "client_nodes", "validator_nodes", "global_message_log", "shard_requests", "current_primary_node", "commit_votes",
+        "network", "completed_requests", "shard_id", "global_requests", "pending_requests", "centroid", "view_no",
+        "sequence_no", "base_timeout", "clock", "timers", "timer_ids", "view_change_log", "completion_log", "runtime",
+        "scheduler", "collector", "state_machine", "commit_seqs", "reply_cache", "request_clients", "state_transfers", "operation_results",
+    )
+
+    def __init__(self, shard_id, network, base_timeout=5.0):
         self.client_nodes = {}
         self.validator_nodes = []
         self.global_message_log = []
@@ -12,8 +55,30 @@ class Shard:
         self.completed_requests = set()
         self.shard_id = shard_id
         self.global_requests = []
+        self.pending_requests = {}  # digest -> logged request not yet finalized, in arrival order
         self.centroid = self.compute_centroid()
 
+        # View changes run on a simulated clock so timeouts cost no wall-clock time
+        self.view_no = 0
+        self.sequence_no = 0
+        self.base_timeout = base_timeout
+        self.clock = 0.0
+        self.timers = []  # Heap of (deadline, tie-breaker, Timer)
+        self.timer_ids = itertools.count()
+        self.view_change_log = []  # (clock, new view, new primary id)
+        self.completion_log = []  # (clock, digest) for every finalized request
+        self.runtime = None  # Set by AsyncNetworkRuntime to deliver messages with simulated link delays
+        self.scheduler = RoundRobinScheduler(self)  # Decides the primary of every view
+        self.collector = None  # None for all-to-all votes, or "primary" / "rotating" to route them through a collector
+
+        # Replicated key-value state (client balances) and the keys locked by in-flight cross-shard transactions
+        self.state_machine = KeyValueStateMachine(initial_balance=100)
+        self.commit_seqs = {}  # digest -> sequence number it was committed at
+        self.reply_cache = ReplyCache()  # Recent replies per client, so retransmissions skip consensus
+        self.request_clients = {}  # digest -> (client id, timestamp) of requests being ordered
+        self.state_transfers = []  # Reports of validators that caught up on joining
+        self.operation_results = {}  # digest -> results of an operation issued by order_operation, once executed
+
 
     def get_shard_id(self):
         return self.shard_id
@@ -28,18 +93,68 @@ class Shard:
 
     
     def add_validator_node(self, validator_node):
-        self.validator_nodes.append(validator_node)
+        # A validator that comes from another shard, or is new, knows nothing of this shard's state
+        previous_shard = validator_node.shard
+        needs_state = self.state_machine.last_applied > 0 and (previous_shard is None or previous_shard.state_machine is not self.state_machine)
 
-        # If no primary exists, set the first node as primary
-        if not self.current_primary_node:
-            self.current_primary_node = validator_node
-            validator_node.isPrimary = True
+        self.validator_nodes.append(validator_node)
+        self.scheduler.on_membership_change()
 
+        validator_node.isPrimary = False  # May still be set from a previous shard assignment
+        validator_node.view_no = self.view_no
         validator_node.shard = self
+        validator_node.state_machine = self.state_machine  # Until a state transfer installs the node's own copy
+        validator_node.last_applied = 0 if needs_state else self.state_machine.last_applied
+
+        # Until the shard has ordered anything, the scheduler picks the primary (round-robin: the first node added)
+        if not self.current_primary_node or self.sequence_no == 0:
+            self.set_primary(self.primary_for_view(self.view_no))
+
+        if needs_state and len(self.validator_nodes) > 1:
+            self.transfer_state(validator_node)
+
+    def transfer_state(self, validator_node, **kwargs):
+        """ Catch a joining validator up from a snapshot served by its new peers. """
+        report = StateTransfer(self, validator_node, **kwargs).run()
+        self.state_transfers.append(report)
+        print(f"📦 Node {validator_node.node_id} caught up on shard {self.shard_id}: snapshot at seq {report['snapshot_seq']}, {report['replayed']} log entries replayed, {report['transfer_s']:.3f}s transfer.")
+        return report
         
     def add_log_request(self, log_entry):
+        """
+        Start ordering a request unless it is a retransmission.
+
+        :return: (status, digest) where status is NEW (digest of the instance just started), CACHED
+                 (the cached reply was sent again), IN_PROGRESS (digest of the instance still ordering
+                 it) or STALE (dropped; digest is None).
+        """
+        # A retransmitted client request is answered from the reply cache or dropped while still being ordered
+        transaction = log_entry["request"]["transaction"]
+        client_id, timestamp = transaction.get("client_node_id"), transaction.get("timestamp")
+        if client_id is not None and timestamp is not None:
+            status, cached = self.reply_cache.check(client_id, timestamp)
+            if status != NEW:
+                self.network.metrics.counter("duplicate_requests_total", "Retransmitted requests answered without consensus", shard=self.shard_id, outcome=status).inc()
+                if status == CACHED:
+                    self.send_reply(client_id, cached)
+                    return CACHED, cached["digest"]
+                if status == IN_PROGRESS:
+                    return IN_PROGRESS, cached
+                return STALE, None
+
         self.global_requests.append(log_entry)
 
+        # Every replica sees the request and starts a timer for it to commit
+        digest = hashlib.sha256(json.dumps(log_entry).encode()).hexdigest()
+        self.pending_requests[digest] = log_entry
+        if client_id is not None and timestamp is not None:
+            self.reply_cache.begin(client_id, timestamp, digest)
+            self.request_clients[digest] = (client_id, timestamp)
+        for validator_node in self.validator_nodes:
+            validator_node.start_request_timer(digest)
+
+        return NEW, digest
+
 
     def log_message(self, sender_id, receiver_id, message):
         """
@@ -54,23 +169,39 @@ class Shard:
         self.global_message_log.append(log_entry)
         print(f"LOGGED MESSAGE: {log_entry}")  # Debugging output
 
-    def log_request(self, sender_id, receiver_id, request):
-        """
-        Log a request for the primary node to see.
-        """
-        log_entry = {
+    def read_only_request(self, request):
+        """ Send a read-only request to every validator at once and collect the replies they send back. """
+        metrics = self.network.metrics
+        metrics.counter("messages_sent_total", "Protocol messages delivered", type="READ").inc(len(self.validator_nodes))
+        replies = [validator_node.answer_read(request) for validator_node in self.validator_nodes]
+        return [reply for reply in replies if reply is not None]
+
+    def make_log_entry(self, sender_id, receiver_id, request):
+        return {
             "sender": sender_id,
             "receiver": receiver_id,
             "request": request,
             "timestamp": self.get_timestamp()
         }
 
+    def log_request(self, sender_id, receiver_id, request):
+        """
+        Log a request for the primary node to see.
+        """
+        log_entry = self.make_log_entry(sender_id, receiver_id, request)
+
         sender_shard = self.network.find_shard_of_node(sender_id)
         receiver_shard = self.network.find_shard_of_node(receiver_id)
 
+        if self.network.placement is not None:
+            self.network.placement.record(sender_id, receiver_id)
+
         if sender_shard == receiver_shard:
             print("Both Sender and Receiver Client Nodes are in the same shard")
             self.add_log_request(log_entry)
+        elif sender_shard != receiver_shard and self.network.cross_shard is not None:
+            print(" Sender and Receiver Client Nodes are not in the same shard, running two-phase commit across both shards.")
+            self.network.cross_shard.submit(sender_shard, receiver_shard, log_entry)
         elif sender_shard != receiver_shard:
             print(" Sender and Receiver Client Nodes are not in the same shard, sending request over to receiver shard.")
             receiver_shard.add_log_request(log_entry)
@@ -79,6 +210,9 @@ class Shard:
 
         
 
+    def max_faulty_nodes(self):
+        return (len(self.validator_nodes) - 1) // 3
+
     def required_prepare_threshold(self):
         """ Return 2f+1 threshold for PBFT consensus. """
         f = (len(self.validator_nodes) - 1) // 3  # Maximum Byzantine nodes
@@ -89,15 +223,76 @@ class Shard:
         f = (len(self.validator_nodes) - 1) // 3
         return 2 * f + 1
 
+    def set_collector_mode(self, collector="primary"):
+        """
+        Route PREPARE and COMMIT votes through a collector instead of sending them all-to-all.
+
+        The collector aggregates 2f+1 votes into one certificate and broadcasts it, so
+        each phase costs O(n) messages instead of O(n^2).
+
+        :param collector: "primary" to collect at the primary, "rotating" to spread the
+                          work over all validators by (view + seq), or None for all-to-all.
+        """
+        if collector not in (None, "primary", "rotating"):
+            raise ValueError(f"Unknown collector mode {collector!r}")
+        self.collector = collector
+
+    def collector_for(self, view, seq):
+        if self.collector == "rotating" and seq is not None:
+            return self.validator_nodes[(view + seq) % len(self.validator_nodes)]
+        return self.current_primary_node
+
     def broadcast(self, message, exclude=[]):
-        for validator_node in self.validator_nodes:
-            if validator_node not in exclude:
-                if message["type"] == "PRE-PREPARE":
-                    validator_node.receive_preprepare(message)
-                elif message["type"] == "PREPARE":
-                    validator_node.receive_prepare(message)
-                elif message["type"] == "COMMIT":
-                    validator_node.receive_commit(message)
+        self.multicast(message, [validator_node for validator_node in self.validator_nodes if validator_node not in exclude])
+
+    def multicast(self, message, receivers):
+        metrics = self.network.metrics
+        message_type = message.type
+        fan_out = len(receivers)
+        if self.network.authenticator is not None:
+            self.network.authenticator.sign(self.message_sender(message), message, [validator_node.node_id for validator_node in receivers])
+        metrics.counter("messages_sent_total", "Protocol messages delivered", type=message_type).inc(fan_out)
+        size = encoded_size(message)
+        metrics.counter("bytes_sent_total", "Protocol message bytes delivered", type=message_type).inc(fan_out * size)
+        start = time.perf_counter()
+
+        if self.runtime is not None:
+            # Hand the message to the asyncio runtime, which delivers it after the link delay
+            self.runtime.transmit(self, message, receivers, size)
+            return
+
+        for validator_node in receivers:
+            self.deliver(validator_node, message)
+
+        # Delivery is synchronous, so this includes the handlers the broadcast triggered
+        metrics.histogram("broadcast_seconds", "Duration of a broadcast including nested handlers", type=message_type).observe(time.perf_counter() - start)
+
+    def message_sender(self, message):
+        return message.get("validator_id", message.get("primary_id"))
+
+    def deliver(self, validator_node, message, verified=False):
+        """
+        Hand one protocol message to a validator's handler.
+
+        :param verified: The caller already checked the message's authenticator, e.g. in a batch.
+        """
+        if validator_node.is_faulty:
+            return
+
+        authenticator = self.network.authenticator
+        if authenticator is not None and not verified and not authenticator.verify(validator_node.node_id, message, self.message_sender(message)):
+            self.network.metrics.counter("auth_failures_total", "Messages dropped for a missing or bad authenticator", shard=self.shard_id, type=message.type).inc()
+            return
+
+        getattr(validator_node, HANDLERS[message.code])(message)
+
+    def start_phase_timer(self, digest, log_entry):
+        """ Start a request's phase timers from the moment it was logged with the shard. """
+        logged_at = datetime.fromisoformat(log_entry["timestamp"]).timestamp() if "timestamp" in log_entry else None
+        self.network.phases.start(digest, logged_at)
+
+    def mark_phase(self, digest, phase):
+        self.network.phases.mark(digest, phase)
 
     def get_global_message_log(self):
         """
@@ -136,13 +331,116 @@ class Shard:
     def get_primary_node(self):
         return self.current_primary_node
 
+    def next_sequence(self):
+        self.sequence_no += 1
+        return self.sequence_no
+
+    def primary_for_view(self, view_no):
+        return self.scheduler.primary_for_view(view_no)
+
+    def set_scheduler(self, scheduler):
+        """ Replace the primary rotation, e.g. with a ReputationScheduler, and let it pick the current primary. """
+        self.scheduler = scheduler
+        scheduler.on_membership_change()
+        if self.validator_nodes and self.sequence_no == 0:
+            self.set_primary(self.primary_for_view(self.view_no))
+
+    def set_primary(self, primary):
+        if self.current_primary_node is not None:
+            self.current_primary_node.isPrimary = False
+        self.current_primary_node = primary
+        primary.isPrimary = True
+
+    def install_view(self, view_no, primary, max_seq=0, reproposed=()):
+        """ Record that ``primary`` has announced ``view_no`` and now orders requests. """
+        self.scheduler.on_view_change(self.current_primary_node, self.view_no, view_no, primary)
+        self.set_primary(primary)
+        self.view_no = view_no
+
+        # Sequence numbers handed out in the old view that nobody prepared will never commit: execute them as null requests
+        # Live replicas that were up to date execute the null requests too
+        applied = self.state_machine.last_applied
+        up_to_date = [validator_node for validator_node in self.validator_nodes if not validator_node.is_faulty and validator_node.last_applied >= applied]
+        for seq in range(applied + 1, self.sequence_no + 1):
+            if seq not in reproposed:
+                executed = self.apply_batch(seq, None, [])
+                for validator_node in up_to_date:
+                    validator_node.mark_applied()
+                self.execute_batches(executed)
+        self.sequence_no = max(self.sequence_no, max_seq)
+        self.view_change_log.append((self.clock, view_no, primary.node_id))
+        self.network.metrics.counter("view_changes_total", "Completed view changes", shard=self.shard_id).inc()
+
     def change_view(self):
-        pass
+        """ Have every live replica vote to move to the next view, e.g. when the primary is known to be faulty. """
+        for validator_node in self.validator_nodes:
+            validator_node.start_view_change(self.view_no + 1)
+        self.advance_time(0)
+
+    def fail_node(self, validator_node):
+        """ Crash a validator: from now on it ignores every message and timer. """
+        validator_node.is_faulty = True
+        for digest in list(validator_node.request_timers):
+            validator_node.stop_request_timer(digest)
+
+    def recover_node(self, validator_node):
+        """ Restart a crashed validator; it rejoins in the shard's current view. """
+        validator_node.is_faulty = False
+        validator_node.failed_view_changes = 0
+        validator_node.enter_view(self.view_no)
+        for digest in self.pending_requests:
+            validator_node.start_request_timer(digest)
+
+    def schedule(self, delay, callback):
+        timer = Timer(self.clock + delay, callback)
+        heapq.heappush(self.timers, (timer.deadline, next(self.timer_ids), timer))
+        return timer
+
+    def advance_time(self, delta):
+        """ Move the simulated clock forward, firing every timer that falls due on the way. """
+        target = self.clock + delta
+        while self.timers and self.timers[0][0] <= target:
+            deadline, _, timer = heapq.heappop(self.timers)
+            if timer.cancelled:
+                continue
+            self.clock = deadline
+            timer.callback()
+        self.clock = target
+
+    def process_requests(self):
+        """ One round of the normal case: the primary proposes every pending request and the replicas prepare them. """
+        primary = self.current_primary_node
+        if primary is not None and not primary.is_faulty:
+            for log_entry in list(self.pending_requests.values()):
+                primary.handle_request(log_entry)
+
+        for validator_node in self.validator_nodes:
+            if not validator_node.is_faulty and validator_node.pending_prepares:
+                validator_node.process_prepare()
+
+    def order_operation(self, operation):
+        """
+        Run one PBFT instance on an operation the shard itself issues, e.g. a cross-shard batch.
 
-    def track_commit_vote(self, digest, node_id):
+        :return: The state machine's result for the operation, or None if it was not finalized and executed.
+        """
+        transaction = {"operation": operation, "client_node_id": None, "receiver": None}
+        request = {"digest": hashlib.sha256(json.dumps(transaction).encode()).hexdigest(), "transaction": transaction}
+        _, digest = self.add_log_request(self.make_log_entry(None, None, request))
+        self.operation_results[digest] = None
+        self.process_requests()
+        results = self.operation_results.pop(digest)
+        return results[0] if results is not None else None
+
+    def balance_of(self, client_id):
+        return self.state_machine.balance_of(client_id)
+
+    def track_commit_vote(self, digest, node_id, seq=None):
         """ Track that a node has received 2f+1 commits and is ready to finalize. """
         if digest not in self.commit_votes:
             self.commit_votes[digest] = set()
+        if seq is not None:
+            self.commit_seqs.setdefault(digest, seq)
 
         self.commit_votes[digest].add(node_id)
 
@@ -157,8 +455,62 @@ class Shard:
             return
         
         self.completed_requests.add(digest)
+        log_entry = self.pending_requests.pop(digest, None)
+        seq = self.commit_seqs.pop(digest, None)
+        executed = None
+        if log_entry is not None and seq is not None:
+            executed = self.apply_batch(seq, digest, [log_entry["request"]["transaction"]])
+        voters = self.commit_votes.get(digest, ())
+        for validator_node in self.validator_nodes:
+            if validator_node.node_id in voters:
+                validator_node.mark_applied()  # Only the validators that committed the request have executed it
+        self.execute_batches(executed)
+        self.completion_log.append((self.clock, digest))
+        for validator_node in self.validator_nodes:
+            validator_node.stop_request_timer(digest)
+        self.mark_phase(digest, "reply")
+        if self.runtime is not None:
+            self.runtime.on_finalized(self, digest)
         print(f"✅✅ Network: Request {digest[:8]} has been finalized and executed!")
 
+    def apply_batch(self, seq, digest, operations):
+        """ Execute a finalized batch on the shard state and on every validator's own copy of it. """
+        replicas = {id(node.state_machine): node.state_machine for node in self.validator_nodes if node.state_machine is not self.state_machine}
+        for replica in replicas.values():
+            replica.apply_batch(seq, digest, operations)
+        return self.state_machine.apply_batch(seq, digest, operations)
+
+    def execute_batches(self, executed):
+        """ Reply to the client of every batch the state machine just executed, stamped with one fresh state root. """
+        if not executed:
+            return
+        state_root = self.state_machine.state_root()
+        for digest, results in executed:
+            if digest in self.operation_results:
+                self.operation_results[digest] = results
+            client = self.request_clients.pop(digest, None)
+            if client is None:
+                continue
+            reply = {"type": "REPLY", "digest": digest, "timestamp": client[1], "results": results, "state_root": state_root}
+            self.reply_cache.store(client[0], client[1], reply)
+            self.send_reply(client[0], reply)
+
+        if self.network.tentative_execution:
+            # The executed requests are committed now, and the next prepared one may run tentatively
+            for validator_node in self.validator_nodes:
+                for digest, _ in executed:
+                    validator_node.tentative_executions.pop(digest, None)
+                validator_node.execute_tentatively()
+
+    def send_reply(self, client_id, reply):
+        client_node = self.client_nodes.get(client_id)
+        if client_node is None:
+            sender_shard = self.network.find_shard_of_node(client_id)  # Requests forwarded from another shard
+            client_node = sender_shard.client_nodes.get(client_id) if sender_shard is not None else None
+        if client_node is not None and hasattr(client_node, "receive_reply"):
+            if client_node.receive_reply(reply) and reply.get("tentative") and self.runtime is not None:
+                self.runtime.on_tentative_accepted(reply["digest"])
+
     def get_completed_requests(self):
         return self.completed_requests
 
@@ -0,0 +1,346 @@
+import hashlib
+import json
+
+EMPTY_HASH = hashlib.sha256(b"").hexdigest()
+
+
+class MerkleState:
+    def __init__(self, n_buckets=1024):
+        """
+        Key-value store with a Merkle root that is updated incrementally.
+
+        Keys are hashed into a fixed number of buckets, the leaves of a complete
+        binary tree stored heap-style in ``nodes`` (root at 1, leaves from
+        ``n_buckets``). A write only marks its bucket dirty; ``root()`` rehashes
+        the dirty buckets and the paths above them, so a batch touching k keys
+        costs O(k log n_buckets) hashes instead of rehashing the whole state.
+
+        :param n_buckets: Number of leaves; rounded up to a power of two.
+        """
+        self.n_buckets = 1
+        while self.n_buckets < n_buckets:
+            self.n_buckets *= 2
+
+        self.buckets = [{} for _ in range(self.n_buckets)]
+        self.nodes = [EMPTY_HASH] * (2 * self.n_buckets)
+        for i in range(self.n_buckets - 1, 0, -1):
+            self.nodes[i] = hash_pair(self.nodes[2 * i], self.nodes[2 * i + 1])
+        self.dirty = set()
+        self.changed_since_snapshot = set(range(self.n_buckets))
+
+    def bucket_of(self, key):
+        return int(hashlib.sha256(repr(key).encode()).hexdigest()[:8], 16) % self.n_buckets
+
+    def get(self, key, default=None):
+        return self.buckets[self.bucket_of(key)].get(key, default)
+
+    def put(self, key, value):
+        bucket = self.bucket_of(key)
+        self.buckets[bucket][key] = value
+        self.dirty.add(bucket)
+        self.changed_since_snapshot.add(bucket)
+
+    def delete(self, key):
+        bucket = self.bucket_of(key)
+        if self.buckets[bucket].pop(key, None) is not None:
+            self.dirty.add(bucket)
+            self.changed_since_snapshot.add(bucket)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.buckets)
+
+    def items(self):
+        for bucket in self.buckets:
+            yield from bucket.items()
+
+    def root(self):
+        """ Rehash the buckets written since the last call and return the state root. """
+        parents = set()
+        for bucket in self.dirty:
+            self.nodes[self.n_buckets + bucket] = hash_bucket(self.buckets[bucket])
+            parents.add((self.n_buckets + bucket) // 2)
+        self.dirty.clear()
+
+        # Rehash one level at a time so each internal node is hashed once per call
+        while parents:
+            next_parents = set()
+            for i in parents:
+                self.nodes[i] = hash_pair(self.nodes[2 * i], self.nodes[2 * i + 1])
+                if i > 1:
+                    next_parents.add(i // 2)
+            parents = next_parents
+
+        return self.nodes[1]
+
+    def freeze(self, previous=None):
+        """
+        Copy the buckets for a snapshot, sharing the copies of buckets unchanged since ``previous``.
+
+        :param previous: Bucket list returned by the previous call, if any.
+        """
+        buckets = list(previous) if previous is not None else [None] * self.n_buckets
+        for bucket in self.changed_since_snapshot:
+            buckets[bucket] = dict(self.buckets[bucket])
+        self.changed_since_snapshot.clear()
+        return buckets
+
+    def subtree_roots(self, n_subtrees):
+        """ Hashes of the ``n_subtrees`` aligned subtrees that together cover every bucket (call root() first). """
+        return self.nodes[n_subtrees:2 * n_subtrees]
+
+    @classmethod
+    def from_buckets(cls, buckets):
+        state = cls(len(buckets))
+        for bucket, items in enumerate(buckets):
+            state.buckets[bucket] = dict(items)
+            state.dirty.add(bucket)
+        return state
+
+
+READ_ONLY_OPERATIONS = ("get", "balance")  # Operations that never change the state
+DELETED = object()  # Marks a key removed in a TentativeState
+
+
+def escrow_key(client_id):
+    """ State key holding {transfer digest: reserved amount change} of a client's in-flight 2PC transfers; a string, so it survives JSON. """
+    return f"escrow:{client_id}"
+
+
+class TentativeState:
+    def __init__(self, base):
+        """
+        Writes layered over a MerkleState without touching it, so a tentative
+        execution can be thrown away (rolled back) by dropping the layer.
+
+        :param base: The committed MerkleState reads fall through to.
+        """
+        self.base = base
+        self.writes = {}
+
+    def get(self, key, default=None):
+        if key in self.writes:
+            value = self.writes[key]
+            return default if value is DELETED else value
+        return self.base.get(key, default)
+
+    def put(self, key, value):
+        self.writes[key] = value
+
+    def delete(self, key):
+        self.writes[key] = DELETED
+
+
+class KeyValueStateMachine:
+    def __init__(self, initial_balance=100, n_buckets=1024, checkpoint_interval=100, snapshot_chunks=16):
+        """
+        Per-shard replicated state: finalized batches are executed strictly in
+        sequence-number order against a MerkleState.
+
+        Batches finalized out of order wait until every lower sequence number has
+        been executed (or skipped as a null request after a view change).
+
+        :param initial_balance: Balance of a client the state has not seen yet.
+        :param checkpoint_interval: Record (seq, state root) and take a snapshot every this many sequence numbers.
+        :param snapshot_chunks: Number of chunks a snapshot is served in; each is one aligned Merkle subtree.
+        """
+        self.state = MerkleState(n_buckets)
+        self.initial_balance = initial_balance
+        self.checkpoint_interval = checkpoint_interval
+
+        self.last_applied = 0
+        self.waiting = {}  # seq -> (digest, operations) finalized but not yet executable
+        self.checkpoints = []  # (seq, state root)
+        self.executed = 0
+
+        # Latest stable snapshot and everything executed after it, for validators catching up
+        self.snapshot_chunks = min(snapshot_chunks, self.state.n_buckets)
+        self.snapshot = None  # {"seq", "root", "chunk_roots", "buckets"}
+        self.log = []  # (seq, digest, operations) of every batch executed since the snapshot
+
+    def balance_of(self, client_id):
+        return self.state.get(client_id, self.initial_balance)
+
+    def reservations(self, client_id, state=None):
+        """ Escrowed amount changes of the client's in-flight cross-shard transfers, by transfer digest. """
+        return (self.state if state is None else state).get(escrow_key(client_id), {})
+
+    def available(self, client_id, state=None):
+        """ Balance the client may still spend: escrowed debits are already promised to their transfers. """
+        state = self.state if state is None else state
+        escrowed = sum(amount for amount in self.reservations(client_id, state).values() if amount < 0)
+        return state.get(client_id, self.initial_balance) + escrowed
+
+    def apply_batch(self, seq, digest, operations):
+        """
+        Hand over a finalized batch; executes it and any batches it unblocks.
+
+        :param seq: Sequence number the batch was ordered at.
+        :param digest: Request digest, or None for a null request.
+        :param operations: Transactions to execute, in order.
+        :return: (digest, results) for every batch executed by this call.
+        """
+        if seq <= self.last_applied or seq in self.waiting:
+            return []
+        self.waiting[seq] = (digest, operations)
+
+        executed = []
+        while self.last_applied + 1 in self.waiting:
+            self.last_applied += 1
+            digest, operations = self.waiting.pop(self.last_applied)
+            results = [self.execute(transaction) for transaction in operations]
+            self.log.append((self.last_applied, digest, operations))
+            if digest is not None:
+                executed.append((digest, results))
+
+            if self.last_applied % self.checkpoint_interval == 0:
+                self.take_snapshot()
+
+        return executed
+
+    def take_snapshot(self):
+        """ Checkpoint the current state as the stable snapshot and drop the log before it. """
+        root = self.state.root()
+        self.checkpoints.append((self.last_applied, root))
+        self.snapshot = {
+            "seq": self.last_applied,
+            "root": root,
+            "chunk_roots": self.state.subtree_roots(self.snapshot_chunks),
+            "buckets": self.state.freeze(self.snapshot["buckets"] if self.snapshot else None),
+        }
+        self.log = []
+
+    def current_snapshot(self):
+        """
+        The current state in snapshot form, for serving a joiner before any stable snapshot
+        exists. Unlike take_snapshot, it records no checkpoint and keeps the log.
+        """
+        root = self.state.root()
+        return {
+            "seq": self.last_applied,
+            "root": root,
+            "chunk_roots": self.state.subtree_roots(self.snapshot_chunks),
+            "buckets": [dict(bucket) for bucket in self.state.buckets],
+        }
+
+    def replay(self, entries):
+        """ Re-execute log entries fetched from a peer on top of a restored snapshot. """
+        for seq, digest, operations in entries:
+            self.apply_batch(seq, digest, operations)
+
+    def skip(self, seq):
+        """ Mark a sequence number that will never be finalized as a null request. """
+        return self.apply_batch(seq, None, [])
+
+    def execute(self, transaction, state=None):
+        """
+        Apply one transaction and return its result.
+
+        :param state: Where to apply it; the committed state if None, or a TentativeState.
+        """
+        operation = transaction.get("operation")
+        if not isinstance(operation, dict):
+            return "NOOP"  # Free-form requests such as "Ahmad sent 5 btc" carry no state change
+        if state is None:
+            state = self.state
+            self.executed += 1
+
+        kind = operation.get("operation", operation.get("type"))
+        if kind == "transfer":
+            sender, receiver, amount = transaction["client_node_id"], transaction["receiver"], operation.get("amount", 0)
+            if self.available(sender, state) < amount:
+                return "INSUFFICIENT_FUNDS"
+            state.put(sender, state.get(sender, self.initial_balance) - amount)
+            state.put(receiver, state.get(receiver, self.initial_balance) + amount)
+            return "OK"
+        if kind == "put":
+            state.put(operation["key"], operation["value"])
+            return "OK"
+        if kind == "delete":
+            state.delete(operation["key"])
+            return "OK"
+        if kind in READ_ONLY_OPERATIONS:
+            return self.query(transaction, state)
+        if kind == "2PC-PREPARE":
+            return [self.reserve(transfer, state) for transfer in operation["transfers"]]
+        if kind == "2PC-DECIDE":
+            for digest, key, commit in operation["decisions"]:
+                self.release(digest, key, commit, state)
+            return "OK"
+        if kind == "MIGRATE-OUT":
+            # A client leaving the shard takes its balance and escrow with it
+            client_id = operation["client"]
+            exported = {"balance": state.get(client_id, self.initial_balance), "escrow": self.reservations(client_id, state)}
+            state.delete(client_id)
+            state.delete(escrow_key(client_id))
+            return exported
+        if kind == "MIGRATE-IN":
+            client_id = operation["client"]
+            state.put(client_id, operation["balance"])
+            if operation["escrow"]:
+                state.put(escrow_key(client_id), operation["escrow"])
+            return "OK"
+        return "NOOP"
+
+    def reserve(self, transfer, state):
+        """
+        Prepare this shard's side of a cross-shard transfer by escrowing it against its key.
+
+        Several in-flight transfers may hold the same key as long as the available balance
+        covers all of their debits, and intra-shard transfers cannot spend escrowed funds.
+
+        :param transfer: {"digest", "key", "amount"}; the amount is negative for the sender's debit.
+        :return: True to vote commit, False to vote abort.
+        """
+        key, amount = transfer["key"], transfer["amount"]
+        if amount < 0 and self.available(key, state) < -amount:
+            return False
+        state.put(escrow_key(key), {**self.reservations(key, state), transfer["digest"]: amount})
+        return True
+
+    def release(self, digest, key, commit, state):
+        """ Apply (on commit) or discard (on abort) an escrowed amount change and drop its reservation. """
+        reserved = dict(self.reservations(key, state))
+        if digest not in reserved:
+            return
+        amount = reserved.pop(digest)
+        if reserved:
+            state.put(escrow_key(key), reserved)
+        else:
+            state.delete(escrow_key(key))
+        if commit:
+            state.put(key, state.get(key, self.initial_balance) + amount)
+
+    def execute_tentatively(self, operations):
+        """
+        Execute a batch on top of the committed state without changing it.
+
+        :return: (results, TentativeState holding the batch's writes).
+        """
+        state = TentativeState(self.state)
+        return [self.execute(transaction, state) for transaction in operations], state
+
+    def query(self, transaction, state=None):
+        """ Answer a read-only transaction (see ``is_read_only``) from the executed state. """
+        state = self.state if state is None else state
+        operation = transaction["operation"]
+        if operation.get("operation", operation.get("type")) == "get":
+            return state.get(operation["key"])
+        return state.get(operation.get("key", transaction["receiver"]), self.initial_balance)
+
+    def state_root(self):
+        return self.state.root()
+
+
+def is_read_only(transaction):
+    operation = transaction.get("operation")
+    return isinstance(operation, dict) and operation.get("operation", operation.get("type")) in READ_ONLY_OPERATIONS
+
+
+def hash_pair(left, right):
+    return hashlib.sha256((left + right).encode()).hexdigest()
+
+
+def hash_bucket(bucket):
+    if not bucket:
+        return EMPTY_HASH
+    return hashlib.sha256(json.dumps(sorted(bucket.items(), key=lambda item: repr(item[0])), default=str).encode()).hexdigest()
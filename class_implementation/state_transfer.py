@@ -0,0 +1,150 @@
+import heapq
+import json
+import time
+from state_machine import KeyValueStateMachine, MerkleState, hash_bucket, hash_pair
+
+
+class StateTransfer:
+    def __init__(self, shard, validator, max_peers=4, latency=0.05, bandwidth=1_000_000, timeout=1.0, byzantine_peers=()):
+        """
+        Bring a validator that joins ``shard`` up to date without replaying its history.
+
+        The joiner fetches the shard's latest stable snapshot chunk by chunk from
+        several peers at once, checks every chunk against the snapshot's Merkle
+        root and then replays only the log executed after the snapshot.
+
+        Network time is modelled on a private event queue, so a transfer costs no
+        wall-clock time and leaves the shard's clock alone: each peer serves its
+        chunks one after another, ``latency`` plus size / ``bandwidth`` seconds
+        each, while peers serve in parallel.
+
+        :param max_peers: Fetch from at most this many peers at once.
+        :param latency: One-way link latency in seconds.
+        :param bandwidth: Per-peer link bandwidth in bytes per second.
+        :param timeout: How long to wait on a peer that does not answer before asking another; such peers are not asked again.
+        :param byzantine_peers: Node ids of peers that serve tampered chunks, to exercise verification.
+        """
+        self.shard = shard
+        self.validator = validator
+        self.max_peers = max_peers
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.timeout = timeout
+        self.byzantine_peers = set(byzantine_peers)
+        self.state_machine = None  # The joiner's copy of the shard state once run() succeeds
+        self.snapshot = None  # What the peers serve: the stable snapshot, or a copy of the current state if there is none yet
+
+    def peers(self):
+        return [node for node in self.shard.validator_nodes if node is not self.validator][:self.max_peers]
+
+    def serve_chunk(self, peer, index):
+        """ A peer's answer for one chunk: the (key, value) pairs of every bucket in it, as sent on the wire. """
+        source = self.shard.state_machine
+        per_chunk = source.state.n_buckets // source.snapshot_chunks
+        buckets = self.snapshot["buckets"][index * per_chunk:(index + 1) * per_chunk]
+        chunk = [sorted(bucket.items(), key=lambda item: repr(item[0])) for bucket in buckets]
+
+        if peer.node_id in self.byzantine_peers and any(chunk):
+            bucket = next(items for items in chunk if items)
+            bucket[0] = (bucket[0][0], "tampered")
+        return json.dumps(chunk)
+
+    def verify_chunk(self, payload, chunk_root):
+        """ Rebuild a chunk's Merkle subtree from its buckets and compare it with the root in the manifest. """
+        level = [hash_bucket({key: value for key, value in items}) for items in json.loads(payload)]
+        while len(level) > 1:
+            level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+        return level[0] == chunk_root
+
+    def verify_manifest(self, manifest):
+        level = list(manifest["chunk_roots"])
+        while len(level) > 1:
+            level = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+        return level[0] == manifest["root"]
+
+    def run(self):
+        """
+        Fetch, verify and install the snapshot, replay the log suffix, and hand the
+        result to the joining validator as its own executed state.
+
+        :return: Report with the snapshot sequence number, chunks and bytes fetched, chunks
+                 rejected, simulated transfer seconds and the CPU seconds spent serving, verifying and replaying.
+        """
+        source = self.shard.state_machine
+        if source.snapshot is not None:
+            self.snapshot, log = source.snapshot, source.log
+        else:
+            self.snapshot, log = source.current_snapshot(), []  # Checkpointing here would truncate the shard's log
+        manifest = {key: self.snapshot[key] for key in ("seq", "root", "chunk_roots")}
+        cpu_start = time.perf_counter()
+
+        if not self.verify_manifest(manifest):
+            raise ValueError("Snapshot manifest does not match its state root")
+
+        # Event queue of (time the peer is free, peer index); every peer starts by sending one chunk
+        peers = self.peers()
+        if not peers:
+            raise ValueError(f"Shard {self.shard.shard_id} has no peers to transfer state from")
+        free_at = [(0.0, i) for i in range(len(peers))]
+        heapq.heapify(free_at)
+        remaining = [(index, 0.0) for index in range(len(manifest["chunk_roots"]))]  # (chunk, not retried before)
+        chunks = {}
+        bad_peers = set()
+        rejected = 0
+        transferred = 0
+        finish = 0.0
+
+        while remaining:
+            if not free_at:
+                raise RuntimeError(f"No honest peer left to serve {len(remaining)} snapshot chunks")
+            free, peer_index = heapq.heappop(free_at)
+            peer = peers[peer_index]
+            index, not_before = remaining.pop(0)
+            now = max(free, not_before)
+
+            if peer.is_faulty:
+                remaining.append((index, now + self.timeout))  # No answer: ask another peer once the timeout expires
+                continue
+
+            payload = self.serve_chunk(peer, index)
+            done = now + self.latency + len(payload) / self.bandwidth
+            transferred += len(payload)
+
+            if self.verify_chunk(payload, manifest["chunk_roots"][index]):
+                chunks[index] = json.loads(payload)
+                finish = max(finish, done)
+                heapq.heappush(free_at, (done, peer_index))
+            else:
+                rejected += 1
+                bad_peers.add(peer.node_id)
+                remaining.append((index, done))  # Ask another peer; this one is not asked again
+
+        # Install the snapshot and catch up on what the shard executed since
+        buckets = [bucket for index in sorted(chunks) for bucket in chunks[index]]
+        replica = KeyValueStateMachine(initial_balance=source.initial_balance, n_buckets=len(buckets), checkpoint_interval=source.checkpoint_interval, snapshot_chunks=source.snapshot_chunks)
+        replica.state = MerkleState.from_buckets(buckets)
+        if replica.state.root() != manifest["root"]:
+            raise ValueError("Installed snapshot does not match its state root")
+        replica.last_applied = manifest["seq"]
+
+        suffix = json.dumps(log, default=str)
+        finish += self.latency + len(suffix) / self.bandwidth
+        replica.replay(json.loads(suffix))
+        if replica.state_root() != source.state_root():
+            raise ValueError("State after replaying the log suffix does not match the shard")
+
+        self.state_machine = replica
+        self.validator.state_machine = replica
+        self.validator.mark_applied()
+        return {
+            "validator": self.validator.node_id,
+            "snapshot_seq": manifest["seq"],
+            "replayed": len(log),
+            "chunks": len(chunks),
+            "bytes": transferred + len(suffix),
+            "peers": len(peers),
+            "rejected_chunks": rejected,
+            "bad_peers": sorted(bad_peers),
+            "transfer_s": finish,
+            "cpu_s": time.perf_counter() - cpu_start,
+        }
@@ -0,0 +1,63 @@
+import contextlib
+import io
+import random
+import sys
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def build_network(shard_size, n_keys, seed):
+    """ Two shards; shard 0 executes ``n_keys`` writes so it has a snapshot and a log suffix to serve. """
+    rng = random.Random(seed)
+    network = Network()
+    node_id = 0
+
+    for shard_id in range(2):
+        shard = Shard(shard_id=shard_id, network=network)
+        network.add_shard(shard)
+        for _ in range(shard_size):
+            shard.add_validator_node(ValidatorNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+        for _ in range(2):
+            shard.add_client_node(ClientNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+
+    shard = network.shards[0]
+    writer, other = list(shard.client_nodes.values())
+    for i in range(n_keys):
+        writer.create_request({"operation": "put", "key": f"account-{i}", "value": rng.randint(0, 10 ** 6)}, other.get_node_id())
+        if (i + 1) % 64 == 0:
+            shard.process_requests()
+    shard.process_requests()
+
+    return network
+
+
+def main():
+    n_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 2050
+    shard_size = 7
+
+    with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+        network = build_network(shard_size, n_keys, seed=42)
+    shard, other_shard = network.shards[0], network.shards[1]
+    print(f"Shard 0 executed {shard.state_machine.last_applied} requests; stable snapshot at seq {shard.state_machine.snapshot['seq']}.")
+
+    # Resharding moves a validator from shard 1 into shard 0, which triggers state transfer
+    mover = other_shard.validator_nodes.pop()
+    with contextlib.redirect_stdout(io.StringIO()):
+        shard.add_validator_node(mover)
+    print("Moved validator:", shard.state_transfers[-1])
+
+    for max_peers in (1, 2, 4, shard_size):
+        print(f"{max_peers} peers:", shard.transfer_state(mover, max_peers=max_peers))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        shard.fail_node(shard.validator_nodes[1])
+    print("1 crashed peer:", shard.transfer_state(mover, max_peers=4))
+    print("1 byzantine peer:", shard.transfer_state(mover, max_peers=4, byzantine_peers={shard.validator_nodes[2].node_id}))
+
+
+if __name__ == '__main__':
+    main()
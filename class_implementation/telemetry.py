@@ -0,0 +1,182 @@
+import time
+import numpy as np
+
+FEATURES = ("cpu_rating", "ram_usage", "reputation_score")
+CLUSTERED_FEATURES = ("cpu_rating", "ram_usage")  # The features recompute_shards clusters on
+
+
+class TelemetryMonitor:
+    def __init__(self, network, quality_threshold=0.5, imbalance_threshold=0.25, hysteresis=0.5, min_interval=20.0, clock=time.monotonic):
+        """
+        Applies streamed validator telemetry in bulk and reshards the network once the
+        current assignment has degraded, without thrashing.
+
+        Both signals are measured against a reference state, with features scaled by
+        their network-wide spread at that time:
+
+        - quality loss: relative growth of the mean squared distance of validators to
+          their shard's stored centroid. It rises when a shard's centroid drifts and
+          when its members spread apart.
+        - imbalance: growth of the largest shard CPU capacity over the mean capacity.
+
+        The monitor becomes degraded when either signal reaches its threshold, and
+        recovers only once both fall below ``(1 - hysteresis)`` times their thresholds.
+        A degraded monitor reshards unless a reshard ran less than ``min_interval``
+        seconds ago, in which case it waits for the cooldown to pass.
+
+        A reshard keeps the reference, so the new assignment is judged by the same
+        standard as the old one. If it brought both signals below the low thresholds
+        the trigger re-arms with that residual degradation still counted; otherwise
+        resharding cannot undo the change (validators were throttled for good, say)
+        and the post-reshard state becomes the new reference. Either way the next
+        reshard needs at least ``hysteresis`` times the thresholds of fresh degradation.
+
+        :param network: Network whose validators and shards are monitored.
+        :param clock: Returns the current time in seconds; simulations pass their own.
+        """
+        self.network = network
+        self.quality_threshold = quality_threshold
+        self.imbalance_threshold = imbalance_threshold
+        self.hysteresis = hysteresis
+        self.min_interval = min_interval
+        self.clock = clock
+
+        self.degraded = False
+        self.last_reshard = None  # Clock time of the last reshard, None before the first one
+        self.reshards = 0
+
+        self.rebase()
+
+    def rebase(self, keep_reference=False):
+        """
+        Take the current shards, centroids and features as the new baseline.
+
+        :param keep_reference: Only follow the new assignment; keep measuring it against the
+                               reference dispersion, imbalance and feature scale.
+        """
+        self.index = {}  # node id -> row in self.values
+        self.nodes = []
+        labels = []
+        centroids = []
+
+        for position, shard in enumerate(self.network.shards.values()):
+            if shard.centroid is None:
+                shard.centroid = shard.compute_centroid()
+            centroids.append(shard.centroid if shard.centroid is not None else np.zeros(len(CLUSTERED_FEATURES)))
+            for node in shard.validator_nodes:
+                self.index[node.node_id] = len(self.nodes)
+                self.nodes.append(node)
+                labels.append(position)
+
+        self.shard_ids = list(self.network.shards)
+        self.labels = np.array(labels, dtype=np.int64)
+        self.values = np.array([[getattr(node, feature) for feature in FEATURES] for node in self.nodes], dtype=float).reshape(-1, len(FEATURES))
+        self.centroids = np.array(centroids, dtype=float).reshape(-1, len(CLUSTERED_FEATURES))
+        if keep_reference:
+            return
+
+        clustered = self.values[:, :len(CLUSTERED_FEATURES)]
+        scale = clustered.std(axis=0) if len(self.nodes) else np.ones(len(CLUSTERED_FEATURES))
+        self.scale = np.where(scale > 0, scale, 1.0)
+
+        self.base_dispersion = max(self.dispersion(), 1e-12)
+        self.base_imbalance = self.capacity_imbalance()
+
+    def on_reshard(self):
+        """ Called by the network after it recomputes shards; re-arms the trigger (see __init__). """
+        self.last_reshard = self.clock()
+        self.reshards += 1
+        self.rebase(keep_reference=True)
+        if not self.recovered(*self.signals()):
+            self.rebase()
+        self.degraded = False
+
+    def dispersion(self):
+        """ Mean squared scaled distance of validators to their shard's stored centroid. """
+        if not len(self.nodes):
+            return 0.0
+        offsets = (self.values[:, :len(CLUSTERED_FEATURES)] - self.centroids[self.labels]) / self.scale
+        return float((offsets ** 2).sum(axis=1).mean())
+
+    def capacity_imbalance(self):
+        """ Largest shard CPU capacity over the mean capacity, minus one. """
+        capacity = np.bincount(self.labels, weights=self.values[:, 0], minlength=len(self.shard_ids))
+        capacity = capacity[capacity > 0]
+        if not len(capacity):
+            return 0.0
+        return float(capacity.max() / capacity.mean() - 1)
+
+    def drift(self):
+        """ Shard id -> scaled distance between the shard's current and stored centroid. """
+        n_shards = len(self.shard_ids)
+        counts = np.bincount(self.labels, minlength=n_shards)
+        drift = {}
+        for column in range(len(CLUSTERED_FEATURES)):
+            sums = np.bincount(self.labels, weights=self.values[:, column], minlength=n_shards)
+            means = np.divide(sums, counts, out=self.centroids[:, column].copy(), where=counts > 0)
+            shift = ((means - self.centroids[:, column]) / self.scale[column]) ** 2
+            for position, shard_id in enumerate(self.shard_ids):
+                drift[shard_id] = drift.get(shard_id, 0.0) + shift[position]
+        return {shard_id: float(np.sqrt(value)) for shard_id, value in drift.items()}
+
+    def signals(self):
+        """ Quality loss and imbalance growth since the last reshard. """
+        quality_loss = self.dispersion() / self.base_dispersion - 1
+        imbalance = self.capacity_imbalance() - self.base_imbalance
+        return quality_loss, imbalance
+
+    def ingest(self, updates):
+        """
+        Apply a batch of telemetry samples and reshard if the assignment has degraded.
+
+        :param updates: Mapping, or iterable of pairs, from validator id to {feature: value}.
+                        Samples for validators that are no longer in a shard are skipped.
+        :return: Samples applied and skipped, both signals, and whether the network resharded.
+        """
+        items = updates.items() if isinstance(updates, dict) else updates
+        applied = 0
+        skipped = 0
+
+        for node_id, sample in items:
+            row = self.index.get(node_id)
+            if row is None:
+                skipped += 1
+                continue
+            node = self.nodes[row]
+            for feature, value in sample.items():
+                if feature not in FEATURES:
+                    raise ValueError(f"Unknown telemetry feature {feature!r}; expected one of {FEATURES}.")
+                setattr(node, feature, value)
+                self.values[row, FEATURES.index(feature)] = value
+            applied += 1
+
+        quality_loss, imbalance = self.signals()
+        metrics = self.network.metrics
+        metrics.gauge("telemetry_quality_loss", "Growth of validator distance to stored shard centroids since the last reshard").set(quality_loss)
+        metrics.gauge("telemetry_imbalance", "Growth of shard CPU capacity imbalance since the last reshard").set(imbalance)
+
+        resharded = self.should_reshard(quality_loss, imbalance)
+        if resharded:
+            print(f"Telemetry: quality loss {quality_loss:.2f}, imbalance {imbalance:+.2f}; resharding.")
+            metrics.counter("telemetry_reshards_total", "Reshards triggered by validator telemetry").inc()
+            self.network.recompute_shards()
+
+        return {"applied": applied, "skipped": skipped, "quality_loss": quality_loss, "imbalance": imbalance, "resharded": resharded}
+
+    def recovered(self, quality_loss, imbalance):
+        """ Whether both signals are below the low thresholds, ``(1 - hysteresis)`` times the high ones. """
+        return quality_loss < self.quality_threshold * (1 - self.hysteresis) and imbalance < self.imbalance_threshold * (1 - self.hysteresis)
+
+    def should_reshard(self, quality_loss, imbalance):
+        """ Update the degraded state and decide whether to reshard now. """
+        if quality_loss >= self.quality_threshold or imbalance >= self.imbalance_threshold:
+            self.degraded = True
+        elif self.recovered(quality_loss, imbalance):
+            self.degraded = False
+
+        if not self.degraded:
+            return False
+        if self.last_reshard is not None and self.clock() - self.last_reshard < self.min_interval:
+            self.network.metrics.counter("telemetry_reshards_deferred_total", "Telemetry checks that wanted a reshard during the cooldown").inc()
+            return False
+        return True
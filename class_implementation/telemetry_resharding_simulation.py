@@ -0,0 +1,134 @@
+import contextlib
+import io
+import random
+import sys
+import time
+import numpy as np
+from network import Network
+from validator_node import ValidatorNode
+
+
+def build_network(n_validators, rng):
+    network = Network(s_min=3, s_max=10)
+    nodes = [
+        ValidatorNode(
+            node_id=i,
+            network=network,
+            cpu_rating=rng.uniform(1, 10),
+            reputation_score=rng.uniform(0, 1),
+            ram_usage=rng.uniform(1, 16),
+            name=f"Validator_{i}"
+        )
+        for i in range(n_validators)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        network.add_validator_node(nodes)
+    return network, nodes
+
+
+def telemetry_batch(nodes, truth, now, rng, sample_ratio=0.2, noise=0.0, throttle_start=200.0, throttle_period=100.0):
+    """
+    Samples from a random fraction of the validators.
+
+    Every validator's true state jitters around where it was. From ``throttle_start`` on,
+    validators with even ids are gradually CPU-throttled and fill their RAM, reaching the
+    worst state after ``throttle_period`` seconds.
+
+    :param truth: node id -> [cpu_rating, ram_usage, reputation_score], updated in place.
+    :param noise: Standard deviation of the measurement error on cpu_rating (ram_usage gets
+                  twice as much); the error does not accumulate.
+    """
+    progress = min(max((now - throttle_start) / throttle_period, 0.0), 1.0)
+    batch = {}
+    for node in rng.sample(nodes, int(len(nodes) * sample_ratio)):
+        state = truth[node.node_id]
+        cpu = state[0] + rng.gauss(0, 0.05)
+        ram = state[1] + rng.gauss(0, 0.1)
+        if node.node_id % 2 == 0 and progress > 0:
+            cpu -= 0.08 * progress * (cpu - 1)
+            ram += 0.08 * progress * (16 - ram)
+        state[0] = min(max(cpu, 1.0), 10.0)
+        state[1] = min(max(ram, 1.0), 16.0)
+        state[2] = min(max(state[2] + rng.gauss(0, 0.01), 0.0), 1.0)
+        batch[node.node_id] = {
+            "cpu_rating": min(max(state[0] + rng.gauss(0, noise), 1.0), 10.0),
+            "ram_usage": min(max(state[1] + rng.gauss(0, 2 * noise), 1.0), 16.0),
+            "reputation_score": state[2],
+        }
+    return batch
+
+
+def true_dispersion(monitor, truth):
+    """ Mean squared distance of validators to their shard's mean, from their true state rather than the samples. """
+    values = np.array([truth[node.node_id][:2] for node in monitor.nodes]) / monitor.scale[:2]
+    n_shards = int(monitor.labels.max()) + 1
+    counts = np.maximum(np.bincount(monitor.labels, minlength=n_shards), 1)
+    means = np.stack([np.bincount(monitor.labels, weights=values[:, column], minlength=n_shards) for column in range(2)], axis=1) / counts[:, None]
+    return float(((values - means[monitor.labels]) ** 2).sum(axis=1).mean())
+
+
+def run(label, n_validators=600, duration=600, noise=0.0, seed=42, **monitor_kwargs):
+    """
+    Stream one telemetry batch per simulated second and count the reshards it triggers.
+
+    Quality is judged from the validators' true state, so a reshard that only fits the
+    measurement noise does not count as an improvement: true quality loss is the growth
+    of ``true_dispersion`` over the initial assignment.
+
+    :param noise: Measurement error of the telemetry, see ``telemetry_batch``.
+    :param monitor_kwargs: Thresholds, hysteresis and cooldown for the TelemetryMonitor.
+    """
+    rng = random.Random(seed)
+    network, nodes = build_network(n_validators, rng)
+    truth = {node.node_id: [node.cpu_rating, node.ram_usage, node.reputation_score] for node in nodes}
+
+    now = [0.0]
+    monitor = network.enable_telemetry_resharding(clock=lambda: now[0], **monitor_kwargs)
+
+    reshard_times = []
+    initial = true_dispersion(monitor, truth)
+    quality_loss = []
+    start = time.perf_counter()
+    for second in range(duration):
+        now[0] = float(second)
+        batch = telemetry_batch(nodes, truth, now[0], rng, noise=noise)
+        with contextlib.redirect_stdout(io.StringIO()):  # recompute_shards prints its choice
+            report = monitor.ingest(batch)
+        quality_loss.append(true_dispersion(monitor, truth) / initial - 1)
+        if report["resharded"]:
+            reshard_times.append(second)
+    elapsed = time.perf_counter() - start
+
+    deferred = network.metrics.families.get("telemetry_reshards_deferred_total")
+    return {
+        "config": label,
+        "reshards": len(reshard_times),
+        "reshard_times": reshard_times,
+        "deferred_checks": sum(counter.value for counter in deferred[3].values()) if deferred else 0,
+        "mean_quality_loss": float(np.mean(quality_loss)),
+        "peak_quality_loss": max(quality_loss),
+        "shards": len(network.shards),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main():
+    """ Usage: python telemetry_resharding_simulation.py [validators] [simulated seconds] [seeds] """
+    n_validators = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    duration = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+    seeds = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    configs = (
+        ("no hysteresis, no cooldown", dict(hysteresis=0.0, min_interval=0.0)),
+        ("hysteresis 0.5, no cooldown", dict(hysteresis=0.5, min_interval=0.0)),
+        ("hysteresis 0.5, 20 s cooldown", dict(hysteresis=0.5, min_interval=20.0)),
+    )
+    for noise in (0.0, 0.5, 1.0):
+        for label, kwargs in configs:
+            results = [run(label, n_validators=n_validators, duration=duration, noise=noise, seed=seed, **kwargs) for seed in range(seeds)]
+            summary = {key: round(sum(result[key] for result in results) / seeds, 3) for key in ("reshards", "deferred_checks", "mean_quality_loss", "peak_quality_loss")}
+            print(f"noise {noise}, {label}: {summary}")
+
+
+if __name__ == '__main__':
+    main()
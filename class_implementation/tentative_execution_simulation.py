@@ -0,0 +1,77 @@
+import asyncio
+import contextlib
+import io
+import random
+import sys
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+from async_runtime import AsyncNetworkRuntime, ConstantLatency, LognormalLatency
+
+
+def build_network(shard_size, tentative, n_clients=10):
+    network = Network()
+    if tentative:
+        network.enable_tentative_execution()
+    shard = Shard(shard_id=0, network=network, base_timeout=0.5)
+    network.add_shard(shard)
+
+    for node_id in range(shard_size):
+        shard.add_validator_node(ValidatorNode(node_id=node_id, network=network, shard=shard))
+    for node_id in range(shard_size, shard_size + n_clients):
+        shard.add_client_node(ClientNode(node_id=node_id, network=network, shard=shard))
+    return network, shard
+
+
+def rollbacks(network):
+    family = network.metrics.families.get("tentative_rollbacks_total")
+    return sum(counter.value for counter in family[3].values()) if family else 0
+
+
+async def measure(shard_size, latency, tentative, n_requests=100, rate=50.0, seed=42):
+    """
+    Submit transfers as a Poisson stream and return the latency summary.
+
+    With tentative execution, ``mean_s`` is still the time to finalization, and
+    ``saved_mean_s`` is how much earlier the client had 2f+1 matching tentative replies.
+    """
+    rng = random.Random(seed)
+    network, shard = build_network(shard_size, tentative)
+    runtime = AsyncNetworkRuntime(network, latency, seed=seed)
+    await runtime.start()
+
+    clients = list(shard.client_nodes.values())
+    for _ in range(n_requests):
+        sender, receiver = rng.sample(clients, 2)
+        runtime.submit(sender, {"operation": "transfer", "amount": rng.randint(1, 20)}, receiver.get_node_id())
+        await asyncio.sleep(rng.expovariate(rate))
+
+    await runtime.wait_idle()
+    await runtime.stop()
+
+    summary = runtime.latency_summary()
+    summary["rollbacks"] = rollbacks(network)
+    return {key: round(value, 4) if isinstance(value, float) else value for key, value in summary.items()}
+
+
+async def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    lan = LognormalLatency(median=0.005, sigma=0.5)
+
+    print("Latency saved per request by replying once prepared (lognormal links, 5 ms median):")
+    for shard_size in (4, 7, 16):
+        for tentative in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+                result = await measure(shard_size, lan, tentative, n_requests=n_requests)
+            print(f"  shard size {shard_size}, tentative {tentative}: {result}")
+
+    print("Constant 20 ms links:")
+    for tentative in (False, True):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = await measure(7, ConstantLatency(0.020), tentative, n_requests=n_requests)
+        print(f"  tentative {tentative}: {result}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
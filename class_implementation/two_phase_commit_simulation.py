@@ -0,0 +1,92 @@
+import contextlib
+import io
+import random
+import sys
+import time
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def build_network(n_shards, shard_size, clients_per_shard, batch_size):
+    network = Network()
+    network.enable_two_phase_commit(batch_size=batch_size)
+    node_id = 0
+
+    for shard_id in range(n_shards):
+        shard = Shard(shard_id=shard_id, network=network)
+        network.add_shard(shard)
+        for _ in range(shard_size):
+            shard.add_validator_node(ValidatorNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+        for _ in range(clients_per_shard):
+            shard.add_client_node(ClientNode(node_id=node_id, network=network, shard=shard))
+            node_id += 1
+
+    return network
+
+
+def run(cross_shard_ratio, batch_size, n_requests=400, n_shards=4, shard_size=7, clients_per_shard=10, seed=42):
+    """
+    Throughput of a transfer workload where ``cross_shard_ratio`` of requests cross shards.
+
+    :param batch_size: Cross-shard transfers coordinated per two-phase commit round. Intra-shard
+                       requests are always ordered one PBFT instance each, so only batch_size=1
+                       compares the two paths like for like.
+    """
+    rng = random.Random(seed)
+    network = build_network(n_shards, shard_size, clients_per_shard, batch_size)
+    shards = list(network.shards.values())
+    clients = [client for shard in shards for client in shard.client_nodes.values()]
+
+    start = time.perf_counter()
+    for i in range(n_requests):
+        shard = rng.choice(shards)
+        target = rng.choice([other for other in shards if other is not shard]) if rng.random() < cross_shard_ratio else shard
+        sender = rng.choice(list(shard.client_nodes.values()))
+        receiver = rng.choice(list(target.client_nodes.values()))
+        sender.create_request({"operation": "transfer", "amount": rng.randint(1, 20)}, receiver.get_node_id())
+
+        if (i + 1) % batch_size == 0:
+            for shard in shards:
+                shard.process_requests()
+    for shard in shards:
+        shard.process_requests()
+    network.cross_shard.flush()
+    elapsed = time.perf_counter() - start
+
+    # A request is finished once its client has the reply, whichever path it took
+    finished = n_requests - sum(len(client.pending_requests) for client in clients)
+    instances = sum(len(shard.completed_requests) for shard in shards)
+
+    return {
+        "cross_shard_ratio": cross_shard_ratio,
+        "batch_size": batch_size,
+        "finished": finished,
+        "throughput_rps": finished / elapsed,
+        "pbft_instances_per_request": round(instances / n_requests, 2),
+        "cross_shard_committed": network.cross_shard.committed,
+        "cross_shard_aborted": network.cross_shard.aborted,
+        "coordination_rounds": network.cross_shard.rounds,
+    }
+
+
+def main():
+    n_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+
+    print("Every request ordered on its own (two-phase commit costs 4 PBFT instances per cross-shard transfer):")
+    for ratio in (0.0, 0.1, 0.25, 0.5, 1.0):
+        with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+            result = run(ratio, 1, n_requests=n_requests)
+        print(result)
+
+    print("Batched two-phase commit (4 PBFT instances per round of up to batch_size transfers); intra-shard requests stay unbatched:")
+    for batch_size in (8, 32):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run(1.0, batch_size, n_requests=n_requests)
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,10 +2,19 @@ from base_node import Node
 from abc import abstractmethod
 from network import Network
 from shard import Shard
+from state_machine import is_read_only
+from messages import PrePrepare, Vote, Certificate, ViewChange, NewView, PREPARE, COMMIT, PREPARE_CERTIFICATE, COMMIT_CERTIFICATE
 import hashlib
 import json
 
 class ValidatorNode(Node):
+    __slots__ = (
+        "reputation_score", "cpu_rating", "ram_usage", "isPrimary", "pending_prepares", "pending_commits", "commit_votes",
+        "view_no", "is_faulty", "accepted_preprepares", "prepared_certificates", "sent_commits", "certified_prepares",
+        "certified_commits", "sent_votes", "all_to_all", "proposed", "request_timers", "view_change_votes",
+        "in_view_change", "pending_view", "view_change_timer", "failed_view_changes", "prepared_seqs", "tentative_executions",
+        "state_machine", "last_applied",
+    )
 
     def __init__(self, node_id, network, shard=None, reputation_score=1.0, cpu_rating = 1.0, ram_usage = 1.0, isPrimary=False, name=None):
         super().__init__(node_id, role="validator", network=network, shard=shard, name=name)
@@ -17,6 +26,28 @@ class ValidatorNode(Node):
         self.pending_commits = {}
         self.commit_votes = {}
 
+        # View-change state
+        self.view_no = 0
+        self.is_faulty = False  # A crashed node drops every message it receives
+        self.accepted_preprepares = {}  # digest -> PRE-PREPARE accepted in some view
+        self.prepared_certificates = {}  # digest -> {"view", "seq", "digest", "client_request"}
+        self.sent_commits = set()
+        self.certified_prepares = set()  # Digests this node, as collector, issued a PREPARE certificate for
+        self.certified_commits = set()  # ... and a COMMIT certificate for
+        self.sent_votes = {}  # digest -> votes sent to a collector, resent to everyone if the instance stalls
+        self.all_to_all = set()  # Digests whose votes fell back to all-to-all after their collector stalled
+        self.proposed = set()  # Digests this node proposed while primary of the current view
+        self.request_timers = {}  # digest -> Timer that starts a view change if it fires
+        self.view_change_votes = {}  # new view -> {validator_id: VIEW-CHANGE message}
+        self.in_view_change = False
+        self.pending_view = None
+        self.view_change_timer = None
+        self.failed_view_changes = 0  # Consecutive view changes without progress; doubles the timeout
+        self.prepared_seqs = {}  # seq -> digest prepared here and waiting for every earlier request to commit
+        self.tentative_executions = {}  # digest -> TentativeState of a request executed before it committed
+        self.state_machine = None  # Executed state: the shard's, or this node's own copy once state transfer installed one
+        self.last_applied = 0  # Last sequence number this node has executed; reads are answered as of it
+
     
     def get_cpu_rating(self):
         return self.cpu_rating
@@ -37,82 +68,205 @@ class ValidatorNode(Node):
 
         return requests
 
+    def answer_read(self, request):
+        """
+        Answer a read-only request straight from executed state, skipping the three phases. The reply
+        carries the sequence number this node has executed up to, so a replica that has not committed
+        the latest requests does not match the up-to-date ones.
+
+        :return: A REPLY, or None if this node cannot answer (crashed, between views, or the request writes).
+        """
+        if self.is_faulty or self.in_view_change or not is_read_only(request["transaction"]):
+            return None
+        return {
+            "type": "REPLY",
+            "digest": request["digest"],
+            "timestamp": request["transaction"].get("timestamp"),
+            "results": [self.state_machine.query(request["transaction"])],
+            "replica": self.node_id,
+            "seq": self.last_applied,
+        }
+
     def handle_request(self, message):
         """ Primary node handles a client request and sends PRE-PREPARE to replicas. """
         if not self.isPrimary:
             print("Only primary node is authorized to check requests")
             return
         
+        if self.is_faulty or self.in_view_change:
+            return
+
         digest = hashlib.sha256(json.dumps(message).encode()).hexdigest()
+
+        if digest in self.proposed or digest in self.shard.completed_requests:
+            return  # Already ordered in this view
+        self.proposed.add(digest)
         
-        pre_prepare_msg = {
-        "type": "PRE-PREPARE",
-        "digest": digest,
-        "primary_id": self.node_id,
-        "client_request": message  
-        }
+        pre_prepare_msg = PrePrepare(digest, self.node_id, message, self.view_no, self.shard.next_sequence())
+        self.accepted_preprepares[digest] = pre_prepare_msg
+        self.record_primary_vote(pre_prepare_msg)
 
 
+        self.shard.start_phase_timer(digest, message)
         self.shard.broadcast(pre_prepare_msg, exclude=[self])  # Exclude self
+        self.shard.mark_phase(digest, "preprepare")
 
     def receive_preprepare(self, pre_prepare_msg):
         """ Replicas receive PRE-PREPARE and store it for processing. """
-        digest = hashlib.sha256(json.dumps(pre_prepare_msg["client_request"]).encode()).hexdigest()
+        if self.is_faulty or self.in_view_change:
+            return
+
+        if pre_prepare_msg.view != self.view_no:
+            print(f"Node {self.node_id}: PRE-PREPARE for view {pre_prepare_msg.view} but in view {self.view_no}, rejecting message.")
+            return
+
+        digest = hashlib.sha256(json.dumps(pre_prepare_msg.client_request).encode()).hexdigest()
         
-        if digest != pre_prepare_msg["digest"]:
+        if digest != pre_prepare_msg.digest:
             print(f"Node {self.node_id}: Invalid digest in PRE-PREPARE, rejecting message.")
             return
 
-        print(f"Node {self.node_id}: Received PRE-PREPARE for request {digest[:8]} from primary node, node_id: {pre_prepare_msg['primary_id']}.")
+        print(f"Node {self.node_id}: Received PRE-PREPARE for request {digest[:8]} from primary node, node_id: {pre_prepare_msg.primary_id}.")
 
+        self.accepted_preprepares[digest] = pre_prepare_msg
+        self.record_primary_vote(pre_prepare_msg)
         self.pending_prepares.append(pre_prepare_msg)
+        self.network.metrics.gauge("pending_prepares", "PRE-PREPAREs queued at replicas", shard=self.shard.shard_id).inc()
     
     def process_prepare(self):
         """ Process stored PRE-PREPARE messages and move to PREPARE phase. """
         for pre_prepare_msg in self.pending_prepares:
-            digest = pre_prepare_msg["digest"]
-
             print(f"🟡 Node {self.node_id}: Processing PRE-PREPARE -> Sending PREPARE.")
 
             # Create and send PREPARE message
-            prepare_msg = {
-                "type": "PREPARE",
-                "digest": digest,
-                "validator_id": self.node_id
-            }
-            self.shard.broadcast(prepare_msg)
+            self.send_vote(Vote(PREPARE, pre_prepare_msg.digest, self.node_id, pre_prepare_msg.view, pre_prepare_msg.seq))
 
         # Clear processed messages
+        self.network.metrics.gauge("pending_prepares", "PRE-PREPAREs queued at replicas", shard=self.shard.shard_id).dec(len(self.pending_prepares))
         self.pending_prepares.clear()
 
 
+    def record_primary_vote(self, pre_prepare_msg):
+        """ The primary sends no PREPARE; its PRE-PREPARE counts towards the 2f+1 instead. """
+        self.pending_commits.setdefault(pre_prepare_msg.digest, set()).add(pre_prepare_msg.primary_id)
+
+    def send_vote(self, message):
+        """ Send a PREPARE or COMMIT to every validator, or only to the collector in collector mode. """
+        if self.shard.collector is None or message.digest in self.all_to_all:
+            self.shard.broadcast(message)
+        else:
+            self.sent_votes.setdefault(message.digest, []).append(message)
+            self.shard.multicast(message, [self.shard.collector_for(message.view, message.seq)])
+
+    def is_collector(self, view, seq):
+        return self.shard.collector is not None and self.shard.collector_for(view, seq) is self
+
     def receive_prepare(self, prepare_msg):
-        digest = prepare_msg["digest"]
+        if self.is_faulty:
+            return
+
+        digest = prepare_msg.digest
         if digest not in self.pending_commits:
             self.pending_commits[digest] = set()
 
-        self.pending_commits[digest].add(prepare_msg["validator_id"])
+        self.pending_commits[digest].add(prepare_msg.validator_id)
 
-        if digest not in self.pending_commits:
-            self.pending_commits[digest] = set()
+        # Act once, when the 2f+1th PREPARE arrives
+        if len(self.pending_commits[digest]) < self.shard.required_prepare_threshold() or digest in self.sent_commits or digest in self.certified_prepares:
+            return
 
-        self.pending_commits[digest].add(prepare_msg["validator_id"])
+        if self.is_collector(prepare_msg.view, prepare_msg.seq):
+            # As collector, hand every replica one certificate instead of letting each count 2f+1 PREPAREs
+            self.certified_prepares.add(digest)
+            self.shard.broadcast(Certificate(PREPARE_CERTIFICATE, digest, self.node_id, prepare_msg.view, prepare_msg.seq, sorted(self.pending_commits[digest])))
+            return
 
-        if len(self.pending_commits[digest]) >= self.shard.required_prepare_threshold():
-            print(f"🟢 Node {self.node_id}: Reached 2f+1 PREPAREs -> Sending COMMIT.")
+        self.prepared(digest, prepare_msg.view, prepare_msg.seq)
 
-        commit_msg = {
-            "type": "COMMIT",
+    def receive_prepare_certificate(self, certificate_msg):
+        """ A collector's proof that 2f+1 validators sent matching PREPAREs. """
+        if self.is_faulty or certificate_msg.digest in self.sent_commits:
+            return
+        if len(set(certificate_msg.signers)) < self.shard.required_prepare_threshold():
+            print(f"Node {self.node_id}: PREPARE certificate for {certificate_msg.digest[:8]} has too few signers, rejecting message.")
+            return
+        self.prepared(certificate_msg.digest, certificate_msg.view, certificate_msg.seq)
+
+    def prepared(self, digest, view, seq):
+        """ The request is prepared at this node: keep the certificate and send COMMIT. """
+        print(f"🟢 Node {self.node_id}: Reached 2f+1 PREPAREs -> Sending COMMIT.")
+        self.shard.mark_phase(digest, "prepared")
+        self.sent_commits.add(digest)
+
+        # Keep the prepared certificate so a view change can carry it into the next view
+        pre_prepare_msg = self.accepted_preprepares.get(digest)
+        if pre_prepare_msg is not None:
+            self.prepared_certificates[digest] = {
+                "view": pre_prepare_msg.view,
+                "seq": pre_prepare_msg.seq,
+                "digest": digest,
+                "client_request": pre_prepare_msg.client_request
+            }
+
+        commit_msg = Vote(COMMIT, digest, self.node_id, view, seq)
+
+        if self.network.tentative_execution and seq is not None:
+            self.prepared_seqs[seq] = digest
+            self.execute_tentatively()
+
+        self.send_vote(commit_msg)
+
+    def execute_tentatively(self):
+        """
+        Execute the next prepared request on a TentativeState layered over this node's own
+        executed state and reply to its client, without waiting for COMMITs. Only the request
+        right after the last one this node executed qualifies, so every earlier request has
+        committed here; a node that has not caught up with its state machine waits.
+        """
+        state_machine = self.state_machine
+        for seq in [seq for seq in self.prepared_seqs if seq <= self.last_applied]:
+            del self.prepared_seqs[seq]
+        if self.last_applied != state_machine.last_applied:
+            return
+
+        digest = self.prepared_seqs.pop(self.last_applied + 1, None)
+        certificate = self.prepared_certificates.get(digest)
+        if self.is_faulty or certificate is None or digest in self.shard.completed_requests:
+            return
+
+        transaction = certificate["client_request"]["request"]["transaction"]
+        results, self.tentative_executions[digest] = state_machine.execute_tentatively([transaction])
+        if transaction.get("client_node_id") is None:
+            return  # Operations the shard orders itself have no client to reply to
+
+        print(f"🟣 Node {self.node_id}: Executed {digest[:8]} tentatively -> Sending tentative REPLY.")
+        self.shard.send_reply(transaction["client_node_id"], {
+            "type": "REPLY",
+            "tentative": True,
             "digest": digest,
-            "validator_id": self.node_id
-        }
+            "timestamp": transaction.get("timestamp"),
+            "results": results,
+            "replica": self.node_id,
+            "shard": self.shard.shard_id,
+            "view": self.view_no,
+        })
 
-        self.shard.broadcast(commit_msg)
+    def rollback_tentative(self):
+        """ Throw away tentative executions that have not committed, e.g. because a view change may reorder them. """
+        rolled_back = [digest for digest in self.tentative_executions if digest not in self.shard.completed_requests]
+        if rolled_back:
+            print(f"↩️ Node {self.node_id}: Rolling back {len(rolled_back)} tentative executions.")
+            self.network.metrics.counter("tentative_rollbacks_total", "Tentative executions discarded by a view change", shard=self.shard.shard_id).inc(len(rolled_back))
+        self.tentative_executions.clear()
+        self.prepared_seqs.clear()
 
 
     def receive_commit(self, commit_msg):
         """ Process incoming COMMIT messages and notify the shard when consensus is reached. """
-        digest = commit_msg["digest"]
+        if self.is_faulty:
+            return
+
+        digest = commit_msg.digest
 
         # ✅ Stop processing if already finalized
         if digest in self.shard.completed_requests:
@@ -122,10 +276,186 @@ class ValidatorNode(Node):
         if digest not in self.commit_votes:
             self.commit_votes[digest] = set()
 
-        self.commit_votes[digest].add(commit_msg["validator_id"])
+        self.commit_votes[digest].add(commit_msg.validator_id)
 
-        print(f"🔵 Node {self.node_id}: Received COMMIT for {digest[:8]} from {commit_msg['validator_id']}.")
+        print(f"🔵 Node {self.node_id}: Received COMMIT for {digest[:8]} from {commit_msg.validator_id}.")
 
         # 2️⃣ If we have 2f+1 COMMIT messages, notify the network to finalize the request
-        if len(self.commit_votes[digest]) >= self.shard.required_commit_threshold():
-            self.shard.track_commit_vote(digest, self.node_id)  # 🏁 The network handles finalization
\ No newline at end of file
+        if len(self.commit_votes[digest]) < self.shard.required_commit_threshold():
+            return
+
+        if self.is_collector(commit_msg.view, commit_msg.seq):
+            if digest not in self.certified_commits:
+                self.certified_commits.add(digest)
+                self.shard.broadcast(Certificate(COMMIT_CERTIFICATE, digest, self.node_id, commit_msg.view, commit_msg.seq, sorted(self.commit_votes[digest])))
+            return
+
+        self.committed(digest, commit_msg.seq)
+
+    def receive_commit_certificate(self, certificate_msg):
+        """ A collector's proof that 2f+1 validators sent matching COMMITs. """
+        if self.is_faulty or certificate_msg.digest in self.shard.completed_requests:
+            return
+        if len(set(certificate_msg.signers)) < self.shard.required_commit_threshold():
+            print(f"Node {self.node_id}: COMMIT certificate for {certificate_msg.digest[:8]} has too few signers, rejecting message.")
+            return
+        self.committed(certificate_msg.digest, certificate_msg.seq)
+
+    def committed(self, digest, seq):
+        self.shard.mark_phase(digest, "committed")
+        self.stop_request_timer(digest)
+        self.failed_view_changes = 0  # The view is making progress again
+        self.shard.track_commit_vote(digest, self.node_id, seq)  # 🏁 The network handles finalization
+        if digest in self.shard.completed_requests:
+            self.mark_applied()  # Committed after the shard executed the request
+
+    def mark_applied(self):
+        """ Record that this node has executed every batch its state machine has applied. """
+        self.last_applied = self.state_machine.last_applied
+
+    def current_timeout(self):
+        """ Base timeout doubled for every consecutive view change that has not led to progress. """
+        return self.shard.base_timeout * (2 ** self.failed_view_changes)
+
+    def start_request_timer(self, digest):
+        """ Start waiting for a request to commit; if it does not, suspect the primary. """
+        if self.is_faulty or digest in self.request_timers:
+            return
+        self.request_timers[digest] = self.shard.schedule(self.current_timeout(), lambda: self.on_request_timeout(digest))
+
+    def stop_request_timer(self, digest):
+        timer = self.request_timers.pop(digest, None)
+        if timer is not None:
+            timer.cancel()
+        self.sent_votes.pop(digest, None)
+        self.all_to_all.discard(digest)
+
+    def on_request_timeout(self, digest):
+        self.request_timers.pop(digest, None)
+        if self.is_faulty or digest in self.shard.completed_requests:
+            return
+
+        accepted = self.accepted_preprepares.get(digest)
+        proposed = accepted is not None and accepted.view == self.view_no
+        if self.shard.collector is not None and proposed and digest not in self.all_to_all:
+            # The primary proposed it, so the collector may be what failed: resend the votes to everyone first
+            print(f"⏱️ Node {self.node_id}: Request {digest[:8]} stalled at its collector, falling back to all-to-all votes.")
+            self.all_to_all.add(digest)
+            for message in self.sent_votes.pop(digest, []):
+                self.shard.broadcast(message)
+            self.start_request_timer(digest)
+            return
+
+        print(f"⏱️ Node {self.node_id}: Request {digest[:8]} timed out in view {self.view_no}, suspecting the primary.")
+        self.start_view_change(self.view_no + 1)
+
+    def start_view_change(self, new_view):
+        """ Stop accepting messages for the current view and vote to move to ``new_view``. """
+        if self.is_faulty or new_view <= self.view_no:
+            return
+        if self.in_view_change and self.pending_view >= new_view:
+            return
+
+        self.in_view_change = True
+        self.pending_view = new_view
+        for digest in list(self.request_timers):
+            self.stop_request_timer(digest)
+
+        view_change_msg = ViewChange(new_view, self.node_id, [cert for cert in self.prepared_certificates.values() if cert["digest"] not in self.shard.completed_requests])
+
+        # If the next primary does not announce NEW-VIEW in time, move on to the view after it
+        if self.view_change_timer is not None:
+            self.view_change_timer.cancel()
+        self.view_change_timer = self.shard.schedule(self.current_timeout(), lambda: self.on_view_change_timeout(new_view))
+        self.failed_view_changes += 1
+
+        self.shard.broadcast(view_change_msg)
+
+    def on_view_change_timeout(self, new_view):
+        if self.in_view_change and self.pending_view == new_view:
+            print(f"⏱️ Node {self.node_id}: No NEW-VIEW for view {new_view}, moving to view {new_view + 1}.")
+            self.start_view_change(new_view + 1)
+
+    def receive_view_change(self, view_change_msg):
+        """ Collect VIEW-CHANGE votes; join early on f+1 and announce the new view on 2f+1. """
+        if self.is_faulty:
+            return
+
+        new_view = view_change_msg.new_view
+        if new_view <= self.view_no:
+            return
+
+        votes = self.view_change_votes.setdefault(new_view, {})
+        votes[view_change_msg.validator_id] = view_change_msg
+
+        # f+1 votes mean at least one correct replica timed out, so join without waiting for our own timer.
+        # Deferred through the scheduler so the votes do not recurse through each other's broadcasts.
+        if len(votes) >= self.shard.max_faulty_nodes() + 1 and (not self.in_view_change or self.pending_view < new_view):
+            self.shard.schedule(0, lambda: self.start_view_change(new_view))
+
+        if len(votes) >= self.shard.required_commit_threshold() and self.shard.primary_for_view(new_view) is self:
+            self.shard.schedule(0, lambda: self.send_new_view(new_view))
+
+    def send_new_view(self, new_view):
+        """ As primary of ``new_view``, re-propose every request prepared in an earlier view. """
+        if self.is_faulty or new_view <= self.view_no:
+            return
+
+        votes = self.view_change_votes[new_view]
+
+        # For every sequence number keep the certificate prepared in the highest view
+        chosen = {}
+        for view_change_msg in votes.values():
+            for cert in view_change_msg.prepared:
+                current = chosen.get(cert["seq"])
+                if current is None or cert["view"] > current["view"]:
+                    chosen[cert["seq"]] = cert
+
+        pre_prepares = [PrePrepare(cert["digest"], self.node_id, cert["client_request"], new_view, seq) for seq, cert in sorted(chosen.items())]
+        new_view_msg = NewView(new_view, self.node_id, sorted(votes), pre_prepares)
+
+        print(f"🔁 Node {self.node_id}: Announcing view {new_view} with {len(pre_prepares)} re-proposed requests.")
+        self.shard.install_view(new_view, self, max((seq for seq in chosen), default=0), reproposed=set(chosen))
+        self.shard.broadcast(new_view_msg)
+
+    def receive_new_view(self, new_view_msg):
+        """ Enter the announced view and prepare the requests carried over from the old one. """
+        if self.is_faulty:
+            return
+
+        new_view = new_view_msg.view
+        if new_view <= self.view_no:
+            return
+        if len(new_view_msg.view_changes) < self.shard.required_commit_threshold():
+            print(f"Node {self.node_id}: NEW-VIEW for view {new_view} lacks 2f+1 VIEW-CHANGE votes, rejecting message.")
+            return
+        if self.shard.primary_for_view(new_view).node_id != new_view_msg.primary_id:
+            print(f"Node {self.node_id}: NEW-VIEW for view {new_view} not sent by its primary, rejecting message.")
+            return
+
+        self.enter_view(new_view)
+
+        for pre_prepare_msg in new_view_msg.pre_prepares:
+            self.accepted_preprepares[pre_prepare_msg.digest] = pre_prepare_msg
+            self.record_primary_vote(pre_prepare_msg)
+            if self.isPrimary:
+                self.proposed.add(pre_prepare_msg.digest)
+            else:
+                self.pending_prepares.append(pre_prepare_msg)
+
+        # Give the new primary a full (backed-off) timeout for everything still outstanding
+        for digest in self.shard.pending_requests:
+            self.start_request_timer(digest)
+
+    def enter_view(self, new_view):
+        self.rollback_tentative()
+        self.view_no = new_view
+        self.in_view_change = False
+        self.pending_view = None
+        self.proposed = set()
+        if self.view_change_timer is not None:
+            self.view_change_timer.cancel()
+            self.view_change_timer = None
+
+        for view in [view for view in self.view_change_votes if view <= new_view]:
+            del self.view_change_votes[view]
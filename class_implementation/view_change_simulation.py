@@ -0,0 +1,78 @@
+import contextlib
+import io
+import random
+import sys
+from network import Network
+from validator_node import ValidatorNode
+from client_node import ClientNode
+from shard import Shard
+
+
+def build_shard(n_validators, base_timeout):
+    network = Network()
+    shard = Shard(shard_id=0, network=network, base_timeout=base_timeout)
+    network.add_shard(shard)
+
+    for i in range(n_validators):
+        shard.add_validator_node(ValidatorNode(node_id=i, network=network, shard=shard, cpu_rating=random.uniform(1, 10)))
+
+    clients = [ClientNode(node_id=n_validators + i, network=network, shard=shard) for i in range(2)]
+    for client in clients:
+        shard.add_client_node(client)
+
+    return shard, clients
+
+
+def run(n_validators=7, crashed_primaries=1, fail_at=2.0, duration=60.0, tick=0.1, base_timeout=1.0, seed=42):
+    """
+    Send one request per tick, crash ``crashed_primaries`` consecutive primaries at ``fail_at``
+    and measure how long the shard takes to finalize requests again.
+
+    :return: Failover latency (simulated seconds until the first request finalizes after the crash),
+             the number of view changes and throughput before and after the crash.
+    """
+    random.seed(seed)
+    shard, clients = build_shard(n_validators, base_timeout)
+
+    step = 0
+    while shard.clock < duration:
+        if step * tick >= fail_at and crashed_primaries:
+            # Crash the current primary and the ones next in line, so later view changes also fail and back off
+            view = shard.view_no
+            for offset in range(crashed_primaries):
+                shard.fail_node(shard.primary_for_view(view + offset))
+            crash_time = shard.clock
+            crashed_primaries = 0
+
+        clients[0].create_request(f"transfer {step}", clients[1].get_node_id())
+        shard.process_requests()
+        shard.advance_time(tick)
+        step += 1
+
+    resumed = [clock for clock, _ in shard.completion_log if clock >= crash_time]
+    before = [clock for clock, _ in shard.completion_log if clock < crash_time]
+    after_window = duration - resumed[0] if resumed else 0
+
+    return {
+        "validators": n_validators,
+        "failover_latency_s": resumed[0] - crash_time if resumed else None,
+        "view_changes": len(shard.view_change_log),
+        "final_view": shard.view_no,
+        "throughput_before_rps": len(before) / crash_time if crash_time else 0.0,
+        "throughput_after_rps": len(resumed) / after_window if after_window else 0.0,
+    }
+
+
+def main():
+    n_validators = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+
+    max_faulty = (n_validators - 1) // 3
+
+    for crashed in range(1, max_faulty + 1):
+        with contextlib.redirect_stdout(io.StringIO()):  # The protocol handlers print every message
+            result = run(n_validators=n_validators, crashed_primaries=crashed)
+        print(f"{crashed} crashed primaries: {result}")
+
+
+if __name__ == '__main__':
+    main()
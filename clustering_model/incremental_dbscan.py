@@ -0,0 +1,407 @@
+import itertools
+import math
+import random
+import sys
+import time
+import numpy as np
+from sklearn.cluster import DBSCAN
+from dbscan_clustering import find_optimal_eps
+from dummy_network import DummyNode
+
+NOISE = -1
+FEATURES = ("cpu_rating", "reputation_score", "ram_usage")  # Same features as compute_subshards_dbscan
+
+
+def node_features(node):
+    return np.array([getattr(node, feature) for feature in FEATURES], dtype=float)
+
+
+class IncrementalDBSCAN:
+    def __init__(self, eps, min_samples=2):
+        """
+        DBSCAN that follows a stream of inserted, removed and moved points, with the same
+        clusters as a batch DBSCAN over the current points (up to border points within
+        reach of two clusters, which, as in the batch version, go to either one).
+
+        Points are kept in a grid of cells ``eps`` wide, so a neighbourhood query only
+        looks at the 3^d cells around a point. An update revisits the neighbourhoods of
+        the point's old and new position. Only if a link between two core points was lost
+        can a cluster split; the core graph is then searched from the ends of the lost
+        links until the searches meet, or all but one have run out.
+
+        Every update returns its events as (kind, point id, cluster id) tuples:
+        ``("join", p, c)`` when p enters cluster c, ``("leave", p, c)`` when it leaves c,
+        and ``("outlier", p, None)`` when it becomes noise.
+
+        :param eps: Neighbourhood radius, as in sklearn's DBSCAN.
+        :param min_samples: Points within ``eps`` (the point included) that make a point core.
+        """
+        self.eps = eps
+        self.min_samples = min_samples
+
+        self.points = {}  # point id -> feature vector
+        self.grid = {}  # cell -> set of point ids
+        self.neighbour_counts = {}  # point id -> points within eps, itself included
+        self.labels = {}  # point id -> cluster id or NOISE
+        self.clusters = {}  # cluster id -> set of point ids
+        self.next_cluster = 0
+        self.events = []
+        self.offsets = None  # Cell offsets of a neighbourhood, set once the dimension is known
+        self.around = {}  # cell -> the 3^d cells a neighbourhood query in it looks at
+
+    @classmethod
+    def from_network(cls, network, min_samples=2, eps=None):
+        """ Cluster a network's validators, choosing eps once the way compute_subshards_dbscan does. """
+        if eps is None:
+            eps = find_optimal_eps(np.array([node_features(node) for node in network.validator_nodes]), min_samples)
+        model = cls(eps, min_samples)
+        model.update({node.node_id: node_features(node) for node in network.validator_nodes})
+        return model
+
+    def cell(self, features):
+        return tuple(math.floor(value / self.eps) for value in features)
+
+    def neighbours(self, features, exclude=None):
+        """ Ids of the points within eps of ``features``. """
+        base = self.cell(features)
+        around = self.around.get(base)
+        if around is None:
+            around = self.around[base] = [tuple(c + o for c, o in zip(base, offset)) for offset in self.offsets]
+        candidates = []
+        for cell in around:
+            candidates.extend(self.grid.get(cell, ()))
+        if not candidates:
+            return set()
+
+        distances = ((np.array([self.points[q] for q in candidates]) - features) ** 2).sum(axis=1)
+        return {q for q, distance in zip(candidates, distances) if distance <= self.eps ** 2 and q != exclude}
+
+    def is_core(self, point_id):
+        return self.neighbour_counts.get(point_id, 0) >= self.min_samples
+
+    def insert(self, point_id, features):
+        return self.update({point_id: features})
+
+    def remove(self, point_id):
+        return self.update({point_id: None})
+
+    def move(self, point_id, features):
+        return self.update({point_id: features})
+
+    def update(self, changes):
+        """
+        Apply a batch of changes, one point at a time.
+
+        :param changes: Mapping from point id to its new feature vector, or None to remove it.
+        :return: The join, leave and outlier events the batch caused.
+        """
+        self.events = []
+        for point_id, features in changes.items():
+            if self.offsets is None and features is not None:
+                self.offsets = list(itertools.product((-1, 0, 1), repeat=len(features)))
+            self.apply(point_id, None if features is None else np.asarray(features, dtype=float))
+        return self.events
+
+    def apply(self, point_id, new):
+        old = self.points.get(point_id)
+        if old is None and new is None:
+            return
+
+        was_core = old is not None and self.is_core(point_id)
+        if old is not None:
+            self.grid[self.cell(old)].discard(point_id)
+
+        old_neighbours = self.neighbours(old, exclude=point_id) if old is not None else set()
+        new_neighbours = self.neighbours(new, exclude=point_id) if new is not None else set()
+        touched = old_neighbours | new_neighbours
+        core_before = {q for q in touched if self.is_core(q)}
+
+        for q in old_neighbours:
+            self.neighbour_counts[q] -= 1
+        for q in new_neighbours:
+            self.neighbour_counts[q] += 1
+
+        if new is None:
+            del self.points[point_id]
+            del self.neighbour_counts[point_id]
+            self.set_label(point_id, None)
+        else:
+            self.points[point_id] = new
+            self.grid.setdefault(self.cell(new), set()).add(point_id)
+            self.neighbour_counts[point_id] = len(new_neighbours) + 1
+            self.labels.setdefault(point_id, None)
+
+        core_after = {q for q in touched if self.is_core(q)}
+        is_core = new is not None and self.is_core(point_id)
+
+        demoted = core_before - core_after
+        promoted = core_after - core_before
+        borders = touched | ({point_id} if new is not None else set())
+
+        # A cluster can only split where a link between two core points was lost: at a
+        # demoted point, or at the updated point if it was core and left core neighbours
+        anchors = set()
+        for q in demoted:
+            nearby = self.neighbours(self.points[q], exclude=q)
+            anchors |= {r for r in nearby if self.is_core(r)}
+            borders |= nearby
+        cut = (old_neighbours - new_neighbours) & core_before if was_core else set()
+        if was_core and (not is_core or cut):
+            anchors |= (cut if is_core else old_neighbours) & core_after
+            if is_core:
+                anchors.add(point_id)
+        self.split(anchors - promoted)
+
+        if is_core:
+            promoted.add(point_id)  # Its links may be new even if it already was core
+        self.link(promoted, point_id if was_core else None)
+        for q in borders:
+            if not self.is_core(q):
+                self.set_label(q, self.border_label(q))
+
+    def link(self, promoted, kept=None):
+        """
+        Attach newly core points to the clusters they reach, merging clusters they bridge.
+
+        :param kept: A point among ``promoted`` that was already core, and keeps its
+                     cluster even if it is that cluster's only core point.
+        """
+        unvisited = set(promoted)
+        while unvisited:
+            # Promoted points reachable from each other through core links form one group
+            start = unvisited.pop()
+            group = {start}
+            frontier = [start]
+            reached = set()
+            while frontier:
+                q = frontier.pop()
+                for r in self.neighbours(self.points[q], exclude=q):
+                    if not self.is_core(r):
+                        continue
+                    if r in unvisited:
+                        unvisited.discard(r)
+                        group.add(r)
+                        frontier.append(r)
+                    elif r not in group and self.labels.get(r) not in (None, NOISE):
+                        reached.add(self.labels[r])
+                if q == kept:
+                    reached.add(self.labels[q])
+
+            if reached:
+                survivor = max(reached, key=lambda label: (len(self.clusters[label]), -label))
+                for label in reached - {survivor}:
+                    for q in list(self.clusters[label]):
+                        self.set_label(q, survivor)
+            else:
+                survivor = self.new_cluster()
+
+            for q in group:
+                self.set_label(q, survivor)
+                for r in self.neighbours(self.points[q], exclude=q):
+                    if not self.is_core(r) and self.labels.get(r) in (None, NOISE):
+                        self.set_label(r, survivor)
+
+    def split(self, anchors):
+        """ Give every piece a cluster broke into, apart from the largest, a cluster of its own. """
+        by_label = {}
+        for q in anchors:
+            by_label.setdefault(self.labels[q], set()).add(q)
+
+        for starts in by_label.values():
+            if len(starts) < 2:
+                continue  # Every piece holds an anchor, so one anchor means one piece
+            for piece in self.pieces(starts):
+                label = self.new_cluster()
+                for q in piece:
+                    self.set_label(q, label)
+                for q in piece:
+                    for r in self.neighbours(self.points[q], exclude=q):
+                        if not self.is_core(r):
+                            self.set_label(r, self.border_label(r))
+
+    def pieces(self, starts):
+        """
+        Search the core graph from every start at once, joining searches that meet, until
+        at most one search is still running.
+
+        The searches that ran out are pieces cut off from the rest, so the cost is the
+        size of the pieces that broke off rather than of the whole cluster.
+
+        :return: The pieces that broke off, as sets of core points; empty if none did.
+        """
+        owner = {}  # point id -> search that reached it first
+        parent = {}  # search -> search it was joined into
+        frontiers = {}
+        members = {}
+        for q in starts:
+            owner[q] = parent[q] = q
+            frontiers[q] = [q]
+            members[q] = {q}
+
+        def root(search):
+            while parent[search] != search:
+                parent[search] = parent[parent[search]]
+                search = parent[search]
+            return search
+
+        while len(members) > 1 and sum(1 for search in members if frontiers[search]) > 1:
+            for search in list(members):
+                if search not in members or not frontiers[search]:
+                    continue
+                q = frontiers[search].pop()
+                for r in self.neighbours(self.points[q], exclude=q):
+                    if not self.is_core(r):
+                        continue
+                    other = owner.get(r)
+                    if other is None:
+                        owner[r] = search
+                        members[search].add(r)
+                        frontiers[search].append(r)
+                        continue
+                    other = root(other)
+                    if other != search:
+                        if len(members[other]) > len(members[search]):
+                            search, other = other, search
+                        parent[other] = search
+                        members[search] |= members.pop(other)
+                        frontiers[search] += frontiers.pop(other)
+
+        if len(members) == 1:
+            return []
+        finished = sorted(members.values(), key=len)
+        running = [members[search] for search in members if frontiers[search]]
+        keep = running[0] if running else finished[-1]
+        return [piece for piece in finished if piece is not keep]
+
+    def border_label(self, point_id):
+        """ Cluster of a non-core point: its current one if a core neighbour still holds it, else any reachable one. """
+        reachable = {self.labels[q] for q in self.neighbours(self.points[point_id], exclude=point_id) if self.is_core(q) and self.labels.get(q) not in (None, NOISE)}
+        current = self.labels.get(point_id)
+        if current in reachable:
+            return current
+        return min(reachable) if reachable else NOISE
+
+    def new_cluster(self):
+        label = self.next_cluster
+        self.next_cluster += 1
+        self.clusters[label] = set()
+        return label
+
+    def set_label(self, point_id, label):
+        """ Move a point to a cluster, to NOISE, or out of the model (None), recording the events. """
+        current = self.labels.get(point_id)
+        if current == label:
+            return
+
+        if current not in (None, NOISE):
+            self.clusters[current].discard(point_id)
+            if not self.clusters[current]:
+                del self.clusters[current]
+            self.events.append(("leave", point_id, current))
+
+        if label is None:
+            self.labels.pop(point_id, None)
+            return
+
+        self.labels[point_id] = label
+        if label == NOISE:
+            self.events.append(("outlier", point_id, None))
+        else:
+            self.clusters.setdefault(label, set()).add(point_id)
+            self.events.append(("join", point_id, label))
+
+    def outliers(self):
+        return [point_id for point_id, label in self.labels.items() if label == NOISE]
+
+    def subshards(self):
+        """ Cluster id -> member ids and centroid, like the result of compute_subshards_dbscan. """
+        return {
+            label: {"nodes": sorted(members), "centroid": np.mean([self.points[q] for q in members], axis=0)}
+            for label, members in self.clusters.items()
+        }
+
+
+def core_partition(labels, core):
+    """ Clusters as frozensets of their core points, which DBSCAN assigns unambiguously. """
+    groups = {}
+    for point_id, label in labels.items():
+        if point_id in core and label != NOISE:
+            groups.setdefault(label, set()).add(point_id)
+    return {frozenset(group) for group in groups.values()}
+
+
+def matches_batch(model):
+    """ Check the incremental clusters and outliers against sklearn's DBSCAN on the same points. """
+    ids = list(model.points)
+    X = np.array([model.points[point_id] for point_id in ids])
+    batch = DBSCAN(eps=model.eps, min_samples=model.min_samples).fit(X)
+    core = {ids[i] for i in batch.core_sample_indices_}
+    batch_labels = dict(zip(ids, batch.labels_))
+
+    return (
+        core == {point_id for point_id in ids if model.is_core(point_id)}
+        and core_partition(batch_labels, core) == core_partition(model.labels, core)
+        and {point_id for point_id, label in batch_labels.items() if label == NOISE} == set(model.outliers())
+    )
+
+
+def profile_node(node_id, profile):
+    cpu, reputation, ram = profile
+    return DummyNode(node_id=node_id,
+                     cpu_rating=random.gauss(cpu, 0.2),
+                     reputation_score=random.gauss(reputation, 0.05),
+                     ram_usage=random.gauss(ram, 10))
+
+
+if __name__ == '__main__':
+    random.seed(42)
+    n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    n_batches = 50
+    min_samples = 5
+
+    # Validators come in a few hardware profiles: (cpu_rating, reputation_score, ram_usage)
+    profiles = [(1.5, 0.9, 120), (2.5, 0.8, 200), (3.5, 0.7, 260), (4.5, 0.9, 350)]
+    nodes = [profile_node(i, random.choice(profiles)) for i in range(n_nodes)]
+
+    # The elbow of find_optimal_eps lands in the tail of the k-distances here and merges
+    # every profile into one cluster, so use a radius a little above the typical 5th-neighbour distance
+    eps = 0.25
+    start = time.perf_counter()
+    model = IncrementalDBSCAN(eps, min_samples)
+    model.update({node.node_id: node_features(node) for node in nodes})
+    print(f"Initial clusters: {len(model.clusters)}, outliers: {len(model.outliers())}, "
+          f"built in {time.perf_counter() - start:.2f} s, matches batch DBSCAN: {matches_batch(model)}")
+
+    # Telemetry feed: every batch jitters 100 validators, 2 leave, 2 join, and 2 start
+    # misbehaving, their RAM usage running away from their profile
+    next_id = n_nodes
+    counts = {"join": 0, "leave": 0, "outlier": 0}
+    incremental_seconds = 0.0
+    batch_seconds = 0.0
+    for _ in range(n_batches):
+        ids = list(model.points)
+        changes = {}
+        for node_id in random.sample(ids, 100):
+            changes[node_id] = model.points[node_id] + np.array([random.gauss(0, 0.01), random.gauss(0, 0.002), random.gauss(0, 0.1)])
+        for node_id in random.sample(ids, 2):
+            changes[node_id] = model.points[node_id] + np.array([0, 0, random.choice((-1, 1)) * random.uniform(40, 80)])
+        for node_id in random.sample(ids, 2):
+            changes[node_id] = None
+        for _ in range(2):
+            changes[next_id] = node_features(profile_node(next_id, random.choice(profiles)))
+            next_id += 1
+
+        start = time.perf_counter()
+        events = model.update(changes)
+        incremental_seconds += time.perf_counter() - start
+        for kind, _, _ in events:
+            counts[kind] += 1
+
+        start = time.perf_counter()
+        DBSCAN(eps=eps, min_samples=min_samples).fit(np.array(list(model.points.values())))
+        batch_seconds += time.perf_counter() - start
+
+    print(f"Events over {n_batches} batches of {len(changes)} changes: {counts}")
+    print(f"Clusters: {len(model.clusters)}, outliers: {len(model.outliers())}, matches batch DBSCAN: {matches_batch(model)}")
+    print(f"Mean time per batch: incremental {incremental_seconds / n_batches * 1000:.1f} ms, "
+          f"recomputing from scratch {batch_seconds / n_batches * 1000:.1f} ms")
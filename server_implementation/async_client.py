@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+all_nodes = ["http://localhost:5000", "http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+
+
+class PendingRequest:
+    def __init__(self, request_id, message, future):
+        """
+        Book-keeping for one outstanding client request.
+
+        :param request_id: Client-assigned id the replicas echo back in their replies.
+        :param message: The body posted to the primary's /request route.
+        :param future: Future completed with the agreed digest once f+1 replies match.
+        """
+        self.request_id = request_id
+        self.message = message
+        self.future = future
+        self.replies = {}  # replica url -> digest it replied with
+        self.sent_at = time.perf_counter()
+        self.attempts = 0
+
+
+class AsyncPBFTClient:
+    def __init__(self, nodes=None, host="localhost", port=5004, timeout=2.0, max_retries=5):
+        """
+        Pipelined asyncio client for the HTTP PBFT replicas.
+
+        Any number of requests may be outstanding at once. Replies are matched
+        to requests by ``request_id`` and a request completes once f+1 distinct
+        replicas reply with the same digest.
+
+        :param nodes: Replica urls; the primary for view v is nodes[v % len(nodes)].
+        :param host: Interface the reply listener binds to.
+        :param port: Port the reply listener binds to (replicas post to /reply).
+        :param timeout: Seconds to wait for f+1 replies before retransmitting.
+        :param max_retries: Retransmissions before the request's future fails.
+        """
+        self.nodes = nodes or all_nodes
+        self.max_faulty_nodes = (len(self.nodes) - 1) // 3
+        self.client_url = f"http://{host}:{port}"
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.view_no = 0
+        self.pending = {}
+        self.request_ids = itertools.count()
+        self.session = None
+        self.runner = None
+
+    def required_replies(self):
+        """ Return the f+1 matching replies needed to accept a result. """
+        return self.max_faulty_nodes + 1
+
+    def required_read_replies(self):
+        """ Return the 2f+1 matching replies needed to accept a read that was not ordered. """
+        return 2 * self.max_faulty_nodes + 1
+
+    def get_primary(self):
+        return self.nodes[self.view_no % len(self.nodes)]
+
+    async def start(self):
+        """ Open the outbound session and start listening for replies. """
+        self.session = ClientSession(timeout=ClientTimeout(total=self.timeout))
+
+        app = web.Application()
+        app.router.add_post("/reply", self.handle_reply)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self):
+        for pending in self.pending.values():
+            pending.future.cancel()
+        self.pending.clear()
+
+        if self.session is not None:
+            await self.session.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def handle_reply(self, request):
+        """ Match a replica's REPLY to its outstanding request and count it. """
+        data = await request.json()
+        pending = self.pending.get(data.get("request_id"))
+
+        if pending is None or pending.future.done():
+            return web.json_response({"status": "IGNORED"})
+
+        replica = data.get("replica")
+        if replica is None or replica in pending.replies:
+            return web.json_response({"status": "DUPLICATE"})
+
+        pending.replies[replica] = data["digest"]
+        if "view" in data:
+            self.view_no = max(self.view_no, data["view"])
+
+        matching = sum(1 for digest in pending.replies.values() if digest == data["digest"])
+        if matching >= self.required_replies():
+            pending.future.set_result(data["result"] if "result" in data else data["digest"])  # Ordered reads carry their result
+
+        return web.json_response({"status": "RECEIVED", "request_id": pending.request_id})
+
+    async def _post(self, node, message):
+        try:
+            async with self.session.post(f"{node}/request", json=message) as response:
+                await response.read()
+        except (asyncio.TimeoutError, OSError):
+            pass  # An unreachable replica is handled by the retransmission timer
+
+    async def _post_read(self, node, message):
+        try:
+            async with self.session.post(f"{node}/request", json=message) as response:
+                if response.status == 200:
+                    return await response.json()
+        except (asyncio.TimeoutError, OSError):
+            pass
+        return None
+
+    async def _send(self, pending):
+        pending.attempts += 1
+
+        if pending.attempts == 1:
+            await self._post(self.get_primary(), pending.message)
+        else:
+            # On retransmission the primary may be faulty, so broadcast to every replica
+            await asyncio.gather(*(self._post(node, pending.message) for node in self.nodes))
+
+    async def submit(self, operation):
+        """
+        Send an operation and wait until f+1 replicas agree on its digest.
+
+        :return: The digest the replicas committed.
+        """
+        timestamp = next(self.request_ids)  # Replicas use it to recognise retransmissions
+        request_id = f"{self.client_url}#{timestamp}"
+        message = {"operation": operation, "client_url": self.client_url, "request_id": request_id, "timestamp": timestamp}
+        pending = PendingRequest(request_id, message, asyncio.get_running_loop().create_future())
+        self.pending[request_id] = pending
+
+        try:
+            while True:
+                await self._send(pending)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(pending.future), self.timeout)
+                except asyncio.TimeoutError:
+                    if pending.attempts > self.max_retries:
+                        raise
+                    print(f"⏱️ Request {request_id} timed out, retransmitting (attempt {pending.attempts + 1}).")
+        finally:
+            del self.pending[request_id]
+
+    async def read(self, operation):
+        """
+        Send a read-only operation (e.g. {"operation": "status", "request_id": ...}) to every
+        replica at once and accept the result 2f+1 of them agree on, in one round trip.
+
+        If the answers do not match, e.g. because a write is committing concurrently,
+        the operation is ordered like any other request instead.
+
+        :return: The agreed result.
+        """
+        timestamp = next(self.request_ids)
+        message = {"operation": operation, "client_url": self.client_url, "request_id": f"{self.client_url}#{timestamp}", "timestamp": timestamp, "read_only": True}
+        replies = await asyncio.gather(*(self._post_read(node, message) for node in self.nodes))
+
+        matching = {}
+        for reply in replies:
+            if reply is None:
+                continue
+            key = json.dumps(reply["result"], sort_keys=True)
+            matching[key] = matching.get(key, 0) + 1
+            if matching[key] >= self.required_read_replies():
+                return reply["result"]
+
+        print(f"↩️ Read {message['request_id']} got no 2f+1 matching replies, ordering it instead.")
+        return await self.submit(operation)
+
+    async def run_closed_loop(self, operation, concurrency=8, total_requests=1000):
+        """
+        Closed-loop benchmark: ``concurrency`` workers each keep one request in flight.
+
+        :return: Throughput and latency statistics.
+        """
+        remaining = itertools.count()
+        latencies = []
+
+        async def worker():
+            while next(remaining) < total_requests:
+                start = time.perf_counter()
+                await self.submit(operation)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - start)
+
+    async def run_open_loop(self, operation, rate=100.0, duration=10.0, seed=42):
+        """
+        Open-loop benchmark: requests arrive as a Poisson process at ``rate`` per second
+        regardless of how many are still outstanding.
+
+        :return: Throughput and latency statistics.
+        """
+        rng = random.Random(seed)
+        latencies = []
+        failures = 0
+
+        async def one_request():
+            nonlocal failures
+            start = time.perf_counter()
+            try:
+                await self.submit(operation)
+                latencies.append(time.perf_counter() - start)
+            except asyncio.TimeoutError:
+                failures += 1
+
+        tasks = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            tasks.append(asyncio.create_task(one_request()))
+            await asyncio.sleep(rng.expovariate(rate))
+
+        await asyncio.gather(*tasks)
+        stats = summarize(latencies, time.perf_counter() - start)
+        stats["failed"] = failures
+        return stats
+
+
+def summarize(latencies, elapsed):
+    """ Reduce per-request latencies to throughput and percentile figures. """
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "completed": len(ordered),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        "latency_p50_s": percentile(0.50),
+        "latency_p99_s": percentile(0.99),
+    }
+
+
+async def main(mode):
+    operation = {"operation": "transfer", "amount": 100}
+
+    async with AsyncPBFTClient() as client:
+        if mode == "open":
+            stats = await client.run_open_loop(operation, rate=50.0, duration=10.0)
+        else:
+            stats = await client.run_closed_loop(operation, concurrency=8, total_requests=200)
+
+    print(f"{mode}-loop results: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "closed"))
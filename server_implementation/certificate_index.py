@@ -0,0 +1,60 @@
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+EQUIVOCATION = "equivocation"
+
+
+class CertificateIndex:
+    def __init__(self, quorum):
+        """
+        Votes of one protocol phase, indexed per instance (view, seq).
+
+        Each instance keeps the first digest every sender voted for and a running
+        count per digest, so recording a vote, catching a sender that contradicts
+        itself and testing for a quorum are all O(1). Nothing is decided about
+        disagreeing senders until some digest gathers ``quorum`` votes: before
+        that, a differing digest may just be a message that arrived out of order.
+
+        :param quorum: Matching votes that complete a certificate.
+        """
+        self.quorum = quorum
+        self.instances = {}  # (view, seq) -> {"votes": {sender: digest}, "counts": {digest: n}, "certified": digest or None}
+
+    def add(self, view, seq, sender, digest):
+        """
+        Record ``sender``'s vote for ``digest`` in instance (view, seq).
+
+        :return: ACCEPTED for a first vote, DUPLICATE if the sender already voted
+                 for the same digest, EQUIVOCATION if it voted for another one.
+        """
+        instance = self.instances.get((view, seq))
+        if instance is None:
+            instance = self.instances[(view, seq)] = {"votes": {}, "counts": {}, "certified": None}
+
+        first = instance["votes"].get(sender)
+        if first is not None:
+            return DUPLICATE if first == digest else EQUIVOCATION
+
+        instance["votes"][sender] = digest
+        count = instance["counts"][digest] = instance["counts"].get(digest, 0) + 1
+        if instance["certified"] is None and count >= self.quorum:
+            instance["certified"] = digest
+        return ACCEPTED
+
+    def certified(self, view, seq):
+        """ The digest that completed the instance's certificate, or None while it is incomplete. """
+        instance = self.instances.get((view, seq))
+        return instance["certified"] if instance is not None else None
+
+    def count(self, view, seq, digest):
+        instance = self.instances.get((view, seq))
+        return instance["counts"].get(digest, 0) if instance is not None else 0
+
+    def dissenters(self, view, seq):
+        """ Senders whose vote differs from the certified digest; empty until the certificate is complete. """
+        instance = self.instances.get((view, seq))
+        if instance is None or instance["certified"] is None:
+            return []
+        return [sender for sender, digest in instance["votes"].items() if digest != instance["certified"]]
+
+    def __len__(self):
+        return len(self.instances)
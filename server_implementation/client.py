@@ -1,17 +1,43 @@
 import requests
 import hashlib
 import json
+import time
+import uuid
 
 client_url = "http://localhost:5004"  # Client URL
 primary_node = "http://localhost:5000"
+all_nodes = ["http://localhost:5000", "http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+max_faulty_nodes = (len(all_nodes) - 1) // 3
 
 def send_request(data):
-    """Send request to primary node."""
+    """Send request to primary node. For pipelined requests use async_client.AsyncPBFTClient."""
     digest = hashlib.sha256(json.dumps(data).encode()).hexdigest()
-    request_data = {"operation": data, "client_url": client_url}
+    request_data = {"operation": data, "client_url": client_url, "request_id": str(uuid.uuid4()), "timestamp": time.time_ns()}
 
     response = requests.post(f"{primary_node}/request", json=request_data)
     print(f"Sent request: {response.json()}")
 
+def send_read(data):
+    """Send a read-only operation to every replica; accept 2f+1 matching answers, or fall back to ordering it."""
+    request_data = {"operation": data, "client_url": client_url, "request_id": str(uuid.uuid4()), "timestamp": time.time_ns(), "read_only": True}
+
+    matching = {}
+    for node in all_nodes:
+        try:
+            response = requests.post(f"{node}/request", json=request_data, timeout=2)
+        except requests.RequestException:
+            continue
+        if response.status_code != 200:
+            continue
+        result = response.json()["result"]
+        key = json.dumps(result, sort_keys=True)
+        matching[key] = matching.get(key, 0) + 1
+        if matching[key] >= 2 * max_faulty_nodes + 1:
+            print(f"Read result: {result}")
+            return result
+
+    print("Read replies did not match, ordering the read instead.")
+    send_request(data)
+
 if __name__ == "__main__":
     send_request({"operation": "transfer", "amount": 100})
@@ -1,24 +1,42 @@
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 
 app = Flask(__name__)
 
-replies_received = {}
+all_nodes = ["http://localhost:5000", "http://localhost:5001", "http://localhost:5002", "http://localhost:5003"]
+max_faulty_nodes = (len(all_nodes) - 1) // 3
+
+replies_received = {}  # Replies for requests not yet finalized
+finalized = OrderedDict()  # Recently finalized requests, so late replies are dropped rather than stored again
+max_finalized = 10000
 
 @app.route('/reply', methods=['POST'])
 def handle_reply():
     """Handle reply messages from nodes."""
     data = request.json
     digest = data["digest"]
+    request_key = data.get("request_id") or digest  # Older replicas only send the digest
+
+    if request_key in finalized:
+        return jsonify({"status": "FINALIZED", "digest": digest})
+
+    if request_key not in replies_received:
+        replies_received[request_key] = {}
 
-    if digest not in replies_received:
-        replies_received[digest] = []
-    replies_received[digest].append(data)
+    # Count each replica at most once, since a replica may reply to every COMMIT it sees
+    replica = data.get("replica", len(replies_received[request_key]))
+    replies_received[request_key][replica] = data
 
     print(f"Received reply: {data}")
 
-    # If we received at least 2 replies (f+1), finalize confirmation
-    if len(replies_received[digest]) >= 2:
-        print(f"✅ Request {digest} finalized by PBFT!")
+    # If f+1 replicas sent a matching digest, at least one of them is honest, so finalize
+    matching = [reply for reply in replies_received[request_key].values() if reply["digest"] == digest]
+    if len(matching) >= max_faulty_nodes + 1:
+        print(f"✅ Request {request_key} finalized by PBFT!")
+        del replies_received[request_key]
+        finalized[request_key] = digest
+        if len(finalized) > max_finalized:
+            finalized.popitem(last=False)
 
     return jsonify({"status": "RECEIVED", "digest": digest})
 
@@ -0,0 +1,81 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class ConsensusWorker:
+    def __init__(self, replica, max_queue=1024):
+        """
+        Runs a replica's protocol handlers on one dedicated thread.
+
+        Inbound messages are queued by the serving threads and acknowledged at
+        once; the worker then handles them strictly in arrival order, so the
+        replica's state is only ever touched from this thread and peer sends
+        never hold a server thread.
+
+        :param replica: The Replica whose ``dispatch`` processes each message.
+        :param max_queue: Bound on queued messages. When full, ``submit`` refuses new
+                          messages so senders back off instead of growing memory.
+        """
+        self.replica = replica
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.depth = replica.metrics.gauge("consensus_queue_depth", "Messages waiting for the consensus worker")
+        self.rejected = replica.metrics.counter("consensus_queue_rejected_total", "Messages refused because the queue was full")
+        self.thread = threading.Thread(target=self.run, name=f"consensus-{replica.node_url}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, route, message, size=None):
+        """
+        Queue a message for the worker.
+
+        :return: True if queued, False if the queue is full (apply backpressure).
+        """
+        return self.enqueue(route, message, size, None)
+
+    def call(self, route, message, size=None, timeout=None):
+        """
+        Queue a message and wait for the worker to handle it, for routes whose caller needs the answer
+        (client requests and reads). The handler still runs on the worker thread, in arrival order.
+
+        :return: The handler's ``(body, status)``, or None if the queue is full.
+        """
+        result = Future()
+        if not self.enqueue(route, message, size, result):
+            return None
+        return result.result(timeout)
+
+    def enqueue(self, route, message, size, result):
+        try:
+            self.queue.put_nowait((route, message, size, result))
+        except queue.Full:
+            self.rejected.inc()
+            return None
+
+        self.depth.set(self.queue.qsize())
+        return True
+
+    def stop(self):
+        """ Finish the messages already queued, then stop the worker. """
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            route, message, size, result = item
+            try:
+                response = self.replica.dispatch(route, message, size=size)
+                if result is not None:
+                    result.set_result(response)
+            except Exception as exc:  # A bad message must not kill the worker
+                print(f"⚠️ Consensus worker failed on {route}: {exc}")
+                if result is not None:
+                    result.set_exception(exc)
+            finally:
+                self.depth.set(self.queue.qsize())
@@ -0,0 +1,38 @@
+import contextlib
+import io
+import sys
+import time
+
+from replica import create_loopback_cluster
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    total_requests = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    authenticate = "--auth" in sys.argv[3:]
+
+    transport, replicas = create_loopback_cluster(n=n, seed=42, authenticate=authenticate)
+    replies = {}
+
+    def client(route, message):
+        replies.setdefault(message["request_id"], set()).add(message["replica"])
+        return {"status": "RECEIVED"}, 200
+
+    transport.register("loopback://client", client)
+    f = replicas[0].max_faulty_nodes
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # The handlers print every commit
+        for i in range(total_requests):
+            request = {"operation": {"operation": "transfer", "amount": i}, "client_url": "loopback://client", "request_id": str(i)}
+            transport.deliver(replicas[0].get_primary(), "/request", request)
+            transport.run()
+    elapsed = time.perf_counter() - start
+
+    finalized = sum(1 for replicas_replied in replies.values() if len(replicas_replied) >= f + 1)
+    print(f"{n} replicas, {total_requests} requests{' (authenticated)' if authenticate else ''}: {finalized} finalized, {transport.delivered} messages delivered")
+    print(f"{total_requests / elapsed:.1f} requests/s, {transport.delivered / elapsed:.1f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import bisect
+import time
+from collections import OrderedDict
+
+# Latency buckets in seconds, from 100us up to 10s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Fixed-bucket histogram.
+
+        Observations only do a bisect and two in-place additions with no lock, so
+        hot paths never contend; under the GIL a concurrent scrape may see a value
+        a few observations stale, which is fine for monitoring.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def count(self):
+        return sum(self.counts)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="pbft"):
+        """
+        Named metric families, each split into children by label values, rendered
+        in the Prometheus text exposition format.
+
+        :param prefix: Prepended to every metric name.
+        """
+        self.prefix = prefix
+        self.families = {}  # name -> (kind, help, factory, {label tuple: metric})
+
+    def _child(self, kind, name, help_text, factory, labels):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families.setdefault(name, (kind, help_text, factory, {}))
+        children = family[3]
+
+        key = tuple(sorted(labels.items()))
+        metric = children.get(key)
+        if metric is None:
+            metric = children.setdefault(key, factory())
+        return metric
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+        return self._child("histogram", name, help_text, lambda: Histogram(buckets), labels)
+
+    def counter(self, name, help_text="", **labels):
+        return self._child("counter", name, help_text, Counter, labels)
+
+    def gauge(self, name, help_text="", **labels):
+        return self._child("gauge", name, help_text, Gauge, labels)
+
+    def render(self):
+        """ Return every metric in the Prometheus text format. """
+        lines = []
+
+        for name, (kind, help_text, _, children) in sorted(self.families.items()):
+            full_name = f"{self.prefix}_{name}"
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+
+            for key, metric in sorted(children.items()):
+                if kind == "histogram":
+                    for bound, total in metric.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{full_name}_bucket{format_labels(key + (('le', le),))} {total}")
+                    lines.append(f"{full_name}_sum{format_labels(key)} {metric.sum}")
+                    lines.append(f"{full_name}_count{format_labels(key)} {metric.count()}")
+                else:
+                    lines.append(f"{full_name}{format_labels(key)} {metric.value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class PhaseTracker:
+    def __init__(self, registry, name="phase_latency_seconds", max_finished=10000):
+        """
+        Records, per request digest, the time from request arrival to each later
+        PBFT phase (pre-prepare, prepared, committed, reply).
+
+        :param registry: MetricsRegistry the per-phase histograms live in.
+        :param max_finished: How many replied digests to remember so late duplicates are ignored.
+        """
+        self.registry = registry
+        self.name = name
+        self.started = {}  # digest -> arrival time (time.time(), comparable across local replicas)
+        self.reached = {}  # digest -> phases already observed
+        self.finished = OrderedDict()
+        self.max_finished = max_finished
+
+    def start(self, digest, timestamp=None):
+        if digest in self.finished:
+            return
+        self.started.setdefault(digest, timestamp if timestamp is not None else time.time())
+
+    def mark(self, digest, phase):
+        """ Observe the latency to ``phase`` once per digest. Returns False if already marked. """
+        started = self.started.get(digest)
+        if started is None:
+            return False
+
+        phases = self.reached.setdefault(digest, set())
+        if phase in phases:
+            return False
+        phases.add(phase)
+
+        self.registry.histogram(self.name, "Seconds from client request to each PBFT phase", phase=phase).observe(time.time() - started)
+
+        if phase == "reply":
+            self.started.pop(digest, None)
+            self.reached.pop(digest, None)
+            self.finished[digest] = True
+            if len(self.finished) > self.max_finished:
+                self.finished.popitem(last=False)
+        return True
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{label}="{value}"' for label, value in key) + "}"
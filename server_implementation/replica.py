@@ -0,0 +1,528 @@
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+
+from authenticator import HMACAuthenticator, NullAuthenticator
+from certificate_index import CertificateIndex, DUPLICATE, EQUIVOCATION
+from metrics import MetricsRegistry, PhaseTracker, SIZE_BUCKETS
+from reply_cache import ReplyCache, NEW, CACHED, IN_PROGRESS, STALE
+from transport import LoopbackTransport, PeerBusyError
+from write_ahead_log import WriteAheadLog
+
+PROTOCOL_ROUTES = ("/preprepare", "/prepare", "/commit")  # Replica-to-replica messages that carry an authenticator
+READ_ONLY_OPERATIONS = ("status",)  # Operations answered from committed state without ordering
+BODYLESS_ROUTES = ("/select-node", "/change-view")  # Routes whose handlers ignore the message body
+
+
+def is_read_only(operation):
+    return isinstance(operation, dict) and operation.get("operation") in READ_ONLY_OPERATIONS
+
+
+def has_valid_body(route, message):
+    """ Whether ``message`` can be handed to the route's handler: every route but BODYLESS_ROUTES reads a JSON object. """
+    return route in BODYLESS_ROUTES or isinstance(message, dict)
+
+
+class Replica:
+    def __init__(self, node_url, all_nodes, transport, wal=None, rng=None, default_client_url="http://localhost:5004", reply_cache=None, authenticator=None):
+        """
+        One PBFT replica, independent of how messages reach it.
+
+        Every handler takes the decoded message and returns a ``(body, status)``
+        pair, so the same object can sit behind Flask or a loopback transport.
+
+        :param node_url: This replica's url, as the other nodes address it.
+        :param all_nodes: Urls of every replica; the primary is all_nodes[view_no % n].
+        :param transport: Object with ``send(node, route, body)`` used for all outbound messages.
+        :param wal: Optional WriteAheadLog that state changes are appended to before taking effect.
+        :param rng: Random source used to pick the Byzantine node (seed it for deterministic runs).
+        :param default_client_url: Where replies go when a request does not name its client.
+        :param reply_cache: ReplyCache answering retransmitted requests (a default-sized one if None).
+        :param authenticator: HMACAuthenticator signing and checking protocol messages (none if None).
+        """
+        self.node_url = node_url
+        self.all_nodes = all_nodes
+        self.max_faulty_nodes = (len(all_nodes) - 1) // 3
+        self.transport = transport
+        self.wal = wal
+        self.rng = rng or random.Random()
+        self.default_client_url = default_client_url
+
+        self.view_no = 0  # Initial Primary Node
+
+        self.byzantine_nodes = set()  # Stores node in set if it is detected as a faulty node
+        self.byzantine_node = None  # Randomly select byzantine node
+
+        self.primary_timeout = 5  # The max timeout for primary node to be detected as a failure node
+
+        self.sequence_no = 0  # Last sequence number this replica assigned as primary
+        self.preprepares = {}  # (view, seq) -> digest of the accepted PRE-PREPARE
+        self.prepares = CertificateIndex(2 * self.max_faulty_nodes)  # PREPARE votes per (view, seq); 2f complete a certificate
+        self.held_prepares = {}  # (view, seq) -> PREPAREs that arrived before the instance's PRE-PREPARE
+        self.mismatched_prepares = {}  # (view, seq) -> senders whose PREPARE contradicts the accepted PRE-PREPARE
+        self.commits = CertificateIndex(2 * self.max_faulty_nodes + 1)  # COMMIT votes per (view, seq), own vote included
+        self.committed_instances = set()  # (view, seq) instances committed locally: prepared here and 2f+1 matching COMMITs
+        self.committed_requests = OrderedDict()  # request_id -> digest, the committed state read-only requests see
+        self.max_committed = 10000
+
+        self.reply_cache = reply_cache or ReplyCache()  # Last replies per client, so retries skip consensus
+        self.authenticator = authenticator or NullAuthenticator()
+
+        self.metrics = MetricsRegistry()
+        self.phases = PhaseTracker(self.metrics)  # Request -> pre-prepare -> prepared -> committed -> reply
+
+        self.routes = {
+            "/select-node": lambda message: self.select_byzantine_node(),
+            "/change-view": lambda message: self.change_view(),
+            "/request": self.handle_request,
+            "/preprepare": self.handle_preprepare,
+            "/prepare": self.handle_prepare,
+            "/commit": self.handle_commit,
+        }
+
+    def get_primary(self):
+        '''Returns primary node'''
+        return self.all_nodes[self.view_no % len(self.all_nodes)]
+
+    def get_replicas(self):
+        '''Returns all replica nodes'''
+        replicas = []
+
+        for node in self.all_nodes:
+            if node != self.node_url:
+                replicas.append(node)
+
+        return replicas
+
+    def dispatch(self, route, message, size=None):
+        """
+        Route an inbound message to its handler.
+
+        :param size: Encoded size in bytes, if the caller already knows it.
+        """
+        handler = self.routes.get(route)
+        if handler is None:
+            return {"error": f"Unknown route {route}"}, 404
+
+        if not has_valid_body(route, message):  # e.g. an empty or non-JSON body, which Flask decodes to None
+            return {"error": f"{route} expects a JSON object body"}, 400
+
+        message_type = route.strip("/")
+        if size is None:
+            size = len(json.dumps(message)) if message is not None else 0
+        self.metrics.counter("messages_received_total", "Inbound messages by route", route=message_type).inc()
+        self.metrics.histogram("message_bytes", "Inbound message size in bytes", buckets=SIZE_BUCKETS, route=message_type).observe(size)
+
+        if route in PROTOCOL_ROUTES and not self.authenticator.verify(self.node_url, message, message.get("sender")):
+            self.metrics.counter("auth_failures_total", "Messages rejected for a missing or bad authenticator", route=message_type).inc()
+            return {"error": "Invalid authenticator"}, 401
+
+        in_flight = self.metrics.gauge("handlers_in_flight", "Requests currently being handled")
+        in_flight.inc()
+        try:
+            return handler(message)
+        finally:
+            in_flight.dec()
+
+    # --- Durability ---------------------------------------------------------
+
+    def log_record(self, record):
+        """Durably append a state change before it takes effect."""
+        if self.wal is not None:
+            self.wal.append(record)
+
+    def apply_prepare(self, view, seq, sender, digest):
+        """Record a sender's PREPARE vote for instance (view, seq)."""
+        return self.prepares.add(view, seq, sender, digest)
+
+    def recover(self, wal_path):
+        """
+        Rebuild the in-memory replica state by replaying the write-ahead log.
+
+        COMMIT records go through the same path as live COMMITs, so committed
+        instances, committed_requests and the reply cache come back; no reply
+        is sent again.
+        """
+        replayed = 0
+
+        for record in WriteAheadLog.replay(wal_path):
+            if record["type"] == "PREPARE":
+                self.apply_prepare(record.get("view", 0), record.get("seq"), record["sender"], record["digest"])
+            elif record["type"] == "PRE-PREPARE" and record.get("seq") is not None:
+                self.preprepares[(record.get("view", 0), record["seq"])] = record["digest"]
+                self.sequence_no = max(self.sequence_no, record["seq"])
+            elif record["type"] == "COMMIT":
+                self.handle_commit(record, replaying=True)
+            elif record["type"] == "BYZANTINE":
+                self.byzantine_nodes.add(record["node"])
+            elif record["type"] == "VIEW-CHANGE":
+                self.view_no = record["view_no"]
+            replayed += 1
+
+        if replayed:
+            print(f"Recovered {replayed} log records: view {self.view_no}, {len(self.prepares)} prepare instances, {len(self.committed_instances)} committed, {len(self.byzantine_nodes)} byzantine nodes.")
+
+    def flag_byzantine(self, node):
+        self.log_record({"type": "BYZANTINE", "node": node})
+        self.byzantine_nodes.add(node)
+
+    # --- Outbound -----------------------------------------------------------
+
+    def send(self, node, route, message):
+        """Send a protocol message to another node, counting it by type."""
+        if route in PROTOCOL_ROUTES and node not in message.get("auth", ()):
+            self.authenticator.sign(self.node_url, message, [node])
+        body = json.dumps(message)
+        message_type = message.get("type", "UNKNOWN")
+        self.metrics.counter("messages_sent_total", "Outbound protocol messages", type=message_type).inc()
+        self.metrics.counter("bytes_sent_total", "Outbound protocol message bytes", type=message_type).inc(len(body))
+        return self.transport.send(node, route, body)
+
+    def broadcast(self, nodes, route, message):
+        """Send a message to every node in turn and record how long the fan-out took."""
+        start = time.perf_counter()
+        if route in PROTOCOL_ROUTES:
+            self.authenticator.sign(self.node_url, message, nodes)  # One digest for the whole fan-out
+        for node in nodes:
+            try:
+                self.send(node, route, message)
+            except PeerBusyError as exc:  # One backed-up peer must not cost the others their copy
+                self.metrics.counter("send_failures_total", "Protocol messages a busy peer never accepted", type=message.get("type", "UNKNOWN")).inc()
+                print(f"⚠️ {exc}")
+        self.metrics.histogram("broadcast_seconds", "Duration of a sequential broadcast to all peers", type=message.get("type", "UNKNOWN")).observe(time.perf_counter() - start)
+
+    def reply(self, client_url, message):
+        """
+        Send a REPLY to a client. The replica's state has already changed, so an unreachable
+        client must not fail the handler: it retransmits and is answered from the reply cache.
+        """
+        try:
+            self.send(client_url, "/reply", message)
+        except OSError as exc:  # Connection errors of either transport, PeerBusyError included
+            self.metrics.counter("reply_failures_total", "Replies a client never accepted").inc()
+            print(f"⚠️ Reply to {client_url} failed: {exc}")
+
+    # --- Handlers -----------------------------------------------------------
+
+    def select_byzantine_node(self):
+        """Primary node randomly selects a Byzantine node from the replicas."""
+        replicas = self.get_replicas()
+
+        if self.node_url != self.get_primary():
+            return {"status": "REJECTED! Only the primary node can select byzantine node."}, 403
+
+        if replicas:
+            self.byzantine_node = self.rng.choice(replicas)
+            print(f"⚠️ Byzantine node selected: {self.byzantine_node}")
+
+        return {"status": "OK"}, 203
+
+    def change_view(self):
+        self.log_record({"type": "VIEW-CHANGE", "view_no": self.view_no + 1})
+        self.view_no += 1
+
+        print(f"View change initiated! New primary: {self.get_primary()}")
+
+        return {"status": "NEW_PRIMARY", "primary": self.get_primary()}, 200
+
+    def execute_read(self, operation):
+        """Answer a read-only operation from committed state."""
+        digest = self.committed_requests.get(operation.get("request_id"))
+        return {"status": "COMMITTED", "digest": digest} if digest is not None else {"status": "UNKNOWN"}
+
+    def handle_read(self, data):
+        """Any replica answers a read-only request at once; the client needs 2f+1 matching answers."""
+        if not is_read_only(data.get("operation")):
+            return {"error": "Operation is not read-only"}, 400
+        self.metrics.counter("read_only_requests_total", "Read-only requests answered without ordering").inc()
+        return {
+            "type": "REPLY",
+            "read_only": True,
+            "request_id": data.get("request_id"),
+            "timestamp": data.get("timestamp"),
+            "result": self.execute_read(data["operation"]),
+            "replica": self.node_url,
+            "view": self.view_no,
+        }, 200
+
+    def handle_request(self, data):
+        if data.get("read_only"):
+            return self.handle_read(data)
+
+        # A retransmitted request is answered from the reply cache by whichever replica receives it
+        client_url = data.get("client_url")
+        timestamp = data.get("timestamp")
+        if client_url is not None and timestamp is not None:
+            status, cached = self.reply_cache.check(client_url, timestamp)
+            if status != NEW:
+                self.metrics.counter("duplicate_requests_total", "Retransmitted requests answered without consensus", outcome=status).inc()
+            if status == CACHED:
+                self.reply(client_url, cached)
+                return {"status": "CACHED", "digest": cached["digest"]}, 200
+            if status == IN_PROGRESS:
+                return {"status": "IN_PROGRESS", "digest": cached}, 202
+            if status == STALE:
+                return {"status": "STALE"}, 409
+
+        primary = self.get_primary()
+        if self.node_url != primary:
+            return {"error": "Only the primary node can accept client requests"}, 403
+
+        # If the current primary is a known Byzantine node, trigger view change
+        if primary in self.byzantine_nodes:
+            print(f"⚠️ Primary node {primary} is Byzantine! Triggering view change...")
+            self.change_view()  # Trigger view change
+
+            return {"error": "Primary node is Byzantine. View change initiated."}, 503
+
+        request_ts = time.time()
+        digest = hashlib.sha256(json.dumps(data).encode()).hexdigest()
+        self.phases.start(digest, request_ts)
+        if client_url is not None and timestamp is not None:
+            self.reply_cache.begin(client_url, timestamp, digest)
+        self.sequence_no += 1
+        message = {
+            "type": "PRE-PREPARE",
+            "digest": digest,
+            "sender": self.node_url,
+            "view": self.view_no,
+            "seq": self.sequence_no,
+            "request_id": data.get("request_id"),
+            "client_url": client_url,
+            "timestamp": timestamp,
+            "request_ts": request_ts,
+        }
+        if is_read_only(data.get("operation")):
+            message["query"] = data["operation"]  # A read that fell back to ordering is executed at commit
+
+        self.log_record(message)
+        self.preprepares[(self.view_no, self.sequence_no)] = digest
+
+        # Broadcast pre-prepare to other nodes
+        self.broadcast(self.get_replicas(), "/preprepare", message)
+        self.phases.mark(digest, "preprepare")
+
+        return {"status": "OK", "digest": digest}, 200
+
+    def handle_preprepare(self, data):
+        sender = data.get("sender")
+        view, seq = data.get("view", self.view_no), data.get("seq")
+
+        # If the sender is already known to be Byzantine, reject immediately
+        if sender in self.byzantine_nodes:
+            return {"status": "REJECTED", "reason": "Sender is a known Byzantine node"}, 400
+
+        # A primary that assigns one sequence number to two requests is equivocating
+        accepted = self.preprepares.get((view, seq))
+        if accepted is not None:
+            if accepted == data["digest"]:
+                return {"status": "OK"}, 200
+            print(f"⚠️ Byzantine node detected! Primary {sender} proposed two requests for view {view}, seq {seq}.")
+            self.flag_byzantine(sender)
+            return {"status": "REJECTED", "reason": "Conflicting PRE-PREPARE for this sequence number"}, 400
+        self.preprepares[(view, seq)] = data["digest"]
+
+        # If this node is the selected Byzantine node, send a bad digest
+        if self.node_url == self.byzantine_node:
+            bad_digest = hashlib.sha256(b"ByzantineAttack").hexdigest()
+            message = {"type": "PREPARE", "digest": bad_digest, "sender": self.node_url}
+            print(f"⚠️ Malicious Node {self.node_url} sending faulty digest!")
+        else:
+            message = {"type": "PREPARE", "digest": data["digest"], "sender": self.node_url}
+        message["view"] = view
+        message["seq"] = seq
+
+        # Carry the client's identity through so the final REPLY can be matched to its request
+        message["request_id"] = data.get("request_id")
+        message["client_url"] = data.get("client_url")
+        message["timestamp"] = data.get("timestamp")
+        message["request_ts"] = data.get("request_ts")
+        if "query" in data:
+            message["query"] = data["query"]
+
+        self.phases.start(data["digest"], data.get("request_ts"))
+        self.phases.mark(data["digest"], "preprepare")
+
+        self.log_record({"type": "PRE-PREPARE", "digest": data["digest"], "sender": sender, "view": view, "seq": seq})
+
+        # Broadcast prepare to other nodes, then count it as this replica's own vote and those that arrived early
+        self.broadcast(self.get_replicas(), "/prepare", message)
+        self.record_prepare(dict(message))
+        for held in self.held_prepares.pop((view, seq), ()):
+            self.handle_prepare(held)
+
+        return {"status": "OK"}, 200
+
+    def handle_prepare(self, data):
+        sender = data["sender"]
+
+        # If the sender is a known Byzantine node, reject immediately
+        if sender in self.byzantine_nodes:
+            return {"status": "REJECTED", "reason": "Sender is a known Byzantine node"}, 400
+
+        return self.record_prepare(data)
+
+    def record_prepare(self, data):
+        """
+        Count one PREPARE vote in its (view, seq) instance.
+
+        Only votes for the digest of the PRE-PREPARE accepted for the instance
+        count; a vote that arrives before that PRE-PREPARE is held until it
+        does. The replica prepares, and broadcasts its COMMIT, when 2f votes
+        agree. Only then are replicas that voted for another digest in the
+        same instance flagged, including those whose vote arrived later.
+        """
+        sender = data["sender"]
+        digest = data["digest"]
+        view, seq = data.get("view", self.view_no), data.get("seq")
+
+        accepted = self.preprepares.get((view, seq))
+        if accepted is None:
+            self.held_prepares.setdefault((view, seq), []).append(data)
+            return {"status": "HELD", "reason": "No PRE-PREPARE accepted for this sequence number yet"}, 202
+
+        was_prepared = self.prepares.certified(view, seq)
+        if digest != accepted:
+            if was_prepared is not None:
+                print(f"⚠️ Byzantine node detected! {sender} sent an uncommon digest.")
+                self.flag_byzantine(sender)
+            else:
+                self.mismatched_prepares.setdefault((view, seq), set()).add(sender)
+            return {"status": "REJECTED", "reason": "PREPARE does not match the accepted PRE-PREPARE"}, 400
+
+        outcome = self.apply_prepare(view, seq, sender, digest)
+        if outcome == EQUIVOCATION:  # The same sender voted for two digests in one instance
+            print(f"⚠️ Byzantine node detected! {sender} sent conflicting messages.")
+            self.flag_byzantine(sender)
+            return {"status": "REJECTED", "reason": "Conflicting messages detected"}, 400
+        if outcome == DUPLICATE:
+            return {"status": "OK"}, 200
+        self.log_record({"type": "PREPARE", "sender": sender, "digest": digest, "view": view, "seq": seq})
+
+        prepared = self.prepares.certified(view, seq)
+        if prepared is None:
+            return {"status": "OK"}, 200  # The certificate is not complete yet
+
+        if was_prepared is not None:
+            return {"status": "OK"}, 200
+
+        dissenters = set(self.prepares.dissenters(view, seq)) | self.mismatched_prepares.pop((view, seq), set())
+        for dissenter in dissenters:
+            if dissenter not in self.byzantine_nodes and dissenter != self.node_url:
+                print(f"⚠️ Byzantine node detected! {dissenter} sent an uncommon digest.")
+                self.flag_byzantine(dissenter)
+        self.phases.mark(prepared, "prepared")
+
+        # 2f matching PREPAREs: broadcast COMMIT once, and count it as this replica's own vote
+        message = {
+            "type": "COMMIT",
+            "digest": prepared,
+            "sender": self.node_url,
+            "view": view,
+            "seq": seq,
+            "request_id": data.get("request_id"),
+            "client_url": data.get("client_url"),
+            "timestamp": data.get("timestamp"),
+            "request_ts": data.get("request_ts"),
+        }
+        if "query" in data:
+            message["query"] = data["query"]
+        self.broadcast(self.get_replicas(), "/commit", message)
+        self.handle_commit(dict(message))
+
+        return {"status": "OK"}, 200
+
+    def committed_certificate(self, view, seq):
+        """ The digest committed in (view, seq): 2f+1 matching COMMITs for the digest this replica prepared, else None. """
+        committed = self.commits.certified(view, seq)
+        if committed is None or committed != self.prepares.certified(view, seq):
+            return None
+        return committed
+
+    def handle_commit(self, data, replaying=False):
+        """
+        Count one COMMIT vote. Votes are kept even before this replica has
+        prepared, but the instance only commits once the local prepared
+        certificate matches 2f+1 COMMITs.
+
+        :param replaying: The vote comes from the write-ahead log: it is not
+                          logged again and the reply is cached but not sent.
+        """
+        sender = data.get("sender")
+        view, seq = data.get("view", self.view_no), data.get("seq")
+
+        outcome = self.commits.add(view, seq, sender, data["digest"])
+        if outcome == EQUIVOCATION:
+            print(f"⚠️ Byzantine node detected! {sender} sent conflicting COMMITs.")
+            self.flag_byzantine(sender)
+            return {"status": "REJECTED", "reason": "Conflicting messages detected"}, 400
+        if outcome == DUPLICATE:
+            return {"status": "OK"}, 200
+        if not replaying:
+            record = {"type": "COMMIT", "digest": data["digest"], "sender": sender, "view": view, "seq": seq}
+            for key in ("request_id", "client_url", "timestamp", "query"):
+                if key in data:
+                    record[key] = data[key]  # Enough of the request to rebuild its reply on recovery
+            self.log_record(record)
+
+        # Reply once per request, when the prepared digest gathers 2f+1 matching COMMITs
+        committed = self.committed_certificate(view, seq)
+        if committed is None or (view, seq) in self.committed_instances:
+            return {"status": "OK"}, 200
+        self.committed_instances.add((view, seq))
+
+        print(f"Committed: {committed}")
+        if data.get("request_id") is not None:
+            self.committed_requests[data["request_id"]] = committed
+            if len(self.committed_requests) > self.max_committed:
+                self.committed_requests.popitem(last=False)
+        if not replaying:
+            self.phases.start(committed, data.get("request_ts"))
+            self.phases.mark(committed, "committed")
+
+        client_url = data.get("client_url") or self.default_client_url
+        reply_message = {
+            "type": "REPLY",
+            "digest": committed,
+            "status": "COMMITTED",
+            "request_id": data.get("request_id"),
+            "timestamp": data.get("timestamp"),
+            "replica": self.node_url,
+            "view": self.view_no,
+        }
+        if "query" in data:
+            reply_message["result"] = self.execute_read(data["query"])
+        if data.get("timestamp") is not None and not self.reply_cache.store(client_url, data["timestamp"], reply_message):
+            return {"status": "COMMITTED", "digest": committed}, 200
+        if replaying:
+            return {"status": "COMMITTED", "digest": committed}, 200
+        self.reply(client_url, reply_message)
+        self.phases.mark(committed, "reply")
+
+        return {"status": "COMMITTED", "digest": committed}, 200
+
+
+def create_loopback_cluster(n=4, seed=None, client_url="loopback://client", authenticate=False):
+    """
+    Build an n-replica cluster wired through one LoopbackTransport.
+
+    :param seed: Seeds every replica's random source so runs are repeatable.
+    :param authenticate: Sign protocol messages with one shared HMACAuthenticator.
+    :return: (transport, replicas). Register a handler for ``client_url`` on the
+             transport to receive replies, deliver a "/request" to
+             ``replicas[0]``'s url and call ``transport.run()``.
+    """
+    transport = LoopbackTransport()
+    urls = [f"loopback://replica-{i}" for i in range(n)]
+    replicas = []
+    authenticator = HMACAuthenticator(b"loopback-cluster") if authenticate else None
+
+    for i, url in enumerate(urls):
+        rng = random.Random(None if seed is None else seed + i)
+        replica = Replica(url, urls, transport, rng=rng, default_client_url=client_url, authenticator=authenticator)
+        transport.register(url, replica.dispatch)
+        replicas.append(replica)
+
+    return transport, replicas
@@ -0,0 +1,78 @@
+from collections import OrderedDict
+
+NEW = "new"
+CACHED = "cached"
+IN_PROGRESS = "in_progress"
+STALE = "stale"
+
+
+class ReplyCache:
+    def __init__(self, max_clients=10000, window=64):
+        """
+        Per-client request timestamps and the replies already sent for them.
+
+        PBFT keeps the last reply per client so a retransmitted request is answered
+        without running consensus again. Clients here may pipeline requests, so the
+        last ``window`` replies per client are kept, and clients are evicted least
+        recently used beyond ``max_clients``.
+
+        :param max_clients: Number of clients to remember.
+        :param window: Replies kept per client; older timestamps are treated as stale.
+        """
+        self.max_clients = max_clients
+        self.window = window
+        self.replies = OrderedDict()  # client -> OrderedDict(timestamp -> reply), oldest first
+        self.in_flight = {}  # client -> {timestamp: digest} ordered but not yet replied to
+        self.hits = 0
+        self.suppressed = 0
+
+    def check(self, client, timestamp):
+        """
+        Classify a request before ordering it.
+
+        :return: (status, reply) where status is NEW, CACHED (reply is the cached one),
+                 IN_PROGRESS (already being ordered) or STALE (older than anything kept).
+        """
+        recent = self.replies.get(client)
+        if recent is not None:
+            self.replies.move_to_end(client)
+            if timestamp in recent:
+                self.hits += 1
+                return CACHED, recent[timestamp]
+            if len(recent) >= self.window and timestamp < min(recent):
+                self.suppressed += 1
+                return STALE, None
+
+        if timestamp in self.in_flight.get(client, ()):
+            self.suppressed += 1
+            return IN_PROGRESS, self.in_flight[client][timestamp]
+        return NEW, None
+
+    def begin(self, client, timestamp, digest):
+        self.in_flight.setdefault(client, {})[timestamp] = digest
+
+    def store(self, client, timestamp, reply):
+        """ Remember the reply for ``timestamp``. Returns False if it was already stored. """
+        recent = self.replies.get(client)
+        if recent is None:
+            recent = self.replies[client] = OrderedDict()
+            if len(self.replies) > self.max_clients:
+                evicted, _ = self.replies.popitem(last=False)
+                self.in_flight.pop(evicted, None)
+        self.replies.move_to_end(client)
+
+        in_flight = self.in_flight.get(client)
+        if in_flight is not None:
+            in_flight.pop(timestamp, None)
+            if not in_flight:
+                del self.in_flight[client]
+
+        if timestamp in recent:
+            return False
+        recent[timestamp] = reply
+        if len(recent) > self.window:
+            recent.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return sum(len(recent) for recent in self.replies.values())
@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from collections import deque
+
+import requests
+
+
+class PeerBusyError(ConnectionError):
+    """The receiver still answered 503 BUSY after every retry."""
+
+
+class HttpTransport:
+    """Delivers protocol messages to other replicas with an HTTP POST."""
+
+    def __init__(self, busy_retries=5, busy_backoff=0.01):
+        """
+        :param busy_retries: How often to resend when the receiver answers 503 because its
+                             consensus queue is full.
+        :param busy_backoff: Initial wait in seconds before resending; doubles on each retry.
+        """
+        self.local = threading.local()  # One keep-alive session per sending thread; Session is not thread-safe
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+
+    @property
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def send(self, node, route, body):
+        """
+        :param node: Base url of the receiving node.
+        :param route: Route on the receiver, e.g. "/prepare".
+        :param body: The message, already serialised to JSON.
+        :raises PeerBusyError: If the receiver is still busy after the last retry.
+        """
+        backoff = self.busy_backoff
+        for attempt in range(self.busy_retries + 1):
+            response = self.session.post(f"{node}{route}", data=body, headers={"Content-Type": "application/json"})
+            if response.status_code != 503 or response.json().get("status") != "BUSY":
+                return response
+            if attempt < self.busy_retries:
+                time.sleep(backoff)
+                backoff *= 2
+
+        raise PeerBusyError(f"{node}{route} still busy after {self.busy_retries} retries")
+
+
+class LoopbackTransport:
+    def __init__(self):
+        """
+        In-memory transport so a whole cluster can run in one process.
+
+        Sends are queued in FIFO order and only delivered by ``run``, so message
+        ordering is deterministic and handlers never recurse into each other.
+        Bodies are decoded on delivery, so receivers never share objects with the
+        sender, just as over a socket.
+        """
+        self.endpoints = {}  # url -> handler(route, message) returning (body, status)
+        self.queue = deque()
+        self.delivered = 0
+
+    def register(self, url, handler):
+        self.endpoints[url] = handler
+
+    def send(self, node, route, body):
+        if node not in self.endpoints:
+            raise ConnectionError(f"No loopback endpoint registered at {node}")
+        self.queue.append((node, route, body))
+
+    def deliver(self, node, route, message):
+        """ Deliver one message immediately, e.g. a client request, and return its response. """
+        return self.endpoints[node](route, message)
+
+    def run(self, max_messages=None):
+        """
+        Deliver queued messages until the queue is empty.
+
+        :param max_messages: Stop after this many deliveries (None for no limit).
+        :return: Number of messages delivered.
+        """
+        delivered = 0
+        while self.queue and (max_messages is None or delivered < max_messages):
+            node, route, body = self.queue.popleft()
+            self.endpoints[node](route, json.loads(body))
+            delivered += 1
+
+        self.delivered += delivered
+        return delivered
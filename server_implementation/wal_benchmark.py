@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from write_ahead_log import WriteAheadLog
+
+
+def run(group_commit, writers, records_per_writer, directory):
+    """Append records from concurrent writers and return appends per second."""
+    path = os.path.join(directory, f"bench_{'group' if group_commit else 'single'}.log")
+    wal = WriteAheadLog(path, group_commit=group_commit)
+    record = {"type": "PREPARE", "sender": "http://localhost:5001", "digest": "0" * 64}
+
+    def writer():
+        for _ in range(records_per_writer):
+            wal.append(record)
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    wal.close()
+
+    total = writers * records_per_writer
+    start = time.perf_counter()
+    replayed = sum(1 for _ in WriteAheadLog.replay(path))
+    replay_elapsed = time.perf_counter() - start
+
+    return {
+        "mode": "group fsync" if group_commit else "fsync per message",
+        "appends_per_s": total / elapsed,
+        "fsyncs": wal.fsync_count,
+        "records_per_fsync": total / max(wal.fsync_count, 1),
+        "replayed": replayed,
+        "replay_records_per_s": replayed / replay_elapsed if replay_elapsed > 0 else float("inf"),
+    }
+
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    records_per_writer = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    with tempfile.TemporaryDirectory() as directory:
+        for group_commit in (False, True):
+            print(run(group_commit, writers, records_per_writer, directory))
+
+
+if __name__ == "__main__":
+    main()
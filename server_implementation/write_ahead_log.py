@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+
+class WriteAheadLog:
+    def __init__(self, path, group_commit=True, max_batch_delay=0.0):
+        """
+        Append-only, fsync'd log of a replica's protocol state changes.
+
+        Each record is one line: an 8 hex digit CRC32 followed by the JSON body,
+        so a record torn by a crash is detected and dropped on replay.
+
+        :param path: File the log is appended to (created if missing).
+        :param group_commit: If True, concurrent appenders share one fsync. The first
+                             appender to find no flush in progress becomes the leader and
+                             makes everything written so far durable for all waiters.
+                             If False, every append pays for its own fsync.
+        :param max_batch_delay: Seconds a group-commit leader waits before flushing so
+                                more appenders can join its batch.
+        """
+        self.path = path
+        self.group_commit = group_commit
+        self.max_batch_delay = max_batch_delay
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "ab")
+
+        self.lock = threading.Lock()
+        self.flushed = threading.Condition(self.lock)
+        self.written = 0  # Records handed to the OS
+        self.durable = 0  # Records known to be on disk
+        self.flushing = False
+        self.fsync_count = 0
+
+    def append(self, record):
+        """
+        Append a record and return once it is durable.
+
+        :param record: A JSON-serialisable dict, conventionally with a "type" key.
+        """
+        body = json.dumps(record, separators=(",", ":")).encode()
+        line = b"%08x %s\n" % (zlib.crc32(body), body)
+
+        with self.lock:
+            self.file.write(line)
+            self.written += 1
+            position = self.written
+
+            if not self.group_commit:
+                self._sync()
+                self.durable = position
+                return
+
+            while self.durable < position:
+                if self.flushing:
+                    self.flushed.wait()
+                    continue
+
+                # Become the group-commit leader for everything written so far
+                self.flushing = True
+                try:
+                    if self.max_batch_delay:
+                        self.lock.release()
+                        try:
+                            time.sleep(self.max_batch_delay)
+                        finally:
+                            self.lock.acquire()
+
+                    self.file.flush()
+                    batch_end = self.written
+
+                    # fsync outside the lock so the next batch can keep writing meanwhile
+                    self.lock.release()
+                    try:
+                        os.fsync(self.file.fileno())
+                    finally:
+                        self.lock.acquire()
+
+                    self.fsync_count += 1
+                    self.durable = max(self.durable, batch_end)
+                finally:
+                    self.flushing = False
+                    self.flushed.notify_all()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.fsync_count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    @staticmethod
+    def replay(path):
+        """
+        Yield the records of a log in append order.
+
+        Replay stops at the first record whose checksum does not match, which is
+        where a crash interrupted the last write.
+        """
+        if not os.path.exists(path):
+            return
+
+        with open(path, "rb") as log_file:
+            for line in log_file:
+                if not line.endswith(b"\n") or len(line) < 10:
+                    return
+                checksum, body = line[:8], line[9:-1]
+                try:
+                    if int(checksum, 16) != zlib.crc32(body):
+                        return
+                except ValueError:
+                    return
+                yield json.loads(body)